@@ -7,3 +7,13 @@ Herramienta que permite sincronizar archivos con datos sensibles, utilizando AWS
 __version__ = "0.0.4"
 __author__ = 'Fabio Antonio González Sosa'
 __credits__ = 'ITTI DIGITAL'
+
+
+def __getattr__(name: str):
+    """
+    Importa la API solo al utilizarse, de manera que no afecte el tiempo de inicio de la herramienta, ver api.
+    """
+    if name in ("SecretsFS", "Descriptor"):
+        from . import api
+        return getattr(api, name)
+    raise AttributeError("module {0!r} has no attribute {1!r}".format(__name__, name))
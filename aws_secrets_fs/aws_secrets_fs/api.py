@@ -0,0 +1,186 @@
+"""
+API para utilizar aws_secrets_fs desde otros programas Python, sin ejecutar la herramienta de línea de comandos.
+
+Ejemplo:
+
+    from aws_secrets_fs import SecretsFS
+
+    fs = SecretsFS(profile="mi-perfil", ttl=300)
+    config = fs.descriptor("config/app.aws_secrets")
+    data = config.read_bytes("app.json")
+    with config.open("cert.pem") as file:
+        ...
+    config.sync()
+"""
+import io
+import threading
+import time
+from . import utils
+from . import codec
+from . import index
+from . import pack
+from . import store
+from . import opt_download
+from . import opt_upload
+
+class SecretsFS:
+    """
+    Acceso a archivos almacenados en AWS Secrets Manager para un perfil y región. Los clientes AWS se comparten entre
+    todas las instancias durante toda la ejecución, ver aws.get_client. Opcionalmente, el contenido leído en memoria
+    se conserva durante `ttl` segundos, de manera que lecturas repetidas no vuelvan a acceder a AWS.
+    Attributes:
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, o lista de regiones. Al leer en memoria se utiliza la primera región disponible.
+        ttl: Tiempo de validez del contenido leído en memoria, en segundos. 0 para no conservarlo.
+        jobs: Cantidad de operaciones simultáneas contra AWS.
+    """
+    profile = "default"
+    region = ""
+    ttl = 0.0
+    jobs = 1
+
+    def __init__(self, profile: str = "default", region: str | list[str] = "", ttl: float = 0.0, jobs: int = 4):
+        """
+        Constructor
+        """
+        self.profile = profile
+        self.region = region
+        self.ttl = ttl
+        self.jobs = max(1, jobs)
+        self._cache = dict()
+        self._cache_lock = threading.Lock()
+
+    def regions(self) -> list[str]:
+        """
+        Retorna las regiones a utilizar.
+        """
+        return store.regions(self.region)
+
+    def descriptor(self, path: str) -> "Descriptor":
+        """
+        Retorna el archivo descriptor indicado.
+        """
+        return Descriptor(path, self)
+
+    def descriptors(self, cwd: str = ".", recursive: bool = False, ignore: list[str] | None = None) -> list["Descriptor"]:
+        """
+        Retorna los archivos descriptores de una carpeta, ver utils.get_descriptor_files.
+        """
+        return [Descriptor(path, self) for path in utils.get_descriptor_files(cwd, recursive, ignore)]
+
+    def read_secret(self, secretname: str) -> bytes:
+        """
+        Retorna el contenido del archivo almacenado bajo un nombre de secreto, verificando el hash de cada parte y del
+        archivo completo. Si se indica `ttl`, el contenido se conserva en memoria.
+        Parameters:
+            secretname: Nombre base del secreto, según el descriptor.
+        """
+        if self.ttl > 0:
+            with self._cache_lock:
+                expires, data = self._cache.get(secretname, (0.0, None))
+            if data != None and time.monotonic() < expires:
+                return data
+
+        _, data, _ = self.fetch_secret(secretname)
+        if self.ttl > 0:
+            with self._cache_lock:
+                self._cache[secretname] = (time.monotonic() + self.ttl, data)
+        return data
+
+    def fetch_secret(self, secretname: str) -> tuple[dict, bytes, str]:
+        """
+        Retorna el índice y el contenido verificado de un archivo, y la región de la que se obtuvo, probando cada región
+        en orden, ver store.fetch_first.
+        """
+        return store.fetch_first(secretname, self.profile, self.regions(), self.jobs)
+
+    def invalidate(self, secretname: str | None = None) -> None:
+        """
+        Descarta el contenido conservado en memoria de un secreto, o de todos si no se indica.
+        """
+        with self._cache_lock:
+            if secretname == None:
+                self._cache.clear()
+            else:
+                self._cache.pop(secretname, None)
+
+    def download(self, descriptors: list["Descriptor"], force: bool = False, cache=None) -> list:
+        """
+        Descarga a disco los archivos de los descriptores indicados, combinando las llamadas de todos ellos, y los
+        registra en el manifiesto de cada descriptor, ver opt_download.download_descriptors.
+        Parameters:
+            descriptors: Archivos descriptores.
+            force: Descargar los archivos aunque el contenido local coincida con el remoto.
+            cache: Caché local cifrada de partes, si hubiere, ver cache.SecretCache.
+        Returns:
+            Estado de descarga de cada archivo, ver opt_download.DownloadTask.
+        """
+        return opt_download.download_descriptors(descriptors, self.profile, self.regions(), self.jobs, force, cache)
+
+    def upload(self, descriptors: list["Descriptor"], force: bool = False, chunk_codec: str = codec.NONE, mode: str = index.MODE_STRING, dry_run: bool = False) -> tuple[list, dict]:
+        """
+        Sube los archivos de los descriptores indicados que cambiaron desde la última sincronización, a todas las
+        regiones, ver opt_upload.upload_descriptors.
+        Parameters:
+            descriptors: Archivos descriptores.
+            force: Subir los archivos y todas sus partes aunque el contenido remoto coincida con el local.
+            chunk_codec: Codec a utilizar para comprimir las partes.
+            mode: Modo de almacenamiento de las partes.
+            dry_run: Solo completar el plan de operaciones, sin modificar secretos.
+        Returns:
+            Estado de subida de cada archivo, ver opt_upload.UploadTask, y plan de operaciones de cada región.
+        """
+        return opt_upload.upload_descriptors(descriptors, self.profile, self.regions(), self.jobs, force, chunk_codec, mode, dry_run)
+
+
+class Descriptor(store.Descriptor):
+    """
+    Archivo descriptor, con acceso en memoria a los archivos que indica, ver store.Descriptor.
+    Attributes:
+        fs: Acceso a AWS Secrets Manager utilizado.
+    """
+    fs = None
+
+    def __init__(self, path: str, fs: SecretsFS | None = None):
+        """
+        Constructor. Lee las entradas del descriptor y su manifiesto.
+        """
+        super().__init__(path)
+        self.fs = fs if fs != None else SecretsFS()
+
+    def read_bytes(self, name: str) -> bytes:
+        """
+        Retorna el contenido remoto de un archivo del descriptor, verificado, sin escribirlo en disco. Los archivos de
+        descriptores con @pack se extraen de su secreto agrupado, o se obtienen de forma individual si no figuran en él.
+        """
+        entry = self.entry(name)
+        if entry.pack != None:
+            payload = self.fs.read_secret(entry.pack)
+            table = pack.parse(payload)
+            if entry.secretname in table:
+                return pack.extract(payload, table[entry.secretname])
+        return self.fs.read_secret(entry.secretname)
+
+    def read_text(self, name: str, encoding: str = "utf-8") -> str:
+        """
+        Retorna el contenido remoto de un archivo del descriptor como texto.
+        """
+        return self.read_bytes(name).decode(encoding)
+
+    def open(self, name: str) -> io.BytesIO:
+        """
+        Retorna el contenido remoto de un archivo del descriptor como un archivo binario en memoria.
+        """
+        return io.BytesIO(self.read_bytes(name))
+
+    def sync(self, force: bool = False, cache=None) -> list:
+        """
+        Descarga a disco los archivos del descriptor, ver SecretsFS.download.
+        """
+        return self.fs.download([self], force, cache)
+
+    def upload(self, force: bool = False, chunk_codec: str = codec.NONE, mode: str = index.MODE_STRING, dry_run: bool = False) -> tuple[list, dict]:
+        """
+        Sube los archivos del descriptor, ver SecretsFS.upload.
+        """
+        return self.fs.upload([self], force, chunk_codec, mode, dry_run)
@@ -1,6 +1,49 @@
-import boto3
+import configparser
+import os
 import shutil
-import subprocess
+import sys
+import threading
+import time
+from . import governor
+from .trace import tracer
+
+
+# Cantidad máxima de conexiones HTTP que mantiene cada cliente en su pool.
+MAX_POOL_CONNECTIONS = 10
+
+# Cantidad máxima de secretos a obtener por cada llamada a batch_get_secret_value.
+BATCH_SIZE = 20
+
+# Códigos de error con los que se considera que batch_get_secret_value no está permitido por IAM.
+BATCH_DENIED_CODES = ("AccessDeniedException", "AccessDenied")
+
+# Clientes de secrets manager compartidos, indexados por (perfil, región). Se cuentan por separado los clientes creados
+# con boto3 y los registrados con set_client.
+_clients = dict()
+_clients_lock = threading.Lock()
+_clients_stats = {
+    "sessions": 0,
+    "clients": 0,
+    "injected": 0
+}
+
+# Códigos de error que indican un límite de uso alcanzado.
+THROTTLING_CODES = ("ThrottlingException", "Throttling", "TooManyRequestsException", "RequestLimitExceeded")
+
+# Códigos de error transitorios, que pueden reintentarse.
+TRANSIENT_CODES = ("InternalServiceError", "InternalFailure", "ServiceUnavailable", "RequestTimeout")
+
+# Cantidad máxima de prefijos de nombre por filtro de list_secrets.
+LIST_FILTER_SIZE = 10
+
+# Cantidad máxima de secretos por página de list_secrets.
+LIST_PAGE_SIZE = 100
+
+# Reguladores de llamadas, uno por cada cliente, indexados por (perfil, región).
+_governors = dict()
+
+# Combinaciones (perfil, región) para las que batch_get_secret_value fue denegado.
+_batch_denied = set()
 
 
 def aws_cli_available() -> bool:
@@ -14,28 +57,49 @@ def aws_cli_available() -> bool:
         return False
 
 
-def aws_cli_version() -> str | None:
+def boto3_version() -> str | None:
     """
-    Obtiene la versión de la herramienta CLI de AWS
+    Obtiene la versión instalada de boto3, sin importarlo.
     """
-    proc = subprocess.check_output(['aws', '--version'])
-    if proc == None or proc == '':
+    try:
+        from importlib import metadata
+        return metadata.version("boto3")
+    except Exception:
         return None
-    return proc.decode("utf-8").strip().split(" ")[0].split("/")[1]
 
 
-def aws_cli_profiles() -> list[str] | None:
+def aws_config_files() -> tuple[str, str]:
+    """
+    Retorna los paths de los archivos de configuración y credenciales de AWS, considerando las variables de entorno
+    AWS_CONFIG_FILE y AWS_SHARED_CREDENTIALS_FILE.
+    """
+    config = os.environ.get("AWS_CONFIG_FILE", "") or os.path.join("~", ".aws", "config")
+    credentials = os.environ.get("AWS_SHARED_CREDENTIALS_FILE", "") or os.path.join("~", ".aws", "credentials")
+    return os.path.expanduser(config), os.path.expanduser(credentials)
+
+
+def aws_profiles() -> list[str] | None:
+    """
+    Obtiene los perfiles configurados en los archivos de configuración y credenciales de AWS, en el mismo orden que
+    "aws configure list-profiles". Retorna None si los archivos existen pero no pueden leerse.
+    """
     profiles = list()
+    config, credentials = aws_config_files()
     try:
-        # NOTE: aws configure list-profiles existe a partir de la versión 2.x.x.
-        proc = subprocess.check_output(['aws', 'configure', 'list-profiles'])
-        if proc != None:
-            lines = proc.decode("utf-8").split('\n')
-            for line in lines:
-                if line != None:
-                    line = line.strip()
-                    if line != "":
-                        profiles.append(line)
+        for path, prefix in ((config, "profile "), (credentials, "")):
+            if os.path.exists(path) is False:
+                continue
+            parser = configparser.RawConfigParser(default_section="\0", interpolation=None, strict=False)
+            parser.read(path, encoding="utf-8")
+            for section in parser.sections():
+                section = section.strip()
+                # En el archivo de configuración los perfiles se indican como "profile nombre", salvo "default".
+                if path == config and section != "default":
+                    if section.startswith(prefix) is False:
+                        continue
+                    section = section[len(prefix):].strip()
+                if section != "" and section not in profiles:
+                    profiles.append(section)
         return profiles
     except Exception:
         return None
@@ -49,68 +113,398 @@ def guard_aws_value(value: str) -> str | None:
     return None if value == "" else value
 
 
-def retrieve_secret(secret_name: str, profile: str, region: str) -> tuple[str, None] | tuple[None, Exception]:
+def configure_clients(max_pool_connections: int) -> None:
+    """
+    Ajusta la configuración utilizada para crear nuevos clientes. Los clientes ya creados no se modifican.
+    Parameters:
+        max_pool_connections: Cantidad máxima de conexiones HTTP por cliente.
+    """
+    global MAX_POOL_CONNECTIONS
+    if max_pool_connections < 1:
+        raise ValueError("La cantidad de conexiones debe ser mayor a cero.")
+    MAX_POOL_CONNECTIONS = max_pool_connections
+
+
+def get_client(profile: str, region: str):
+    """
+    Obtiene el cliente de secrets manager asociado al perfil y región indicados. Se crea una única sesión y un único
+    cliente por cada combinación (perfil, región) durante toda la ejecución. Los clientes de boto3 son thread-safe, por
+    lo que pueden ser compartidos entre hilos. Los reintentos propios de botocore se desactivan, ya que las llamadas
+    se reintentan a través del regulador asociado al cliente, ver get_governor.
+    Parameters:
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+    """
+    key = (guard_aws_value(profile), guard_aws_value(region))
+    with _clients_lock:
+        client = _clients.get(key)
+        if client == None:
+            # boto3 se importa solo al crear el primer cliente, ya que su importación demora el inicio de la herramienta.
+            import boto3
+            from botocore.config import Config
+            session = boto3.Session(profile_name=key[0], region_name=key[1])
+            _clients_stats["sessions"] += 1
+            config = Config(max_pool_connections=MAX_POOL_CONNECTIONS, retries={"total_max_attempts": 1})
+            client = session.client('secretsmanager', config=config)
+            _clients_stats["clients"] += 1
+            _clients[key] = client
+            _governors[key] = governor.Governor(classify_error, MAX_POOL_CONNECTIONS)
+        return client
+
+
+def set_client(profile: str, region: str, client, quotas: dict[str, float] | None = None) -> None:
+    """
+    Registra el cliente a utilizar para el perfil y región indicados, en lugar de crearlo con boto3. Permite utilizar
+    un cliente alternativo con la misma interfaz, por ejemplo para pruebas de rendimiento.
+    Parameters:
+        profile: Perfil aws.
+        region: Región aws, si hubiere.
+        client: Cliente con la interfaz del cliente de secrets manager de boto3.
+        quotas: Cuotas de llamadas por segundo del regulador asociado, ver governor.QUOTAS.
+    """
+    key = (guard_aws_value(profile), guard_aws_value(region))
+    with _clients_lock:
+        _clients[key] = client
+        _clients_stats["injected"] += 1
+        _governors[key] = governor.Governor(classify_error, MAX_POOL_CONNECTIONS, quotas)
+
+
+def get_governor(profile: str, region: str) -> governor.Governor:
+    """
+    Obtiene el regulador de llamadas asociado al cliente del perfil y región indicados. Las cuotas de secrets manager
+    se aplican por cuenta y región, por lo que todos los hilos comparten el mismo regulador.
+    """
+    get_client(profile, region)
+    with _clients_lock:
+        return _governors[(guard_aws_value(profile), guard_aws_value(region))]
+
+
+def call(profile: str, region: str, action: str, secret: str | list[str], fn, sent: int = 0, **kwargs):
+    """
+    Realiza una llamada al API a través del regulador del cliente y la registra en el trazado de la ejecución, con su
+    latencia, tiempo de espera en el regulador, bytes de valores enviados y recibidos, reintentos y resultado. La
+    latencia es la suma de la duración de cada intento; las esperas por límites de uso y entre reintentos se registran
+    por separado.
+    Parameters:
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+        action: Nombre de la acción del API.
+        secret: Nombre del secreto, o nombres para llamadas por lotes.
+        fn: Método del cliente a invocar.
+        sent: Bytes de valores de secretos enviados.
+    """
+    # Cantidad de intentos y duración acumulada de los intentos.
+    attempts = [0, 0.0]
+
+    def attempt(**args):
+        attempts[0] += 1
+        start = time.perf_counter()
+        try:
+            return fn(**args)
+        finally:
+            attempts[1] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    outcome = "ok"
+    received = 0
+    try:
+        response = get_governor(profile, region).call(action, attempt, **kwargs)
+        received = _response_size(response)
+        return response
+    except Exception as e:
+        outcome = error_code(e) or type(e).__name__
+        raise
+    finally:
+        total = time.perf_counter() - start
+        tracer.record(action, secret, attempts[1], sent + received, max(0, attempts[0] - 1), outcome, max(0.0, total - attempts[1]))
+
+
+def _response_size(response: dict) -> int:
+    """
+    Retorna el tamaño de los valores de secretos incluidos en una respuesta.
+    """
+    values = response.get("SecretValues", [response]) if isinstance(response, dict) else []
+    size = 0
+    for value in values:
+        secret_value = secret_value_of(value)
+        if secret_value != None:
+            size += len(secret_value)
+    return size
+
+
+def _value_size(secret_value: str | bytes) -> int:
+    """
+    Retorna el tamaño de un valor de secreto a enviar.
+    """
+    return len(secret_value) if secret_value != None else 0
+
+
+def classify_error(err: Exception) -> str | None:
+    """
+    Clasifica un error de llamada al API: límite de uso alcanzado, error transitorio o None si no debe reintentarse.
+    """
+    code = error_code(err)
+    if code in THROTTLING_CODES:
+        return governor.THROTTLED
+    if code in TRANSIENT_CODES:
+        return governor.TRANSIENT
+    if "botocore.exceptions" in sys.modules:
+        from botocore.exceptions import ConnectionError as BotoConnectionError, HTTPClientError
+        if isinstance(err, (BotoConnectionError, HTTPClientError)):
+            return governor.TRANSIENT
+    return None
+
+
+def _client_connections(client) -> int:
     """
-    Obtiene el valor de un secreto desde aws secrets manager.
+    Obtiene la cantidad de conexiones HTTP abiertas por un cliente a lo largo de su vida.
+    NOTE: botocore no expone esta información de forma pública, se accede al pool de urllib3 subyacente. Ante cualquier
+    cambio interno se retorna 0.
+    """
+    try:
+        http_session = client._endpoint.http_session
+        managers = [http_session._manager] + list(http_session._proxy_managers.values())
+        count = 0
+        for manager in managers:
+            for pool_key in manager.pools.keys():
+                pool = manager.pools.get(pool_key)
+                if pool != None:
+                    count += pool.num_connections
+        return count
+    except Exception:
+        return 0
+
+
+def client_stats() -> dict[str, int]:
+    """
+    Retorna la cantidad de sesiones, clientes y conexiones HTTP creadas durante la ejecución, y la cantidad de
+    clientes registrados con set_client, que no se incluyen entre los clientes creados.
+    """
+    with _clients_lock:
+        stats = dict(_clients_stats)
+        stats["connections"] = sum(_client_connections(c) for c in _clients.values())
+    return stats
+
+
+def governor_stats() -> dict[str, float]:
+    """
+    Retorna los contadores de todos los reguladores de llamadas: llamadas, límites de uso, reintentos y tiempo de
+    espera total, en segundos.
+    """
+    with _clients_lock:
+        governors = list(_governors.values())
+    stats = {"calls": 0, "throttled": 0, "retries": 0, "wait": 0.0}
+    for item in governors:
+        for counters in item.stats().values():
+            for name in stats.keys():
+                stats[name] += counters[name]
+    return stats
+
+
+def reset_clients() -> None:
+    """
+    Descarta los clientes creados y reinicia los contadores asociados.
+    """
+    with _clients_lock:
+        _clients.clear()
+        _governors.clear()
+        _batch_denied.clear()
+        _clients_stats["sessions"] = 0
+        _clients_stats["clients"] = 0
+        _clients_stats["injected"] = 0
+
+
+def secret_value_args(secret_value: str | bytes) -> dict:
+    """
+    Retorna el argumento a utilizar para registrar un valor de secreto: SecretBinary para bytes o SecretString para
+    texto.
+    """
+    if isinstance(secret_value, (bytes, bytearray, memoryview)):
+        return {"SecretBinary": bytes(secret_value)}
+    return {"SecretString": secret_value}
+
+
+def secret_value_of(response: dict) -> str | bytes | None:
+    """
+    Retorna el valor de un secreto a partir de la respuesta de get_secret_value o batch_get_secret_value. Los
+    secretos binarios se retornan como bytes.
+    """
+    if 'SecretString' in response:
+        return response['SecretString']
+    if 'SecretBinary' in response:
+        return response['SecretBinary']
+    return None
+
+
+def retrieve_secret(secret_name: str, profile: str, region: str) -> tuple[str | bytes, None] | tuple[None, Exception]:
+    """
+    Obtiene el valor de un secreto desde aws secrets manager. Los secretos binarios se retornan como bytes.
     Parameters:
         secret_name: Nombre del secreto a recuperar.
         profile: Perfil aws a utilizar.
         region: Región aws a utilizar, si hubiere.
     """
     try:
-        profile = guard_aws_value(profile)
-        region = guard_aws_value(region)
-        session = boto3.Session(profile_name=profile, region_name=region)
-        client = session.client('secretsmanager')
-        get_secret_value_response = client.get_secret_value(SecretId=secret_name)
-        if 'SecretString' in get_secret_value_response:
-            return get_secret_value_response['SecretString'], None
+        client = get_client(profile, region)
+        get_secret_value_response = call(profile, region, "GetSecretValue", secret_name, client.get_secret_value, SecretId=secret_name)
+        return secret_value_of(get_secret_value_response), None
+    except Exception as e:
+        return None, e
+
+
+def retrieve_secrets(secret_names: list[str], profile: str, region: str) -> dict[str, tuple[str | bytes, None] | tuple[None, Exception]]:
+    """
+    Obtiene el valor de varios secretos desde aws secrets manager, agrupándolos en lotes de hasta BATCH_SIZE secretos
+    por llamada a batch_get_secret_value. Los errores se informan de forma individual por secreto. Si el perfil no
+    tiene permitido el uso de batch_get_secret_value, se obtiene cada secreto de forma individual.
+    Parameters:
+        secret_names: Nombres de los secretos a recuperar.
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+    Returns:
+        Diccionario con una tupla (valor, error) por cada nombre de secreto indicado.
+    """
+    results = dict()
+    key = (guard_aws_value(profile), guard_aws_value(region))
+    for i in range(0, len(secret_names), BATCH_SIZE):
+        batch = secret_names[i: i + BATCH_SIZE]
+        if key not in _batch_denied:
+            try:
+                results.update(_batch_get_secret_value(batch, profile, region))
+                continue
+            except Exception as e:
+                if error_code(e) not in BATCH_DENIED_CODES:
+                    for secret_name in batch:
+                        results[secret_name] = (None, e)
+                    continue
+                _batch_denied.add(key)
+
+        # Sin permisos para batch_get_secret_value, se obtiene cada secreto individualmente.
+        for secret_name in batch:
+            results[secret_name] = retrieve_secret(secret_name, profile, region)
+    return results
+
+
+def _batch_get_secret_value(secret_names: list[str], profile: str, region: str) -> dict[str, tuple[str | bytes, None] | tuple[None, Exception]]:
+    """
+    Obtiene el valor de hasta BATCH_SIZE secretos en una única llamada a batch_get_secret_value. Los secretos que no se
+    encuentran en la respuesta se informan con un error ResourceNotFoundException.
+    """
+    client = get_client(profile, region)
+    values = dict()
+    errors = dict()
+    request = {"SecretIdList": secret_names}
+    while True:
+        response = call(profile, region, "BatchGetSecretValue", secret_names, client.batch_get_secret_value, **request)
+        for value in response.get("SecretValues", []):
+            secret_value = secret_value_of(value)
+            values[value.get("Name")] = secret_value
+            values[value.get("ARN")] = secret_value
+        for error in response.get("Errors", []):
+            errors[error.get("SecretId")] = client_error(error.get("ErrorCode"), error.get("Message"), "BatchGetSecretValue")
+        if response.get("NextToken") == None:
+            break
+        request["NextToken"] = response["NextToken"]
+
+    results = dict()
+    for secret_name in secret_names:
+        if secret_name in values:
+            results[secret_name] = (values[secret_name], None)
+        elif secret_name in errors:
+            results[secret_name] = (None, errors[secret_name])
         else:
-            # No textual o no existe.
-            # TODO: DAR SOPORTE A ESTE CASO.
-            return None, None
+            results[secret_name] = (None, client_error("ResourceNotFoundException", "Secrets Manager can't find the specified secret.", "BatchGetSecretValue"))
+    return results
+
+
+def list_secrets(prefixes: list[str], token: str | None, profile: str, region: str) -> tuple[dict, None] | tuple[None, Exception]:
+    """
+    Obtiene una página de metadatos de los secretos cuyo nombre comienza con alguno de los prefijos indicados, sin
+    obtener sus valores. El filtro de aws no distingue mayúsculas de minúsculas.
+    Parameters:
+        prefixes: Prefijos de nombre, hasta LIST_FILTER_SIZE.
+        token: Token de la página a obtener, o None para la primera página.
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+    """
+    try:
+        client = get_client(profile, region)
+        args = {
+            "Filters": [{"Key": "name", "Values": prefixes}],
+            "MaxResults": LIST_PAGE_SIZE
+        }
+        if token != None:
+            args["NextToken"] = token
+        response = call(profile, region, "ListSecrets", prefixes, client.list_secrets, **args)
+        return response, None
     except Exception as e:
         return None, e
 
 
-def update_secret(secret_name: str, secret_value: str, profile: str, region: str) -> tuple[any, None] | tuple[None, Exception]:
+def error_code(err: Exception | None) -> str | None:
+    """
+    Retorna el código de error de aws de una excepción, si hubiere.
+    """
+    # Si botocore no fue importado, el error no puede ser un error de aws. Se evita importarlo sin necesidad.
+    if err == None or "botocore.exceptions" not in sys.modules:
+        return None
+    from botocore.exceptions import ClientError
+    if isinstance(err, ClientError):
+        return err.response.get("Error", {}).get("Code")
+    return None
+
+
+def client_error(code: str, message: str, operation: str) -> Exception:
+    """
+    Genera un error de aws con el código y mensaje indicados, como los que genera boto3.
+    """
+    from botocore.exceptions import ClientError
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+def not_found(err: Exception | None) -> bool:
+    """
+    Verifica si un error indica que el secreto no existe.
+    """
+    return error_code(err) == "ResourceNotFoundException"
+
+
+def update_secret(secret_name: str, secret_value: str | bytes, profile: str, region: str) -> tuple[any, None] | tuple[None, Exception]:
     """
     Actualiza el valor de un secreto en aws secrets manager.
     Parameters:
         secret_name: Nombre del secreto a actualizar.
-        secret_value: Nuevo valor para secreto.
+        secret_value: Nuevo valor para secreto. Los valores binarios se registran como SecretBinary.
         profile: Perfil aws a utilizar.
         region: Región aws a utilizar, si hubiere.
     """
     try:
-        profile = guard_aws_value(profile)
-        region = guard_aws_value(region)
-        session = boto3.Session(profile_name=profile, region_name=region)
-        client = session.client('secretsmanager')
-        response = client.update_secret(
-            SecretId=secret_name, SecretString=secret_value)
+        client = get_client(profile, region)
+        response = call(
+            profile, region, "UpdateSecret", secret_name, client.update_secret,
+            sent=_value_size(secret_value),
+            SecretId=secret_name, **secret_value_args(secret_value))
         return response, None
     except Exception as e:
         return None, e
 
 
-def create_secret(secret_name: str, secret_value: str, profile: str, region: str) -> tuple[any, None] | tuple[None, Exception]:
+def create_secret(secret_name: str, secret_value: str | bytes, profile: str, region: str) -> tuple[any, None] | tuple[None, Exception]:
     """
     Registra el valor para un nuevo secreto en aws secrets manager.
     Parameters:
         secret_name: Nombre del secreto a crear.
-        secret_value: Valor para secreto.
+        secret_value: Valor para secreto. Los valores binarios se registran como SecretBinary.
         profile: Perfil aws a utilizar.
         region: Región aws a utilizar, si hubiere.
     """
     try:
-        profile = guard_aws_value(profile)
-        region = guard_aws_value(region)
-        session = boto3.Session(profile_name=profile, region_name=region)
-        client = session.client('secretsmanager')
-        response = client.create_secret(
+        client = get_client(profile, region)
+        response = call(
+            profile, region, "CreateSecret", secret_name, client.create_secret,
+            sent=_value_size(secret_value),
             Name=secret_name,
-            SecretString=secret_value
+            **secret_value_args(secret_value)
         )
         return response, None
     except Exception as e:
@@ -126,11 +520,9 @@ def delete_secret(secret_name: str, profile: str, region: str) -> tuple[any, Non
         region: Región aws a utilizar, si hubiere.
     """
     try:
-        profile = guard_aws_value(profile)
-        region = guard_aws_value(region)
-        session = boto3.Session(profile_name=profile, region_name=region)
-        client = session.client('secretsmanager')
-        response = client.delete_secret(
+        client = get_client(profile, region)
+        response = call(
+            profile, region, "DeleteSecret", secret_name, client.delete_secret,
             SecretId=secret_name,
             ForceDeleteWithoutRecovery=True
         )
@@ -0,0 +1,168 @@
+import base64
+import hashlib
+import importlib.util
+import os
+import threading
+from . import utils
+
+
+# Tamaño máximo por defecto de la caché, en bytes.
+DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+
+# Variable de entorno con la clave de cifrado (32 bytes en base64). Si no se indica, se genera una clave aleatoria
+# que se guarda junto a la caché, legible solo por el usuario actual.
+KEY_ENV = "AWS_SECRETS_FS_CACHE_KEY"
+
+# Tamaño del nonce para AES-GCM.
+NONCE_SIZE = 12
+
+
+def available() -> bool:
+    """
+    Verifica si la caché puede ser utilizada localmente. El cifrado de la caché requiere cryptography
+    (pip install aws_secrets_fs[cache]), que se importa solo al crear la caché.
+    """
+    return importlib.util.find_spec("cryptography") != None
+
+
+class SecretCache:
+    """
+    Caché local de partes decodificadas, cifradas con AES-GCM e indexadas por nombre de secreto y VersionId. Una
+    versión de un secreto no cambia de contenido, por lo que una entrada es válida mientras el índice remoto haga
+    referencia a la misma versión. Al superar el tamaño máximo se descartan las entradas usadas hace más tiempo.
+    Attributes:
+        folder: Carpeta de la caché.
+        max_size: Tamaño máximo de la caché, en bytes.
+        size: Tamaño actual de la caché, en bytes.
+        hits: Cantidad de partes obtenidas de la caché.
+        misses: Cantidad de partes no encontradas en la caché.
+        evictions: Cantidad de entradas descartadas por tamaño.
+    """
+    folder = ""
+    max_size = DEFAULT_MAX_SIZE
+    size = 0
+    hits = 0
+    misses = 0
+    evictions = 0
+
+    def __init__(self, folder: str | None = None, max_size: int = DEFAULT_MAX_SIZE):
+        """
+        Constructor. Crea la carpeta de la caché y su clave de cifrado, si no existen.
+        """
+        if available() is False:
+            raise RuntimeError("La caché requiere cryptography (pip install aws_secrets_fs[cache]).")
+        self.folder = folder if folder != None else os.path.join(utils.cache_dir(), "secrets")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.folder, mode=0o700, exist_ok=True)
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        self._aead = AESGCM(self._load_key())
+        self.size = sum(entry.stat().st_size for entry in os.scandir(self.folder) if entry.name.endswith(".bin"))
+
+    def _load_key(self) -> bytes:
+        """
+        Obtiene la clave de cifrado desde la variable de entorno KEY_ENV o desde el archivo de clave de la caché.
+        """
+        value = os.environ.get(KEY_ENV, "")
+        if value != "":
+            key = base64.b64decode(value)
+            if len(key) != 32:
+                raise ValueError("La clave de caché debe tener 32 bytes ({0}).".format(KEY_ENV))
+            return key
+
+        keyfile = os.path.join(self.folder, "key")
+        if os.path.exists(keyfile) is False:
+            fd = os.open(keyfile, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as file:
+                file.write(os.urandom(32))
+        with open(keyfile, "rb") as file:
+            return file.read()
+
+    def _entry(self, secret_name: str, version: str) -> tuple[str, bytes]:
+        """
+        Retorna el path de la entrada para un secreto y versión, y los datos asociados utilizados al cifrar.
+        """
+        aad = (secret_name + "\0" + version).encode("utf-8")
+        return os.path.join(self.folder, hashlib.sha256(aad).hexdigest() + ".bin"), aad
+
+    def get(self, secret_name: str, version: str | None) -> bytes | None:
+        """
+        Obtiene el contenido de una parte desde la caché, si existe para la versión indicada.
+        Parameters:
+            secret_name: Nombre del secreto.
+            version: VersionId del secreto referenciado por el índice.
+        """
+        if version == None:
+            return None
+        path, aad = self._entry(secret_name, version)
+        try:
+            with open(path, "rb") as file:
+                blob = file.read()
+            data = self._aead.decrypt(blob[:NONCE_SIZE], blob[NONCE_SIZE:], aad)
+            # Registrar el uso, para el descarte por antigüedad de uso.
+            os.utime(path)
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def put(self, secret_name: str, version: str | None, data: bytes) -> None:
+        """
+        Registra el contenido de una parte en la caché. Los errores de escritura se ignoran.
+        Parameters:
+            secret_name: Nombre del secreto.
+            version: VersionId del secreto referenciado por el índice.
+            data: Contenido decodificado de la parte.
+        """
+        if version == None:
+            return
+        path, aad = self._entry(secret_name, version)
+        nonce = os.urandom(NONCE_SIZE)
+        blob = nonce + self._aead.encrypt(nonce, bytes(data), aad)
+        try:
+            tmppath = path + ".{0}.tmp".format(threading.get_ident())
+            fd = os.open(tmppath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "wb") as file:
+                file.write(blob)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmppath, path)
+        except Exception:
+            return
+        with self._lock:
+            self.size += len(blob) - previous
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Descarta las entradas usadas hace más tiempo hasta que la caché no supere su tamaño máximo.
+        """
+        with self._lock:
+            entries = list()
+            for entry in os.scandir(self.folder):
+                if entry.name.endswith(".bin"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, entry.path))
+            entries.sort()
+            self.size = sum(size for _, size, _ in entries)
+            for _, size, path in entries:
+                if self.size <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                self.size -= size
+                self.evictions += 1
+
+    def summary(self) -> str:
+        """
+        Retorna la cantidad de aciertos, fallos y descartes de la caché en forma de texto.
+        """
+        return "Caché: {0} aciertos, {1} fallos, {2} descartes.".format(self.hits, self.misses, self.evictions)
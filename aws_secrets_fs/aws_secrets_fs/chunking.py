@@ -0,0 +1,105 @@
+import hashlib
+
+
+# Tamaño mínimo de una parte, en bytes. No se buscan cortes antes de este tamaño.
+MIN_SIZE = 8 * 1024
+
+# Cantidad de bits del hash que deben ser cero para realizar un corte. El tamaño promedio de una parte es de
+# MIN_SIZE + 2^AVG_BITS bytes.
+AVG_BITS = 14
+
+# Tamaño máximo de una parte, en bytes. Coincide con el contenido de 50kb en base64 utilizado en el índice v1.
+MAX_SIZE = 50 * 1024 // 4 * 3
+
+# Parámetros de corte para partes almacenadas como SecretBinary, sin la sobrecarga de base64. El tamaño máximo coincide
+# con el tamaño máximo de un secreto.
+BINARY_MIN_SIZE = 16 * 1024
+BINARY_AVG_BITS = 15
+BINARY_MAX_SIZE = 64 * 1024
+
+# Parámetros de corte para partes comprimidas. Se utilizan partes de mayor tamaño, ya que una vez comprimidas ocupan
+# una fracción de su tamaño original. Las partes que no entran en un secreto luego de comprimidas se subdividen.
+COMPRESSED_MIN_SIZE = 32 * 1024
+COMPRESSED_AVG_BITS = 16
+COMPRESSED_MAX_SIZE = 256 * 1024
+
+# Tamaño de bloque para lectura de archivos.
+READ_SIZE = 256 * 1024
+
+# Tabla "gear" para el hash rodante. Se deriva de forma determinística para que los cortes sean estables entre
+# ejecuciones y versiones de Python.
+_GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:8], "big") for i in range(256)]
+_MASK64 = (1 << 64) - 1
+
+
+def find_boundary(data: bytes | memoryview, min_size: int = MIN_SIZE, avg_bits: int = AVG_BITS, max_size: int = MAX_SIZE) -> int:
+    """
+    Busca el primer corte de parte en los datos indicados utilizando un hash rodante tipo "gear". El corte depende
+    únicamente de los últimos 64 bytes leídos, por lo que una edición local solo modifica las partes cercanas.
+    Parameters:
+        data: Datos a procesar, desde el inicio de la parte.
+        min_size: Tamaño mínimo de la parte.
+        avg_bits: Cantidad de bits del hash que deben ser cero para realizar un corte.
+        max_size: Tamaño máximo de la parte.
+    Returns:
+        Tamaño de la parte encontrada.
+    """
+    size = min(len(data), max_size)
+    if size <= min_size:
+        return size
+
+    # Se utilizan los bits más significativos, que dependen de una ventana de 64 bytes.
+    mask = ((1 << avg_bits) - 1) << (64 - avg_bits)
+    gear = _GEAR
+    h = 0
+    i = min_size
+    for b in data[min_size:size]:
+        h = ((h << 1) + gear[b]) & _MASK64
+        i += 1
+        if not h & mask:
+            return i
+    return size
+
+
+def iter_chunks(file, min_size: int = MIN_SIZE, avg_bits: int = AVG_BITS, max_size: int = MAX_SIZE):
+    """
+    Lee un archivo binario por bloques y retorna, una a una, sus partes delimitadas por contenido. Las partes se
+    retornan como memoryview sobre el bloque leído, sin copiar su contenido, por lo que la memoria utilizada no depende
+    del tamaño del archivo. Si una parte debe conservarse más allá de la iteración, convertirla a bytes.
+    Parameters:
+        file: Archivo abierto en modo binario.
+        min_size: Tamaño mínimo de cada parte.
+        avg_bits: Cantidad de bits del hash que deben ser cero para realizar un corte.
+        max_size: Tamaño máximo de cada parte.
+    """
+    buffer = b""
+    start = 0
+    eof = False
+    while True:
+        # Completar el bloque actual con el siguiente, conservando solo el contenido aún no procesado.
+        if eof is False and len(buffer) - start < max_size:
+            blocks = [buffer[start:]] if start < len(buffer) else []
+            size = len(buffer) - start
+            while eof is False and size < max_size:
+                data = file.read(READ_SIZE)
+                if not data:
+                    eof = True
+                else:
+                    blocks.append(data)
+                    size += len(data)
+            buffer = blocks[0] if len(blocks) == 1 else b"".join(blocks)
+            start = 0
+        if start >= len(buffer):
+            return
+
+        view = memoryview(buffer)[start:]
+        cut = find_boundary(view, min_size, avg_bits, max_size)
+        yield view[:cut]
+        start += cut
+
+
+def hash_chunk(data: bytes | memoryview) -> str:
+    """
+    Obtiene el valor de hash sha256 para una parte.
+    """
+    return hashlib.sha256(data).hexdigest()
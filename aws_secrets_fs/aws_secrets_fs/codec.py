@@ -0,0 +1,73 @@
+import zlib
+
+# zstd es opcional, se utiliza solo si está instalado (pip install aws_secrets_fs[zstd]).
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Codecs soportados para el contenido de las partes.
+NONE = "none"
+ZLIB = "zlib"
+ZSTD = "zstd"
+AUTO = "auto"
+CODECS = [NONE, ZLIB, ZSTD]
+
+# Nivel de compresión para zlib.
+ZLIB_LEVEL = 9
+
+# Nivel de compresión para zstd.
+ZSTD_LEVEL = 10
+
+
+def available(codec: str) -> bool:
+    """
+    Verifica si un codec puede ser utilizado localmente.
+    """
+    if codec == ZSTD:
+        return zstandard != None
+    return codec in CODECS
+
+
+def resolve(codec: str | None) -> str:
+    """
+    Determina el codec a utilizar. "auto" selecciona zstd si está instalado, o zlib en caso contrario.
+    Parameters:
+        codec: Codec indicado, si hubiere.
+    """
+    if codec == None or codec == "":
+        return NONE
+    if codec == AUTO:
+        return ZSTD if available(ZSTD) else ZLIB
+    if available(codec) is False:
+        raise ValueError("Codec no disponible: {0}".format(codec))
+    return codec
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    """
+    Comprime el contenido de una parte con el codec indicado.
+    """
+    if codec == NONE:
+        return data
+    if codec == ZLIB:
+        return zlib.compress(data, ZLIB_LEVEL)
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError("Codec no soportado: {0}".format(codec))
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """
+    Descomprime el contenido de una parte con el codec indicado.
+    """
+    if codec == NONE:
+        return data
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == ZSTD:
+        if zstandard == None:
+            raise ValueError("Se requiere zstandard para descomprimir este archivo (pip install zstandard).")
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError("Codec no soportado: {0}".format(codec))
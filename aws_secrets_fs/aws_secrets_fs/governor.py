@@ -0,0 +1,223 @@
+import random
+import threading
+import time
+
+
+# Cuotas de llamadas por segundo de AWS Secrets Manager para cada acción del API. Las acciones no indicadas utilizan
+# DEFAULT_RATE.
+QUOTAS = {
+    "GetSecretValue": 10000,
+    "DescribeSecret": 10000,
+    "BatchGetSecretValue": 100,
+    "ListSecrets": 100,
+    "CreateSecret": 50,
+    "UpdateSecret": 50,
+    "PutSecretValue": 50,
+    "DeleteSecret": 50
+}
+DEFAULT_RATE = 50
+
+# Cantidad máxima inicial de llamadas simultáneas. Se reduce a la mitad ante cada límite de uso y se recupera de a
+# poco con cada llamada exitosa (AIMD).
+MAX_CONCURRENCY = 10
+
+# Cantidad máxima de intentos por llamada, incluyendo el primero.
+MAX_ATTEMPTS = 8
+
+# Espera base y máxima entre reintentos, en segundos. La espera crece de forma exponencial con cada intento y se
+# elige al azar entre 0 y ese valor ("full jitter").
+BACKOFF_BASE = 0.1
+BACKOFF_MAX = 5.0
+
+# Clasificación de errores: límite de uso alcanzado o error transitorio. Ambos se reintentan.
+THROTTLED = "throttled"
+TRANSIENT = "transient"
+
+
+class TokenBucket:
+    """
+    Limitador de llamadas por segundo. Se acumulan `rate` tokens por segundo, hasta `burst` segundos de llamadas, y
+    cada llamada consume uno. Con un `burst` menor a un segundo las llamadas se distribuyen de forma uniforme.
+    Attributes:
+        quota: Cantidad máxima de llamadas por segundo.
+        rate: Cantidad actual de llamadas por segundo. Se reduce ante límites de uso y se recupera hasta la cuota.
+        burst: Tiempo de llamadas que pueden acumularse, en segundos.
+        tokens: Tokens disponibles.
+        updated: Momento de la última actualización de tokens.
+    """
+    quota = 0.0
+    rate = 0.0
+    burst = 1.0
+    tokens = 0.0
+    updated = 0.0
+
+    def __init__(self, quota: float, burst: float = 1.0):
+        """
+        Constructor
+        """
+        self.quota = float(quota)
+        self.rate = float(quota)
+        self.burst = burst
+        self.tokens = max(1.0, self.rate * burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Consume un token, esperando hasta que haya uno disponible. Retorna el tiempo esperado, en segundos.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate * self.burst), self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def decrease(self) -> None:
+        """
+        Reduce a la mitad la cantidad de llamadas por segundo, hasta un mínimo de una.
+        """
+        with self._lock:
+            self.rate = max(1.0, self.rate / 2)
+            self.tokens = min(self.tokens, max(1.0, self.rate * self.burst))
+
+    def increase(self) -> None:
+        """
+        Recupera de a poco la cantidad de llamadas por segundo, hasta la cuota.
+        """
+        with self._lock:
+            self.rate = min(self.quota, self.rate + 1)
+
+
+class Governor:
+    """
+    Regulador de llamadas al API compartido por todos los hilos. Combina un limitador de llamadas por segundo por cada
+    acción, sin superar las cuotas del servicio, con un límite de llamadas simultáneas ajustado por AIMD y reintentos
+    con espera exponencial aleatoria ante límites de uso o errores transitorios.
+    Attributes:
+        classify: Función que recibe una excepción y retorna THROTTLED, TRANSIENT o None si no debe reintentarse.
+        limit: Cantidad actual de llamadas simultáneas permitidas.
+        max_concurrency: Cantidad máxima de llamadas simultáneas.
+        in_flight: Cantidad de llamadas en curso.
+        buckets: Limitador de llamadas por segundo de cada acción.
+        counters: Contadores de llamadas, límites de uso, reintentos y espera de cada acción.
+    """
+    classify = None
+    limit = 0.0
+    max_concurrency = MAX_CONCURRENCY
+    in_flight = 0
+    buckets = None
+    counters = None
+
+    def __init__(self, classify, max_concurrency: int = MAX_CONCURRENCY, quotas: dict[str, float] | None = None):
+        """
+        Constructor
+        """
+        self.classify = classify
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.buckets = dict()
+        self.counters = dict()
+        self._quotas = quotas if quotas != None else QUOTAS
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+
+    def _bucket(self, action: str) -> TokenBucket:
+        """
+        Obtiene el limitador de llamadas por segundo de una acción, creándolo si no existe.
+        """
+        with self._lock:
+            bucket = self.buckets.get(action)
+            if bucket == None:
+                bucket = TokenBucket(self._quotas.get(action, DEFAULT_RATE))
+                self.buckets[action] = bucket
+                self.counters[action] = {"calls": 0, "throttled": 0, "retries": 0, "wait": 0.0}
+            return bucket
+
+    def _count(self, action: str, name: str, value: float = 1) -> None:
+        """
+        Incrementa un contador de una acción.
+        """
+        with self._lock:
+            self.counters[action][name] += value
+
+    def _enter(self) -> float:
+        """
+        Espera a que haya lugar para una nueva llamada simultánea. Retorna el tiempo esperado, en segundos.
+        """
+        start = time.monotonic()
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+        return time.monotonic() - start
+
+    def _leave(self, succeeded: bool, throttled: bool = False) -> None:
+        """
+        Libera el lugar de una llamada y ajusta el límite de llamadas simultáneas: se reduce a la mitad ante un límite
+        de uso, o se incrementa en 1/limit tras una llamada exitosa. Ante otros errores no se modifica.
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            elif succeeded:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def call(self, action: str, fn, *args, **kwargs):
+        """
+        Realiza una llamada al API respetando los límites de la acción indicada y la reintenta ante límites de uso o
+        errores transitorios. Si se agotan los intentos, o el error no debe reintentarse, se lanza el último error.
+        Parameters:
+            action: Nombre de la acción del API, ver QUOTAS.
+            fn: Función que realiza la llamada.
+        """
+        bucket = self._bucket(action)
+        attempt = 0
+        while True:
+            # El token se obtiene antes del lugar, de manera que la espera del limitador de una acción no ocupe
+            # lugares de llamadas simultáneas de otras acciones.
+            waited = bucket.acquire()
+            waited += self._enter()
+            self._count(action, "calls")
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                kind = self.classify(e)
+                self._leave(False, kind == THROTTLED)
+                if kind == THROTTLED:
+                    self._count(action, "throttled")
+                    bucket.decrease()
+                attempt += 1
+                if kind == None or attempt >= MAX_ATTEMPTS:
+                    self._count(action, "wait", waited)
+                    raise
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                self._count(action, "retries")
+                self._count(action, "wait", waited + delay)
+                time.sleep(delay)
+                continue
+            self._leave(True)
+            bucket.increase()
+            self._count(action, "wait", waited)
+            return result
+
+    def stats(self) -> dict[str, dict]:
+        """
+        Retorna los contadores de cada acción: llamadas, límites de uso, reintentos, tiempo de espera y llamadas por
+        segundo actuales.
+        """
+        with self._lock:
+            stats = dict()
+            for action, counters in self.counters.items():
+                stats[action] = dict(counters)
+                stats[action]["rate"] = self.buckets[action].rate
+            return stats
@@ -0,0 +1,330 @@
+import base64
+import json
+import re
+import uuid
+from . import chunking
+from . import codec
+
+
+# Versión de índice generada al subir archivos.
+# - v1: {"v": 1, "hash": md5, "parts": n}. Partes de tamaño fijo en <secreto>.0 ... <secreto>.n-1.
+# - v2: {"v": 2, "hash": md5, "size": bytes, "codec": c, "mode": m, "chunks": [{"key": k, "hash": sha256, "size": bytes}, ...]}.
+#   Partes delimitadas por contenido en <secreto>.<k>, donde k se deriva del hash de la parte, del codec y del modo
+#   de almacenamiento. El hash y tamaño de cada parte, y del archivo completo, corresponden al contenido original,
+#   sin comprimir. Cada parte puede incluir además el VersionId del secreto registrado al subirla ("version"), que
+#   permite reutilizar partes de la caché local sin descargarlas. Cada subida registra además un identificador de
+#   generación ("generation"). Las partes nunca se sobreescriben con otro contenido y el índice se registra luego de
+#   todas sus partes, por lo que un índice siempre referencia partes completas. Las partes de generaciones anteriores
+#   se conservan hasta ser eliminadas por gc, de manera que quien obtuvo el índice anterior pueda completar la descarga.
+VERSION = 2
+
+# Versión de índice generada cuando el índice v2 de un archivo no entra en un secreto.
+# - v3: igual a v2, reemplazando "chunks" por "tables": [{"key": k, "hash": sha256, "count": n}, ...]. Las partes se
+#   registran, en orden, en tablas {"chunks": [...]} con el formato de v2, almacenadas en <secreto>.<k>, donde
+#   k = "index-" + hash[:32] se deriva del contenido de la tabla. Como las partes, las tablas nunca se sobreescriben
+#   con otro contenido, y se registran antes que el índice.
+TABLES_VERSION = 3
+
+# Modos de almacenamiento de las partes: texto en base64 (SecretString) o binario (SecretBinary). Los índices v1 y
+# los índices v2 sin modo utilizan texto.
+MODE_STRING = "string"
+MODE_BINARY = "binary"
+MODES = [MODE_STRING, MODE_BINARY]
+
+# Prefijo de la clave de una tabla de partes de un índice v3.
+TABLE_PREFIX = "index-"
+
+# Sufijo del nombre de secreto de una parte: número de parte (v1), clave derivada de su hash (v2) o tabla de partes
+# (v3).
+PART_SUFFIX = re.compile(r"^([0-9]+|(bin-)?(({0})-)?[0-9a-f]{{32}}|{1}[0-9a-f]{{32}})$".format("|".join(c for c in codec.CODECS if c != codec.NONE), TABLE_PREFIX))
+
+
+def index_name(secretname: str) -> str:
+    """
+    Retorna el nombre del secreto índice asociado a un archivo.
+    """
+    return secretname + ".index"
+
+
+def new_generation() -> str:
+    """
+    Retorna un nuevo identificador de generación, único para cada subida. Se utilizan 64 bits aleatorios, ya que el
+    identificador se incluye en cada índice.
+    """
+    return uuid.uuid4().hex[:16]
+
+
+def generation(index: dict | None) -> str | None:
+    """
+    Retorna el identificador de generación de un índice, o None si no lo incluye.
+    """
+    return index.get("generation") if index != None else None
+
+
+def chunk_key(chunk_hash: str, chunk_codec: str = codec.NONE, mode: str = MODE_STRING) -> str:
+    """
+    Retorna la clave con la que se almacena una parte de índice v2, derivada de su hash, del codec y del modo de
+    almacenamiento utilizados.
+    """
+    key = chunk_hash[:32]
+    if chunk_codec != codec.NONE:
+        key = chunk_codec + "-" + key
+    if mode == MODE_BINARY:
+        key = "bin-" + key
+    return key
+
+
+def is_part(secretname: str, name: str) -> bool:
+    """
+    Verifica si un nombre de secreto corresponde a una parte, o tabla de partes, del archivo asociado a `secretname`,
+    de cualquier versión de índice.
+    """
+    return name.startswith(secretname + ".") and PART_SUFFIX.match(name[len(secretname) + 1:]) != None
+
+
+def orphans(secretname: str, existing, referenced: set[str]) -> list[str]:
+    """
+    Retorna, en orden, las partes y tablas de partes existentes de un archivo que no son referenciadas por su índice.
+    Parameters:
+        secretname: Nombre base del secreto.
+        existing: Nombres de los secretos existentes.
+        referenced: Nombres de las partes y tablas referenciadas por el índice, ver references.
+    """
+    return sorted(name for name in existing if is_part(secretname, name) and name not in referenced)
+
+
+def index_codec(index: dict) -> str:
+    """
+    Retorna el codec utilizado por las partes de un índice. Los índices sin codec no están comprimidos.
+    """
+    return index.get("codec", codec.NONE)
+
+
+def index_mode(index: dict) -> str:
+    """
+    Retorna el modo de almacenamiento de las partes de un índice.
+    """
+    return index.get("mode", MODE_STRING)
+
+
+def payload_size(mode: str) -> int:
+    """
+    Retorna la cantidad máxima de bytes que puede almacenar una parte según el modo de almacenamiento.
+    """
+    return chunking.BINARY_MAX_SIZE if mode == MODE_BINARY else chunking.MAX_SIZE
+
+
+def chunk_parameters(chunk_codec: str = codec.NONE, mode: str = MODE_STRING) -> tuple[int, int, int]:
+    """
+    Retorna los parámetros de corte de las partes de un índice v2 o v3 según su codec y modo de almacenamiento: tamaño
+    mínimo, bits del hash y tamaño máximo, ver chunking.iter_chunks. Subida y descarga deben utilizar los mismos
+    parámetros para que las partes del archivo local coincidan con las del índice.
+    """
+    if chunk_codec != codec.NONE:
+        return chunking.COMPRESSED_MIN_SIZE, chunking.COMPRESSED_AVG_BITS, chunking.COMPRESSED_MAX_SIZE
+    if mode == MODE_BINARY:
+        return chunking.BINARY_MIN_SIZE, chunking.BINARY_AVG_BITS, chunking.BINARY_MAX_SIZE
+    return chunking.MIN_SIZE, chunking.AVG_BITS, chunking.MAX_SIZE
+
+
+def fits(value: str) -> bool:
+    """
+    Verifica si el contenido de un índice, o de una tabla de partes, entra en un secreto.
+    """
+    return len(value.encode("utf-8")) <= payload_size(MODE_BINARY)
+
+
+def encode_part(payload: bytes | memoryview, mode: str) -> str | bytes:
+    """
+    Codifica el contenido de una parte para su almacenamiento: bytes para SecretBinary o base64 para SecretString.
+    """
+    if mode == MODE_BINARY:
+        return bytes(payload)
+    return base64.b64encode(payload).decode("utf-8")
+
+
+def decode_part(value: str | bytes, mode: str) -> bytes:
+    """
+    Decodifica el contenido almacenado de una parte.
+    """
+    if mode == MODE_BINARY:
+        if isinstance(value, str):
+            raise ValueError("Se esperaba una parte binaria.")
+        return bytes(value)
+    return base64.b64decode(value)
+
+
+def parse(value: str) -> dict:
+    """
+    Parsea el contenido de un índice y verifica que su versión esté soportada.
+    Parameters:
+        value: Contenido del secreto índice.
+    """
+    index = json.loads(value)
+    version = index.get("v")
+    if version not in (1, 2, TABLES_VERSION):
+        raise ValueError("Versión de índice no soportada: {0}".format(version))
+    return index
+
+
+def build(file_hash: str, size: int, chunks: list[dict], chunk_codec: str = codec.NONE, mode: str = MODE_STRING, generation: str | None = None) -> tuple[str, list[tuple[str, str]]]:
+    """
+    Genera el contenido de un índice v2 o, si no entra en un secreto, de un índice v3 y sus tablas de partes.
+    Parameters:
+        file_hash: Hash md5 del archivo completo.
+        size: Tamaño del archivo completo.
+        chunks: Partes del archivo, en orden. Cada una con su clave, hash y tamaño.
+        chunk_codec: Codec utilizado para comprimir las partes.
+        mode: Modo de almacenamiento de las partes.
+        generation: Identificador de generación de la subida, si hubiere, ver new_generation.
+    Returns:
+        Contenido del índice, y clave y contenido de cada tabla de partes, en orden. Las tablas deben registrarse
+        antes que el índice.
+    """
+    value = {
+        "v": VERSION,
+        "hash": file_hash,
+        "size": size,
+        "codec": chunk_codec,
+        "mode": mode,
+        "chunks": chunks
+    }
+    if generation != None:
+        value["generation"] = generation
+    content = json.dumps(value)
+    if fits(content):
+        return content, []
+
+    # Distribuir las partes en tablas que entren en un secreto.
+    tables = list()
+    for group in split_chunks(chunks):
+        table = json.dumps({"chunks": group})
+        if fits(table) is False:
+            raise ValueError("La tabla de partes excede el tamaño máximo de un secreto.")
+        tables.append((TABLE_PREFIX + chunking.hash_chunk(table.encode("utf-8"))[:32], table, len(group)))
+    del value["chunks"]
+    value["v"] = TABLES_VERSION
+    value["tables"] = [{"key": key, "hash": chunking.hash_chunk(table.encode("utf-8")), "count": count} for key, table, count in tables]
+    content = json.dumps(value)
+    if fits(content) is False:
+        raise ValueError("El índice de {0} partes excede el tamaño máximo de un secreto.".format(len(chunks)))
+    return content, [(key, table) for key, table, _ in tables]
+
+
+def split_chunks(chunks: list[dict]) -> list[list[dict]]:
+    """
+    Divide las partes de un índice en grupos consecutivos cuya tabla entra en un secreto.
+    """
+    limit = payload_size(MODE_BINARY) - len(json.dumps({"chunks": []}))
+    groups = list()
+    group = list()
+    size = 0
+    for chunk in chunks:
+        # Cada parte ocupa su contenido más el separador ", ".
+        length = len(json.dumps(chunk).encode("utf-8")) + 2
+        if len(group) > 0 and size + length > limit:
+            groups.append(group)
+            group = list()
+            size = 0
+        group.append(chunk)
+        size += length
+    if len(group) > 0:
+        groups.append(group)
+    return groups
+
+
+def tables(secretname: str, index: dict) -> list[str]:
+    """
+    Retorna, en orden, el nombre de secreto de cada tabla de partes de un índice v3. Para otros índices retorna una
+    lista vacía.
+    """
+    return [secretname + "." + table["key"] for table in index.get("tables", [])]
+
+
+def attach(secretname: str, index: dict, values: dict) -> dict:
+    """
+    Retorna un índice v3 junto a sus partes ("chunks"), a partir del contenido de sus tablas, verificando su hash y
+    cantidad de partes. Otros índices, o índices con sus partes, se retornan sin cambios.
+    Parameters:
+        secretname: Nombre base del secreto.
+        index: Índice parseado.
+        values: Tupla (valor, error) de cada tabla, indexada por nombre de secreto, ver aws.retrieve_secrets.
+    """
+    if "chunks" in index or index.get("v") != TABLES_VERSION:
+        return index
+    chunks = list()
+    for table in index["tables"]:
+        name = secretname + "." + table["key"]
+        value, err = values.get(name, (None, RuntimeError("No se obtuvo el secreto " + name)))
+        if err != None:
+            raise err
+        data = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+        items = json.loads(data.decode("utf-8"))["chunks"] if chunking.hash_chunk(data) == table["hash"] else None
+        if items == None or len(items) != table["count"]:
+            raise ValueError("El contenido de la tabla de partes {0} no coincide con el índice.".format(name))
+        chunks.extend(items)
+    return dict(index, chunks=chunks)
+
+
+def resolve(secretname: str, index: dict, fetch) -> dict:
+    """
+    Retorna un índice junto a sus partes, obteniendo sus tablas si es un índice v3, ver attach.
+    Parameters:
+        secretname: Nombre base del secreto.
+        index: Índice parseado.
+        fetch: Función que recibe una lista de nombres de secretos y retorna un diccionario con una tupla (valor, error)
+            por cada nombre, ver aws.retrieve_secrets.
+    """
+    names = tables(secretname, index)
+    if len(names) == 0 or "chunks" in index:
+        return index
+    return attach(secretname, index, fetch(names))
+
+
+def references(secretname: str, index: dict) -> list[str]:
+    """
+    Retorna los nombres de las partes y tablas de partes referenciadas por un índice, con sus partes, ver resolve.
+    """
+    return [name for name, _ in parts(secretname, index)] + tables(secretname, index)
+
+
+def parts(secretname: str, index: dict) -> list[tuple[str, str | None]]:
+    """
+    Retorna, en orden, el nombre de secreto de cada parte del índice junto a su hash sha256, si el índice lo incluye.
+    Los índices v3 deben incluir sus partes, ver resolve.
+    Parameters:
+        secretname: Nombre base del secreto.
+        index: Índice parseado.
+    """
+    if index["v"] == 1:
+        return [(secretname + ".{0}".format(i), None) for i in range(index["parts"])]
+    return [(secretname + "." + chunk["key"], chunk["hash"]) for chunk in index["chunks"]]
+
+
+def versions(index: dict) -> list[str | None]:
+    """
+    Retorna, en orden, el VersionId registrado para cada parte del índice, o None si el índice no lo incluye.
+    """
+    if index["v"] == 1:
+        return [None] * index["parts"]
+    return [chunk.get("version") for chunk in index["chunks"]]
+
+
+def chunk_versions(index: dict | None, chunk_codec: str = codec.NONE, mode: str = MODE_STRING) -> dict[str, str]:
+    """
+    Retorna el VersionId de las partes de un índice v2 o v3 que lo incluyen, indexado por su hash. Para otros
+    índices, o índices cuyas partes utilizan otro codec o modo de almacenamiento, retorna un diccionario vacío.
+    """
+    if len(chunk_hashes(index, chunk_codec, mode)) == 0:
+        return dict()
+    return {chunk["hash"]: chunk["version"] for chunk in index["chunks"] if chunk.get("version") != None}
+
+
+def chunk_hashes(index: dict | None, chunk_codec: str = codec.NONE, mode: str = MODE_STRING) -> dict[str, str]:
+    """
+    Retorna las claves de las partes de un índice v2 o v3, indexadas por su hash. Para otros índices, o índices cuyas
+    partes utilizan otro codec o modo de almacenamiento, retorna un diccionario vacío.
+    """
+    if index == None or "chunks" not in index or index_codec(index) != chunk_codec or index_mode(index) != mode:
+        return dict()
+    return {chunk["hash"]: chunk["key"] for chunk in index["chunks"]}
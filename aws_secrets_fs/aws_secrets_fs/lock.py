@@ -0,0 +1,173 @@
+import json
+import os
+from . import utils
+
+
+# Extensión del manifiesto de sincronización, que se guarda junto a cada descriptor: <descriptor>.aws_secrets.lock.
+LOCK_EXTENSION = ".lock"
+
+# Versión del formato del manifiesto.
+# - v1: {"v": 1, "entries": {archivo: {"secret", "hash", "size", "mtime", "remote", "versions"}}}. Por cada entrada del
+#   descriptor se registra el hash md5, tamaño y fecha de modificación (ns) del archivo local, y el hash y VersionId
+#   de las partes del índice remoto, según la última sincronización.
+# - v2: igual a v1, reemplazando "versions" por "regions": {región: [VersionId, ...]}, con las regiones en las que el
+#   índice remoto coincide con el archivo local. La región por defecto se registra como "".
+VERSION = 2
+
+# Estados de un archivo respecto de la última sincronización.
+UNCHANGED = "sin cambios"
+MODIFIED = "modificado"
+MISSING = "inexistente"
+UNTRACKED = "sin registro"
+STATES = [UNCHANGED, MODIFIED, MISSING, UNTRACKED]
+
+
+def lock_file(descriptor: str) -> str:
+    """
+    Retorna el path del manifiesto asociado a un archivo descriptor.
+    """
+    return descriptor + LOCK_EXTENSION
+
+
+def file_stat(path: str) -> tuple[int, int] | None:
+    """
+    Retorna el tamaño y fecha de modificación (ns) de un archivo, o None si no existe.
+    """
+    try:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class Lock:
+    """
+    Manifiesto de sincronización de un archivo descriptor. Permite determinar si un archivo local cambió desde la
+    última sincronización sin acceder a AWS, volviendo a calcular su hash solo si cambió su tamaño o fecha de
+    modificación. Como en el índice de git, los registros cuya fecha de modificación no es anterior a la escritura
+    del manifiesto se consideran dudosos: el archivo pudo modificarse nuevamente sin que cambie su fecha de
+    modificación, según la resolución del sistema de archivos, por lo que su hash se vuelve a calcular.
+    Attributes:
+        path: Path del manifiesto.
+        entries: Registro de cada archivo sincronizado, indexado por nombre de archivo según el descriptor.
+        modified: Indica si el registro cambió desde que se leyó.
+        written: Fecha de modificación (ns) del manifiesto al leerlo o guardarlo, o 0 si no existe.
+    """
+    path = ""
+    entries = None
+    modified = False
+    written = 0
+
+    def __init__(self, descriptor: str):
+        """
+        Constructor. Lee el manifiesto asociado al descriptor, si existe. Un manifiesto inválido o de otra versión se
+        descarta.
+        """
+        self.path = lock_file(descriptor)
+        self.entries = dict()
+        self.modified = False
+        self.written = 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.written = os.fstat(file.fileno()).st_mtime_ns
+                content = json.load(file)
+            if content.get("v") == VERSION:
+                self.entries = content["entries"]
+        except Exception:
+            self.entries = dict()
+
+    def record(self, entry: utils.DescriptorFileEntry) -> dict | None:
+        """
+        Retorna el registro de una entrada del descriptor, o None si no se sincronizó o se asoció a otro secreto.
+        """
+        record = self.entries.get(entry.filename)
+        if record == None or record.get("secret") != entry.secretname:
+            return None
+        return record
+
+    def local_hash(self, entry: utils.DescriptorFileEntry, targetfile: str) -> str | None:
+        """
+        Retorna el hash md5 actual de un archivo local, o None si no existe. Si su tamaño y fecha de modificación
+        coinciden con los registrados, y la fecha de modificación es anterior a la escritura del manifiesto, se retorna
+        el hash registrado sin leer el archivo. Si el archivo se modificó pero su contenido es el mismo, o el registro
+        era dudoso, se actualizan los datos registrados, de manera que al volver a guardar el manifiesto el registro
+        deje de ser dudoso.
+        """
+        stat = file_stat(targetfile)
+        if stat == None:
+            return None
+        record = self.record(entry)
+        if record != None and [record.get("size"), record.get("mtime")] == list(stat) and stat[1] < self.written:
+            return record["hash"]
+        file_hash = utils.hash_file(targetfile)
+        if record != None and record.get("hash") == file_hash:
+            record["size"], record["mtime"] = stat
+            self.modified = True
+        return file_hash
+
+    def status(self, entry: utils.DescriptorFileEntry, targetfile: str) -> str:
+        """
+        Retorna el estado de un archivo local respecto de la última sincronización, ver STATES.
+        """
+        record = self.record(entry)
+        file_hash = self.local_hash(entry, targetfile)
+        if file_hash == None:
+            return MISSING
+        if record == None:
+            return UNTRACKED
+        return UNCHANGED if file_hash == record["hash"] and record["hash"] == record.get("remote") else MODIFIED
+
+    def unchanged(self, entry: utils.DescriptorFileEntry, targetfile: str, regions: list[str]) -> bool:
+        """
+        Verifica si un archivo local no cambió desde su última sincronización con todas las regiones indicadas.
+        """
+        if self.status(entry, targetfile) != UNCHANGED:
+            return False
+        synced = self.record(entry).get("regions", dict())
+        return all(region in synced for region in regions)
+
+    def update(self, entry: utils.DescriptorFileEntry, file_hash: str, region: str, versions: list[str | None], stat: tuple[int, int] | None) -> None:
+        """
+        Registra la sincronización de un archivo con una región, cuyo índice remoto coincide con el archivo local. Las
+        regiones registradas anteriormente se conservan solo si el hash no cambió.
+        Parameters:
+            entry: Entrada del descriptor.
+            file_hash: Hash md5 del archivo, local y remoto.
+            region: Región aws sincronizada, o "" para la región por defecto.
+            versions: VersionId de cada parte del índice remoto.
+            stat: Tamaño y fecha de modificación del archivo, obtenidos antes de calcular su hash, ver file_stat.
+        """
+        if stat == None:
+            return
+        previous = self.record(entry)
+        regions = dict(previous.get("regions", dict())) if previous != None and previous.get("remote") == file_hash else dict()
+        regions[region] = versions
+        record = {
+            "secret": entry.secretname,
+            "hash": file_hash,
+            "size": stat[0],
+            "mtime": stat[1],
+            "remote": file_hash,
+            "regions": regions
+        }
+        if self.entries.get(entry.filename) != record:
+            self.entries[entry.filename] = record
+            self.modified = True
+
+    def save(self) -> None:
+        """
+        Guarda el manifiesto, solo si cambió. Los errores de escritura se informan como advertencia, el manifiesto es
+        solo una optimización.
+        """
+        if self.modified is False:
+            return
+        try:
+            tmppath = self.path + ".{0}.tmp".format(os.getpid())
+            with open(tmppath, "w", encoding="utf-8") as file:
+                json.dump({"v": VERSION, "entries": self.entries}, file, indent=2, sort_keys=True)
+                file.write("\n")
+            os.replace(tmppath, self.path)
+            self.written = os.stat(self.path).st_mtime_ns
+            self.modified = False
+        except Exception as e:
+            print(utils.bcolors.WARNING + "Advertencia: no se pudo guardar " + self.path + ". " + str(e) + utils.bcolors.ENDC)
@@ -1,12 +1,15 @@
 import argparse
 import os
-import json
-import base64
+import time
 from . import utils
-from . import opt_check
-from . import opt_download
-from . import opt_upload
-from . import opt_delete
+from . import aws
+from . import codec
+from . import index
+from . import cache
+from .trace import tracer
+
+# Cantidad de funciones con mayor tiempo acumulado incluidas en el reporte al utilizar --profile.
+PROFILE_TOP = 30
 
 
 def resolve_cwd(args: argparse.Namespace) -> str:
@@ -44,6 +47,9 @@ def resolve_aws_region(args: argparse.Namespace) -> str:
         return ""
     else:
         region = region.strip()
+    if "," in region:
+        print(utils.bcolors.FAIL + "Error: la acción indicada admite una única región (--aws-region)." + utils.bcolors.ENDC)
+        exit(1)
 
     if region != "":
         print("{0}Utilizando región \"{1}\".{2}".format(utils.bcolors.OKBLUE, region, utils.bcolors.ENDC))
@@ -51,6 +57,25 @@ def resolve_aws_region(args: argparse.Namespace) -> str:
     return region
 
 
+def resolve_aws_regions(args: argparse.Namespace) -> list[str]:
+    """
+    Determina las regiones AWS a utilizar, separadas por coma, para las acciones que admiten varias regiones. Si no se
+    indica, se utiliza la región por defecto del perfil.
+    """
+    regions = list()
+    for region in (args.aws_region or "").split(","):
+        region = region.strip()
+        if region != "" and region not in regions:
+            regions.append(region)
+    if len(regions) == 0:
+        return [""]
+    if len(regions) == 1:
+        print("{0}Utilizando región \"{1}\".{2}".format(utils.bcolors.OKBLUE, regions[0], utils.bcolors.ENDC))
+    else:
+        print("{0}Utilizando regiones: {1}.{2}".format(utils.bcolors.OKBLUE, ", ".join(regions), utils.bcolors.ENDC))
+    return regions
+
+
 def resolve_secret_name(args: argparse.Namespace, msg: str) -> str:
     """
     Determina el valor de secreto AWS indicado.
@@ -63,35 +88,247 @@ def resolve_secret_name(args: argparse.Namespace, msg: str) -> str:
     return secret_name
 
 
+def resolve_aws_prefix(args: argparse.Namespace) -> str:
+    """
+    Determina el prefijo de nombre de secretos a procesar. No se permite un prefijo vacío, ya que abarcaría todos los
+    secretos de la cuenta.
+    """
+    prefix = args.aws_prefix.strip()
+    if prefix == "":
+        print(utils.bcolors.FAIL + "Error: el prefijo de secretos no puede estar vacío (--aws-prefix)." + utils.bcolors.ENDC)
+        exit(1)
+    return prefix
+
+
+def resolve_jobs(args: argparse.Namespace) -> int:
+    """
+    Determina la cantidad de operaciones simultáneas a utilizar. Si no se indica, se procesa de a una.
+    """
+    jobs = args.jobs
+    if jobs == None:
+        return 1
+    if jobs < 1:
+        print(utils.bcolors.FAIL + "Error: la cantidad de operaciones simultáneas debe ser mayor a cero (--jobs)." + utils.bcolors.ENDC)
+        exit(1)
+    return jobs
+
+
+def resolve_codec(args: argparse.Namespace) -> str:
+    """
+    Determina el codec a utilizar para comprimir las partes al subir archivos.
+    """
+    try:
+        chunk_codec = codec.resolve(args.codec)
+    except ValueError as e:
+        print(utils.bcolors.FAIL + "Error: " + str(e) + " (--codec)." + utils.bcolors.ENDC)
+        exit(1)
+    if chunk_codec != codec.NONE:
+        print("{0}Utilizando codec \"{1}\".{2}".format(utils.bcolors.OKBLUE, chunk_codec, utils.bcolors.ENDC))
+    return chunk_codec
+
+
+def resolve_aws_max_connections(args: argparse.Namespace) -> None:
+    """
+    Ajusta la cantidad máxima de conexiones HTTP por cliente AWS, si se indica.
+    """
+    max_connections = args.aws_max_connections
+    if max_connections == None:
+        return
+    if max_connections < 1:
+        print(utils.bcolors.FAIL + "Error: la cantidad de conexiones debe ser mayor a cero (--aws-max-connections)." + utils.bcolors.ENDC)
+        exit(1)
+    aws.configure_clients(max_connections)
+
+
+def resolve_cache(args: argparse.Namespace) -> cache.SecretCache | None:
+    """
+    Determina la caché local de partes a utilizar en descargas, si se indica.
+    """
+    if args.cache is False:
+        return None
+    if args.cache_size < 1:
+        print(utils.bcolors.FAIL + "Error: el tamaño de la caché debe ser mayor a cero (--cache-size)." + utils.bcolors.ENDC)
+        exit(1)
+    try:
+        secret_cache = cache.SecretCache(max_size=args.cache_size * 1024 * 1024)
+    except Exception as e:
+        print(utils.bcolors.FAIL + "Error: " + str(e) + " (--cache)." + utils.bcolors.ENDC)
+        exit(1)
+    print("{0}Utilizando caché \"{1}\".{2}".format(utils.bcolors.OKBLUE, secret_cache.folder, utils.bcolors.ENDC))
+    return secret_cache
+
+
+def print_aws_stats(start: float) -> None:
+    """
+    Imprime la cantidad de clientes y conexiones AWS creadas durante la ejecución, y la cantidad de llamadas,
+    límites de uso, reintentos y tiempo de espera del regulador de llamadas.
+    Parameters:
+        start: Momento de inicio de la ejecución, ver time.monotonic.
+    """
+    stats = aws.client_stats()
+    print("\n{0}Clientes AWS: {1}, conexiones: {2}.{3}".format(utils.bcolors.OKCYAN, stats["clients"], stats["connections"], utils.bcolors.ENDC))
+    stats = aws.governor_stats()
+    elapsed = max(time.monotonic() - start, 0.001)
+    print("{0}Llamadas AWS: {1} ({2:.1f}/s), limitadas: {3}, reintentos: {4}, espera acumulada: {5:.1f}s.{6}".format(utils.bcolors.OKCYAN, stats["calls"], stats["calls"] / elapsed, stats["throttled"], stats["retries"], stats["wait"], utils.bcolors.ENDC))
+
+
+def profile_summary(profiler, limit: int = PROFILE_TOP) -> list[dict]:
+    """
+    Retorna las funciones con mayor tiempo acumulado registradas por cProfile.
+    """
+    import pstats
+    stats = pstats.Stats(profiler)
+    rows = list()
+    for (filename, line, function), (_, calls, total, cumulative, _) in stats.stats.items():
+        rows.append({
+            "function": "{0}:{1}({2})".format(filename, line, function),
+            "calls": calls,
+            "total": round(total, 6),
+            "cumulative": round(cumulative, 6)
+        })
+    rows.sort(key=lambda row: row["cumulative"], reverse=True)
+    return rows[:limit]
+
+
+def save_report(args: argparse.Namespace, profiler) -> None:
+    """
+    Imprime las estadísticas y guarda el reporte de la ejecución, según lo indicado. Con cProfile también se guarda el
+    volcado completo junto al reporte, con extensión ".prof".
+    """
+    if args.stats:
+        tracer.print_stats()
+    if args.report == None:
+        return
+    profile = None
+    if profiler != None:
+        profiler.dump_stats(os.path.splitext(args.report)[0] + ".prof")
+        profile = profile_summary(profiler)
+    try:
+        tracer.save(args.report, profile)
+        print("{0}Reporte guardado: {1}{2}".format(utils.bcolors.OKCYAN, args.report, utils.bcolors.ENDC))
+    except Exception as e:
+        print(utils.bcolors.FAIL + "Error: no se pudo guardar el reporte. " + str(e) + utils.bcolors.ENDC)
+
+
 def main() -> None:
     """
     Implementa la lógica central de la herramienta.
     """
     parser = argparse.ArgumentParser(prog="aws_secrets_fs", description="Herramienta que permite sincronizar archivos con datos sensibles, utilizando AWS Secrets Manager como backend.")
-    parser.add_argument('--action', type=str, required=True, choices=["check", "download", "upload", "delete"], help="Acción a realizar.")
+    parser.add_argument('--action', type=str, required=True, choices=["check", "status", "download", "upload", "watch", "delete", "gc"], help="Acción a realizar.")
     parser.add_argument("--cwd", type=str, required=False, help="Carpeta de trabajo para ciertas acciones que lo requieran.")
+    parser.add_argument("--recursive", action="store_true", help="Buscar archivos descriptores también en subcarpetas.")
+    parser.add_argument("--ignore", type=str, action="append", required=False, help="Patrón glob de carpetas o descriptores a omitir en la búsqueda recursiva. Puede indicarse varias veces.")
     parser.add_argument("--aws-profile", type=str, required=False, help="Nombre del perfil AWS configurado.")
-    parser.add_argument("--aws-region", type=str, required=False, help="Nombre de región de preferencia para AWS.")
+    parser.add_argument("--aws-region", type=str, required=False, help="Nombre de región de preferencia para AWS. Para upload, download y watch pueden indicarse varias regiones separadas por coma.")
     parser.add_argument("--aws-secret", type=str, required=False, help="Nombre o ARN de secreto a procesar dependiendo de la acción indicada.")
+    parser.add_argument("--aws-prefix", type=str, required=False, help="Prefijo de nombre de los secretos a eliminar con la acción delete.")
+    parser.add_argument("--entry", type=str, action="append", required=False, help="Archivo de un descriptor cuyo índice y partes se eliminan con la acción delete. Puede indicarse varias veces.")
+    parser.add_argument("--jobs", type=int, required=False, help="Cantidad de operaciones simultáneas contra AWS.")
+    parser.add_argument("--force", action="store_true", help="Transferir los archivos aunque no tengan cambios, sin considerar el manifiesto de sincronización.")
+    parser.add_argument("--dry-run", action="store_true", help="Solo imprimir el plan de operaciones y la cantidad estimada de llamadas al API, sin modificar secretos.")
+    parser.add_argument("--codec", type=str, required=False, choices=codec.CODECS + [codec.AUTO], help="Codec para comprimir las partes al subir archivos. \"auto\" utiliza zstd si está instalado, o zlib.")
+    parser.add_argument("--storage", type=str, required=False, default=index.MODE_STRING, choices=index.MODES, help="Modo de almacenamiento de las partes al subir archivos: texto en base64 (SecretString) o binario (SecretBinary).")
+    parser.add_argument("--aws-max-connections", type=int, required=False, help="Cantidad máxima de conexiones HTTP por cliente AWS.")
+    parser.add_argument("--cache", action="store_true", help="Utilizar una caché local cifrada de partes al descargar archivos.")
+    parser.add_argument("--cache-size", type=int, required=False, default=cache.DEFAULT_MAX_SIZE // 1024 // 1024, help="Tamaño máximo de la caché local, en MB.")
+    parser.add_argument("--interval", type=float, required=False, default=1.0, help="Intervalo de comprobación de cambios de la acción watch sin inotify, en segundos.")
+    parser.add_argument("--debounce", type=float, required=False, default=0.5, help="Tiempo sin cambios a esperar antes de subir un archivo modificado con la acción watch, en segundos.")
+    parser.add_argument("--grace", type=float, required=False, default=3600, help="Antigüedad mínima, en segundos, de las partes sin referencia y de su índice para que la acción gc las elimine.")
+    parser.add_argument("--stats", action="store_true", help="Imprimir percentiles de latencia y throughput de cada acción del API, y el tiempo de cada fase.")
+    parser.add_argument("--report", type=str, required=False, help="Archivo JSON donde guardar el registro completo de llamadas al API y tiempos por fase.")
+    parser.add_argument("--profile", action="store_true", help="Ejecutar con cProfile e incluir las funciones con mayor tiempo acumulado en el reporte (--report).")
     args = parser.parse_args()
+    start = time.monotonic()
+    tracer.reset()
+    resolve_aws_max_connections(args)
+
+    # El reporte se guarda también si la acción finaliza con error.
+    profiler = None
+    if args.profile and args.report != None:
+        import cProfile
+        profiler = cProfile.Profile()
+    if args.profile and args.report == None:
+        print(utils.bcolors.WARNING + "Advertencia: --profile requiere --report, se ignora." + utils.bcolors.ENDC)
+    try:
+        if profiler != None:
+            profiler.enable()
+        run(args, start)
+    finally:
+        if profiler != None:
+            profiler.disable()
+        save_report(args, profiler)
 
+
+def run(args: argparse.Namespace, start: float) -> None:
+    """
+    Ejecuta la acción indicada.
+    Parameters:
+        args: Argumentos de línea de comandos.
+        start: Momento de inicio de la ejecución, ver time.monotonic.
+    """
+    # Los módulos de cada acción se importan solo al utilizarse, para reducir el tiempo de inicio.
     if args.action == "check":
+        from . import opt_check
         opt_check.run()
 
+    if args.action == "status":
+        from . import opt_status
+        opt_status.run(resolve_cwd(args), args.recursive, args.ignore)
+
     if args.action == "download":
+        from . import opt_download
         cwd = resolve_cwd(args)
         profile = resolve_aws_profile(args)
-        region = resolve_aws_region(args)
-        opt_download.run(cwd, profile, region)
+        region = resolve_aws_regions(args)
+        jobs = resolve_jobs(args)
+        secret_cache = resolve_cache(args)
+        opt_download.run(cwd, profile, region, jobs, args.force, args.recursive, args.ignore, secret_cache)
+        print_aws_stats(start)
 
     if args.action == "upload":
+        from . import opt_upload
         cwd = resolve_cwd(args)
         profile = resolve_aws_profile(args)
-        region = resolve_aws_region(args)
-        opt_upload.run(cwd, profile, region)
+        region = resolve_aws_regions(args)
+        jobs = resolve_jobs(args)
+        chunk_codec = resolve_codec(args)
+        opt_upload.run(cwd, profile, region, jobs, args.force, chunk_codec, args.storage, args.recursive, args.ignore, args.dry_run)
+        print_aws_stats(start)
+
+    if args.action == "watch":
+        from . import opt_watch
+        cwd = resolve_cwd(args)
+        profile = resolve_aws_profile(args)
+        region = resolve_aws_regions(args)
+        jobs = resolve_jobs(args)
+        chunk_codec = resolve_codec(args)
+        if args.interval <= 0 or args.debounce < 0:
+            print(utils.bcolors.FAIL + "Error: el intervalo debe ser mayor a cero y la espera no puede ser negativa (--interval, --debounce)." + utils.bcolors.ENDC)
+            exit(1)
+        opt_watch.run(cwd, profile, region, jobs, chunk_codec, args.storage, args.recursive, args.ignore, args.interval, args.debounce)
+        print_aws_stats(start)
 
     if args.action == "delete":
-        secret_name = resolve_secret_name(args, "Error: se debe especificar el secreto a procesar (--aws-secret).")
+        from . import opt_delete
+        if args.aws_prefix == None and args.entry == None:
+            secret_name = resolve_secret_name(args, "Error: se debe especificar el secreto, prefijo o archivo a procesar (--aws-secret, --aws-prefix o --entry).")
+        profile = resolve_aws_profile(args)
+        region = resolve_aws_region(args)
+        jobs = resolve_jobs(args)
+        if args.aws_prefix != None:
+            opt_delete.run_prefix(resolve_aws_prefix(args), profile, region, jobs, args.dry_run)
+        elif args.entry != None:
+            opt_delete.run_entries(resolve_cwd(args), args.entry, profile, region, jobs, args.dry_run, args.recursive, args.ignore)
+        else:
+            opt_delete.run(secret_name, profile, region)
+        print_aws_stats(start)
+
+    if args.action == "gc":
+        from . import opt_gc
+        cwd = resolve_cwd(args)
         profile = resolve_aws_profile(args)
         region = resolve_aws_region(args)
-        opt_delete.run(secret_name, profile, region)
+        jobs = resolve_jobs(args)
+        opt_gc.run(cwd, profile, region, jobs, args.dry_run, args.recursive, args.ignore, args.grace)
+        print_aws_stats(start)
@@ -4,34 +4,31 @@ from . import aws
 
 def run() -> None:
     """
-    Verifica las dependencias necesarias. De momento, que esté instalado aws cli.
+    Verifica las dependencias necesarias: que esté instalado boto3 y que existan perfiles configurados. Los perfiles
+    se leen directamente de los archivos de configuración de AWS, sin ejecutar AWS CLI.
 
     Se imprime la versión encontrada y los perfiles configurados.
     """
-    # Verificar si aws cli esta disponible.
-    aws_cli_available = aws.aws_cli_available()
-    if aws_cli_available == False:
-        print(utils.bcolors.FAIL + "Error: No se encontró AWS CLI." + utils.bcolors.ENDC)
+    # Versión de boto3.
+    boto3_version = aws.boto3_version()
+    if boto3_version == None:
+        print(utils.bcolors.FAIL + "Error: No se encontró boto3." + utils.bcolors.ENDC)
         exit(1)
+    print("boto3 Version: {0}{1}{2}".format(utils.bcolors.OKGREEN, boto3_version, utils.bcolors.ENDC))
 
-    # Versión de aws cli.
-    aws_version = aws.aws_cli_version()
-    if aws_version == None:
-        print(utils.bcolors.FAIL + "Error: No se pudo determinar la versión de AWS CLI." + utils.bcolors.ENDC)
-        exit(1)
-    print("AWS CLI Version: {0}{1}{2}".format(utils.bcolors.OKGREEN, aws_version, utils.bcolors.ENDC))
+    # AWS CLI no es requerido, solo se informa si está disponible.
+    if aws.aws_cli_available() is False:
+        print(utils.bcolors.WARNING + "Advertencia: No se encontró AWS CLI." + utils.bcolors.ENDC)
 
     # Listar perfiles disponibles.
-    try:
-        # Obtener perfiles.
-        aws_profiles = aws.aws_cli_profiles()
-        if aws_profiles == None:
-            raise RuntimeWarning("No se pudieron obtener perfiles.")
-
-        # Listar perfiles.
-        print("AWS CLI Profiles:")
-        for aws_profile in aws_profiles:
-            print("  • {0}".format(aws_profile))
-    except Exception:
-        print(utils.bcolors.WARNING + "Advertencia: \"aws configure list-profiles\" no soportado." + utils.bcolors.ENDC)
+    config, credentials = aws.aws_config_files()
+    aws_profiles = aws.aws_profiles()
+    if aws_profiles == None:
+        print(utils.bcolors.FAIL + "Error: No se pudieron leer los perfiles de \"{0}\" y \"{1}\".".format(config, credentials) + utils.bcolors.ENDC)
+        exit(1)
+    if len(aws_profiles) == 0:
+        print(utils.bcolors.WARNING + "Advertencia: No se encontraron perfiles en \"{0}\" ni en \"{1}\".".format(config, credentials) + utils.bcolors.ENDC)
         exit(1)
+    print("AWS Profiles:")
+    for aws_profile in aws_profiles:
+        print("  • {0}".format(aws_profile))
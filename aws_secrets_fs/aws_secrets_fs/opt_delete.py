@@ -1,5 +1,16 @@
+import concurrent.futures
+import os
 from . import utils
 from . import aws
+from . import governor
+from . import index
+from . import plan as planner
+from .trace import tracer
+
+
+# Cantidad de eliminaciones por segundo en eliminaciones masivas. Las llamadas se distribuyen de forma uniforme, por
+# debajo de la cuota de DeleteSecret, para no afectar a otras herramientas que utilicen la misma cuenta.
+DELETE_RATE = 25
 
 
 def run(secret_name: str, profile: str, region: str):
@@ -20,3 +31,145 @@ def run(secret_name: str, profile: str, region: str):
     except Exception as e:
         print("Error: " + str(e))
         print(utils.bcolors.FAIL + "Error: no se puedo eliminar el secreto indicado." + utils.bcolors.ENDC)
+
+
+def run_prefix(prefix: str, profile: str, region: str, jobs: int = 1, dry_run: bool = False) -> None:
+    """
+    Elimina todos los secretos cuyo nombre comienza con el prefijo indicado.
+    Parameters:
+        prefix: Prefijo de nombre de los secretos a eliminar.
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+        jobs: Cantidad de eliminaciones simultáneas.
+        dry_run: Solo listar los secretos a eliminar.
+    """
+    plan = scan([prefix], profile, region)
+    for name in sorted(plan.existing.keys()):
+        plan.add(planner.DELETE, name)
+    execute(plan, profile, region, jobs, dry_run)
+
+
+def run_entries(cwd: str, filenames: list[str], profile: str, region: str, jobs: int = 1, dry_run: bool = False, recursive: bool = False, ignore: list[str] | None = None) -> None:
+    """
+    Elimina el índice y todas las partes, de cualquier versión de índice, de los archivos indicados según las entradas
+    de los archivos descriptores.
+    Parameters:
+        cwd: Carpeta de trabajo.
+        filenames: Archivos a eliminar, tal como figuran en el descriptor o relativos a la carpeta de trabajo.
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+        jobs: Cantidad de eliminaciones simultáneas.
+        dry_run: Solo listar los secretos a eliminar.
+        recursive: Buscar descriptores también en subcarpetas.
+        ignore: Patrones glob de carpetas o descriptores a omitir en la búsqueda recursiva.
+    """
+    # Buscar las entradas indicadas en los descriptores, y los archivos de cada secreto agrupado con @pack.
+    targets = set(os.path.normpath(filename) for filename in filenames)
+    secretnames = list()
+    members = dict()
+    with tracer.phase("discovery"):
+        descriptors = utils.get_descriptor_files(cwd, recursive, ignore)
+    for descriptor in descriptors:
+        for entry in utils.parse_descriptor_file(descriptor):
+            if entry.pack != None:
+                members.setdefault(entry.pack, dict())[entry.secretname] = entry.filename
+            path = os.path.normpath(os.path.relpath(os.path.join(os.path.dirname(descriptor), entry.filename), cwd))
+            if os.path.normpath(entry.filename) in targets or path in targets:
+                secretnames.append(entry.secretname)
+    if len(secretnames) == 0:
+        print(utils.bcolors.FAIL + "Error: no se encontraron entradas para los archivos indicados." + utils.bcolors.ENDC)
+        exit(1)
+
+    # Solo se eliminan los secretos agrupados de los que se indicaron todos los archivos, ver packed.
+    packs = [name for name, files in members.items() if any(secretname in files for secretname in secretnames)]
+    prefixes = list(dict.fromkeys(secretnames + packs + [secretname for name in packs for secretname in members[name]]))
+    plan = scan([secretname + "." for secretname in prefixes], profile, region)
+    for name in packs:
+        files = packed(plan, members[name])
+        remaining = [members[name][secretname] for secretname in files if secretname not in secretnames]
+        if len(remaining) == len(files):
+            continue
+        if len(remaining) > 0:
+            print(utils.bcolors.FAIL + "Error: los archivos indicados están agrupados en el secreto " + name + " junto con " + ", ".join(remaining) + ". Quite las entradas del descriptor y vuelva a subirlo para regenerar el secreto agrupado, o indique también esos archivos." + utils.bcolors.ENDC)
+            exit(1)
+        secretnames.append(name)
+
+    # Se elimina primero el índice, de manera que ante un error no quede un índice con partes faltantes.
+    for secretname in secretnames:
+        if plan.exists(index.index_name(secretname)):
+            plan.add(planner.DELETE, index.index_name(secretname))
+        for name in sorted(plan.existing.keys()):
+            if index.is_part(secretname, name):
+                plan.add(planner.DELETE, name)
+    execute(plan, profile, region, jobs, dry_run)
+
+
+def packed(plan: planner.Plan, files: dict[str, str]) -> list[str]:
+    """
+    Retorna los secretos de los archivos de un descriptor con @pack que se almacenan en el secreto agrupado, es decir,
+    que no tienen un índice propio por superar pack.MAX_SIZE.
+    """
+    return [secretname for secretname in files if plan.exists(index.index_name(secretname)) is False]
+
+
+def scan(prefixes: list[str], profile: str, region: str) -> planner.Plan:
+    """
+    Obtiene los secretos existentes con los prefijos indicados. Si no pueden obtenerse, finaliza la ejecución.
+    """
+    plan = planner.Plan()
+    err = plan.scan(prefixes, lambda group, token: aws.list_secrets(group, token, profile, region))
+    if err != None:
+        print("Error: " + str(err))
+        print(utils.bcolors.FAIL + "Error: no se pudieron obtener los secretos existentes." + utils.bcolors.ENDC)
+        exit(1)
+    return plan
+
+
+def execute(plan: planner.Plan, profile: str, region: str, jobs: int = 1, dry_run: bool = False) -> None:
+    """
+    Elimina los secretos del plan, o solo imprime el plan si se indica `dry_run`.
+    """
+    names = plan.names(planner.DELETE)
+    if dry_run or len(names) == 0:
+        plan.show()
+        return
+
+    failed = delete_secrets(names, lambda secret_name: aws.delete_secret(secret_name, profile, region), jobs)
+    color = utils.bcolors.FAIL if len(failed) > 0 else utils.bcolors.OKCYAN
+    print("\n{0}Resumen: {1} eliminados, {2} fallidos.{3}".format(color, len(names) - len(failed), len(failed), utils.bcolors.ENDC))
+
+
+def delete_secrets(names: list[str], delete, jobs: int = 1, rate: float = DELETE_RATE) -> list[str]:
+    """
+    Elimina los secretos indicados utilizando hasta `jobs` eliminaciones simultáneas, distribuidas de forma uniforme
+    a razón de `rate` por segundo. Los secretos que ya no existen se consideran eliminados.
+    Parameters:
+        names: Nombres de los secretos a eliminar.
+        delete: Función que recibe el nombre de un secreto, lo elimina y retorna una tupla (respuesta, error).
+        jobs: Cantidad de eliminaciones simultáneas.
+        rate: Cantidad de eliminaciones por segundo.
+    Returns:
+        Nombres de los secretos que no pudieron eliminarse.
+    """
+    bucket = governor.TokenBucket(rate, burst=0)
+
+    def paced(secret_name: str):
+        bucket.acquire()
+        return delete(secret_name)
+
+    failed = list()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {executor.submit(paced, name): name for name in names}
+        for future in concurrent.futures.as_completed(futures.keys()):
+            name = futures[future]
+            try:
+                _, err = future.result()
+            except Exception as e:
+                err = e
+            if err != None and aws.not_found(err) is False:
+                print("Error: " + str(err))
+                print(utils.bcolors.FAIL + "Error: no se pudo eliminar " + name + "." + utils.bcolors.ENDC)
+                failed.append(name)
+            else:
+                print("Eliminado: " + name)
+    return failed
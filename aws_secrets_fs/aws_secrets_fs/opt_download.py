@@ -1,91 +1,736 @@
-import json
+import collections
+import concurrent.futures
+import math
 import os
-import base64
+import time
 from . import utils
 from . import aws
+from . import chunking
+from . import codec
+from . import index
+from . import lock as lockfile
+from . import pack
+from . import store
+from . import cache as secret_cache
+from .trace import tracer
 
 
-def run(cwd: str, profile: str, region: str) -> None:
+# Número de parte con el que se encolan las tablas de partes de un índice v3, ver on_table.
+TABLE = -1
+
+# Cantidad de partes por descarga simultánea que pueden solicitarse por delante de la última parte escrita de cada
+# archivo, en lotes de hasta aws.BATCH_SIZE partes. Limita las partes descargadas en espera de ser escritas en orden.
+WINDOW_FACTOR = 1
+
+
+class DownloadTask(utils.FileTask):
+    """
+    Estado de descarga de una entrada de archivo descriptor.
+    Attributes:
+        index: Contenido del archivo índice, una vez descargado.
+        tables: Tablas de partes descargadas de un índice v3, indexadas por nombre de secreto, ver index.attach.
+        parts: Nombre de secreto y hash de cada parte, ver index.parts.
+        hashes: Hash sha256 esperado para cada parte, si el índice lo incluye.
+        versions: VersionId registrado para cada parte, si el índice lo incluye.
+        local: Ubicación (offset, tamaño) en el archivo local de las partes que no requieren descarga.
+        buffer: Partes descargadas aún no escritas, por haber llegado antes que partes anteriores.
+        written: Cantidad de partes escritas, en orden.
+        requested: Cantidad de partes consideradas para su descarga, en orden, ver advance.
+        window: Cantidad máxima de partes a solicitar por delante de la última parte escrita.
+        cached: Cantidad de partes obtenidas de la caché.
+        pending: Cantidad de partes, o tablas de partes, pendientes de descarga.
+        writer: Archivo temporal en el que se escriben las partes.
+        replaced: Generación del índice cuyas partes ya no existen, si se volvió a obtener el índice, ver reread.
+    """
+    index = None
+    tables = None
+    parts = None
+    hashes = None
+    versions = None
+    local = None
+    buffer = None
+    written = 0
+    requested = 0
+    window = 0
+    cached = 0
+    pending = 0
+    writer = None
+    replaced = None
+
+    def __init__(self, entry: utils.DescriptorFileEntry, targetfile: str):
+        """
+        Constructor
+        """
+        super().__init__(entry, targetfile)
+        self.index = None
+        self.tables = dict()
+        self.parts = list()
+        self.hashes = list()
+        self.versions = list()
+        self.local = dict()
+        self.buffer = dict()
+        self.written = 0
+        self.requested = 0
+        self.window = 0
+        self.cached = 0
+        self.pending = 0
+        self.writer = None
+        self.replaced = None
+
+
+def run(cwd: str, profile: str, region: str | list[str], jobs: int = 1, force: bool = False, recursive: bool = False, ignore: list[str] | None = None, cache: secret_cache.SecretCache | None = None) -> None:
     """
     Procesa las entradas en archivos tipo descriptor y se encarga de recrear el contenido de los archivos indicados.
+    Los archivos sincronizados se registran en el manifiesto de cada descriptor. Con varias regiones, los índices se
+    obtienen de todas ellas en paralelo y cada archivo se descarga de la región más rápida con un índice consistente,
+    pasando a la siguiente ante errores, ver failover.
     Parameters:
         cwd: Carpeta de trabajo.
         profile: Perfil aws a utilizar.
-        region: Región aws a utilizar, si hubiere.
+        region: Región aws a utilizar, si hubiere, o lista de regiones candidatas.
+        jobs: Cantidad de descargas simultáneas.
+        force: Descargar los archivos aunque el contenido local coincida con el remoto.
+        recursive: Buscar descriptores también en subcarpetas.
+        ignore: Patrones glob de carpetas o descriptores a omitir en la búsqueda recursiva.
+        cache: Caché local de partes, si hubiere.
     """
     # Obtener descriptores en carpeta actual.
-    descriptors = utils.get_descriptor_files(cwd)
+    with tracer.phase("discovery"):
+        descriptors = store.descriptors(cwd, recursive, ignore)
     if (len(descriptors) == 0):
         print("No se encontraron archivos descriptores.")
         exit(1)
 
-    # Extraer entradas de cada archivo descriptor.
+    # Descargar y registrar los archivos sincronizados en el manifiesto de cada descriptor.
+    tasks = download_descriptors(descriptors, profile, store.regions(region), jobs, force, cache)
+    utils.print_summary(tasks)
+    if cache != None:
+        print(cache.summary())
+
+
+def download_descriptors(descriptors: list[store.Descriptor], profile: str, regions: list[str], jobs: int = 1, force: bool = False, cache: secret_cache.SecretCache | None = None) -> list[DownloadTask]:
+    """
+    Descarga a disco los archivos de los descriptores indicados, combinando las llamadas de todos ellos, y los
+    registra en el manifiesto de cada descriptor, ver download. Los archivos de descriptores con @pack se obtienen de
+    su secreto agrupado, ver download_packs.
+    Parameters:
+        descriptors: Archivos descriptores.
+        profile: Perfil aws a utilizar.
+        regions: Regiones candidatas, ver failover.
+        jobs: Cantidad de descargas simultáneas.
+        force: Descargar los archivos aunque el contenido local coincida con el remoto.
+        cache: Caché local de partes, si hubiere.
+    Returns:
+        Estado de descarga de cada archivo.
+    """
+    tasks = list()
+    for descriptor in descriptors:
+        for entry in descriptor.entries:
+            task = DownloadTask(entry, descriptor.targetfile(entry))
+            task.lock = descriptor.lock
+            tasks.append(task)
+
+    # Los archivos de secretos agrupados se escriben a partir de su secreto agrupado, el resto se descarga de forma
+    # individual.
+    individual = download_packs(tasks, lambda secretname: store.fetch_first(secretname, profile, regions, jobs), jobs, force)
+    if len(regions) > 1 and len(individual) > 0:
+        fetch, sources = failover(individual, regions, lambda secret_names, region: aws.retrieve_secrets(secret_names, profile, region))
+    else:
+        fetch, sources = lambda secret_names: aws.retrieve_secrets(secret_names, profile, regions[0]), dict()
+    download(individual, fetch, jobs, force, cache)
+
+    # Registrar los archivos sincronizados en el manifiesto de cada descriptor, con la región de la que se obtuvo
+    # el índice.
+    for task in individual:
+        if task.failed is False and task.index != None:
+            task.lock.update(task.entry, task.index["hash"], sources.get(task.entry.secretname, regions[0]), index.versions(task.index), task.stat)
     for descriptor in descriptors:
-        entries = utils.parse_descriptor_file(descriptor)
-        for entry in entries:
-            print("\n" + utils.bcolors.OKGREEN + "Descargando: " + entry.filename + utils.bcolors.ENDC)
-
-            # Descargar archivo de indice desde secrets manager.
-            indexname = entry.secretname + ".index"
-            print("Obteniendo índice: " + indexname)
-            value, err = aws.retrieve_secret(indexname, profile, region)
-            if err != None:
-                print("Error: " + str(err))
-                print(utils.bcolors.FAIL + "Error: no se pudo descargar el archivo índice." + utils.bcolors.ENDC)
-                continue
+        descriptor.lock.save()
+    return tasks
+
 
-            # El valor del indice es un json con los siguientes campos:
-            # - hash: hash sha256 de archivo completo.
-            # - parts: cantidad de partes en la que se divide el archivo.
-            print("Archivo índice: ok.")
-            value = json.loads(value)
-
-            # Descargar partes.
-            partsnum = value["parts"]
-            partsok = True
-            partsbuff = list()
-            for i in range(partsnum):
-                print("Descargando parte: {0}/{1}".format(i+1, partsnum))
-                partname = entry.secretname + ".{0}".format(i)
-                part_value, part_err = aws.retrieve_secret(partname, profile, region)
-                if part_err != None:
-                    print("Error: " + str(part_err))
-                    partsok = False
-                    break
-
-                # Acumular partes en buffer.
-                partsbuff.append(part_value)
-
-            # Control.
-            if partsok is False:
-                print(utils.bcolors.FAIL + "Error: no se pudo descargar el archivo." + utils.bcolors.ENDC)
+def failover(tasks: list[DownloadTask], regions: list[str], retrieve) -> tuple[any, dict[str, str]]:
+    """
+    Obtiene los índices de los archivos indicados de todas las regiones en paralelo, y retorna una función para obtener
+    secretos que, para cada archivo, utiliza las regiones cuyo índice es consistente, de la más rápida a la más lenta,
+    pasando a la siguiente ante errores. Dos índices son consistentes si coinciden el hash del archivo y los nombres de
+    sus partes. Si las regiones no coinciden, se utiliza el índice de la mayoría o, ante un empate, el de la región más
+    rápida, y se advierte sobre el resto.
+    Parameters:
+        tasks: Archivos a descargar.
+        regions: Regiones candidatas.
+        retrieve: Función que recibe una lista de nombres de secretos y una región, y retorna un diccionario con una
+            tupla (valor, error) por cada nombre, ver aws.retrieve_secrets.
+    Returns:
+        Función a utilizar como `fetch` en download, y región elegida para cada archivo, por nombre de secreto.
+    """
+    secretnames = list(dict.fromkeys(task.entry.secretname for task in tasks))
+    indexnames = [index.index_name(secretname) for secretname in secretnames]
+
+    # Obtener los índices de todas las regiones en paralelo, midiendo la latencia de cada región. Las regiones sin
+    # ningún índice disponible se ubican al final.
+    def probe(region: str):
+        start = time.perf_counter()
+        results = retrieve(indexnames, region)
+        return time.perf_counter() - start, results
+
+    latencies = dict()
+    probes = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(regions)) as executor:
+        futures = {region: executor.submit(probe, region) for region in regions}
+        for region, future in futures.items():
+            try:
+                latencies[region], probes[region] = future.result()
+            except Exception as e:
+                latencies[region], probes[region] = math.inf, {name: (None, e) for name in indexnames}
+            available = len([value for value, err in probes[region].values() if err == None and value != None])
+            if available == 0:
+                latencies[region] = math.inf
+            print("Región \"{0}\": {1} de {2} índices, {3}.".format(region or "por defecto", available, len(indexnames), "{0:.0f}ms".format(latencies[region] * 1000) if latencies[region] != math.inf else "sin respuesta"))
+    order = sorted(regions, key=lambda region: latencies[region])
+
+    # Regiones consistentes para cada archivo, de la más rápida a la más lenta.
+    candidates = dict()
+    for secretname, indexname in zip(secretnames, indexnames):
+        keys = dict()
+        for region in order:
+            value, err = probes[region].get(indexname, (None, None))
+            if err != None or value == None:
+                continue
+            try:
+                parsed = index.parse(value)
+                names = index.tables(secretname, parsed) if parsed["v"] == index.TABLES_VERSION else [name for name, _ in index.parts(secretname, parsed)]
+                keys[region] = (parsed["hash"], tuple(names))
+            except Exception:
                 continue
+        candidates[secretname] = list()
+        if len(keys) == 0:
+            continue
+        counts = collections.Counter(keys.values())
+        chosen = next(keys[region] for region in order if region in keys and counts[keys[region]] == max(counts.values()))
+        candidates[secretname] = [region for region in order if keys.get(region) == chosen]
+        stale = [region or "por defecto" for region in order if keys.get(region) != chosen]
+        if len(stale) > 0:
+            print(utils.bcolors.WARNING + "Advertencia: índice inconsistente o inexistente para " + secretname + " en: " + ", ".join(stale) + "." + utils.bcolors.ENDC)
+    sources = {secretname: found[0] for secretname, found in candidates.items() if len(found) > 0}
 
-            # Recrear archivo.
-            targetfile = os.path.join(cwd, entry.filename)
-            if (os.path.exists(targetfile)):
-                print("Sobreescribiendo archivo ...")
+    def fetch(secret_names: list[str]) -> dict[str, tuple[str | bytes, None] | tuple[None, Exception]]:
+        """
+        Obtiene los secretos indicados: los índices, de la región elegida al comparar regiones, y las partes de las
+        regiones consistentes con su índice, pasando a la siguiente región ante errores. Los índices obtenidos al
+        comparar regiones se utilizan una única vez: si se vuelven a solicitar, ver reread, se obtienen nuevamente.
+        """
+        results = dict()
+        remaining = list()
+        for name in secret_names:
+            # El sufijo de índices y partes no contiene puntos.
+            secretname = name.rsplit(".", 1)[0]
+            region = sources.get(secretname, order[0])
+            if name == index.index_name(secretname) and name in probes[region]:
+                results[name] = probes[region].pop(name)
             else:
-                print("Creando archivo ...")
+                remaining.append(name)
+
+        attempt = 0
+        while len(remaining) > 0:
+            groups = dict()
+            for name in remaining:
+                found = candidates.get(name.rsplit(".", 1)[0]) or order
+                if attempt < len(found):
+                    groups.setdefault(found[attempt], list()).append(name)
+            if len(groups) == 0:
+                break
+            if attempt > 0:
+                print(utils.bcolors.WARNING + "Advertencia: reintentando {0} secretos en {1}.".format(sum(len(names) for names in groups.values()), ", ".join(region or "región por defecto" for region in groups.keys())) + utils.bcolors.ENDC)
+            for region, names in groups.items():
+                try:
+                    values = retrieve(names, region)
+                except Exception as e:
+                    values = {name: (None, e) for name in names}
+                for name in names:
+                    results[name] = values.get(name, (None, RuntimeError("No se obtuvo el secreto " + name)))
+            remaining = [name for name in remaining if results[name][1] != None]
+            attempt = attempt + 1
+        return results
 
-            # Escritura de contenido.
+    return fetch, sources
+
+
+def download_packs(tasks: list[DownloadTask], read, jobs: int = 1, force: bool = False) -> list[DownloadTask]:
+    """
+    Obtiene los secretos agrupados de los archivos de descriptores con @pack, de forma simultánea, y escribe los
+    archivos que contienen, verificando el hash de cada uno, ver unpack. Retorna los archivos restantes, no incluidos en
+    ningún secreto agrupado o cuyo secreto agrupado aún no existe, a descargar de forma individual.
+    Parameters:
+        tasks: Archivos a descargar.
+        read: Función que recibe el nombre de un secreto agrupado y retorna su índice, contenido y región, ver
+            store.fetch_first.
+        jobs: Cantidad de secretos agrupados a obtener de forma simultánea.
+        force: Escribir los archivos aunque el contenido local coincida con el remoto.
+    """
+    names = list(dict.fromkeys(task.entry.pack for task in tasks if task.entry.pack != None))
+    if len(names) == 0:
+        return tasks
+
+    results = dict()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(names)))) as executor:
+        futures = {name: executor.submit(read, name) for name in names}
+        for name, future in futures.items():
             try:
-                with open(targetfile, "w", encoding="utf-8") as file:
-                    for partsbuff_entry in partsbuff:
-                        # Decodificar desde base64.
-                        plain = base64.b64decode(partsbuff_entry).decode("utf-8")
-                        file.write(plain)
-                        file.flush()
-                print("Escritura: ok.")
+                packed_index, payload, region = future.result()
+                with tracer.phase("encoding"):
+                    results[name] = (packed_index, payload, pack.parse(payload), region)
             except Exception as e:
-                print("Error: " + str(e))
-                print(utils.bcolors.FAIL + "Error: no se pudo escribir el archivo." + utils.bcolors.ENDC)
+                results[name] = e
+
+    remaining = list()
+    for task in tasks:
+        result = results.get(task.entry.pack)
+        if result == None or aws.not_found(result) or (isinstance(result, Exception) is False and task.entry.secretname not in result[2]):
+            remaining.append(task)
+            continue
+        task.log("\n" + utils.bcolors.OKGREEN + "Descargando: " + task.entry.filename + utils.bcolors.ENDC)
+        task.log("Secreto agrupado: " + task.entry.pack)
+        if isinstance(result, Exception):
+            task.log("Error: " + str(result))
+            task.log(utils.bcolors.FAIL + "Error: no se pudo obtener el secreto agrupado." + utils.bcolors.ENDC)
+            task.failed = True
+            task.flush()
+            continue
+        packed_index, payload, table, region = result
+        unpack(task, payload, table[task.entry.secretname], force)
+        if task.failed is False and task.lock != None:
+            task.lock.update(task.entry, table[task.entry.secretname]["hash"], region, index.versions(packed_index), task.stat)
+        task.flush()
+    return remaining
+
+
+def unpack(task: DownloadTask, payload: bytes, item: dict, force: bool = False) -> None:
+    """
+    Escribe un archivo a partir de un secreto agrupado, verificando su hash. Si el archivo local ya tiene el contenido
+    indicado, se omite.
+    Parameters:
+        task: Archivo a escribir.
+        payload: Contenido agrupado.
+        item: Entrada del archivo en la tabla del contenido agrupado, ver pack.parse.
+        force: Escribir el archivo aunque el contenido local coincida con el remoto.
+    """
+    try:
+        if force is False and os.path.exists(task.targetfile):
+            task.stat = lockfile.file_stat(task.targetfile)
+            with tracer.phase("hashing"):
+                file_hash = task.lock.local_hash(task.entry, task.targetfile) if task.lock != None else utils.hash_file(task.targetfile)
+            if file_hash == item["hash"]:
+                task.log("Sin cambios, se omite.")
+                task.skipped = True
+                return
+
+        with tracer.phase("hashing"):
+            data = pack.extract(payload, item)
+        exists = os.path.exists(task.targetfile)
+        with tracer.phase("write"):
+            task.writer = utils.AtomicWriter(task.targetfile)
+            task.writer.write(data)
+            committed = task.writer.commit(item["hash"])
+        if committed is False:
+            raise ValueError("El contenido escrito no coincide con el secreto agrupado.")
+        task.stat = lockfile.file_stat(task.targetfile)
+        task.log("Archivo sobreescrito." if exists else "Archivo creado.")
+        task.log("Comprobación: ok.")
+    except Exception as e:
+        if task.writer != None:
+            task.writer.abort()
+        task.log("Error: " + str(e))
+        task.log(utils.bcolors.FAIL + "Error: no se pudo escribir el archivo." + utils.bcolors.ENDC)
+        task.failed = True
+
+
+def download(tasks: list[DownloadTask], fetch, jobs: int = 1, force: bool = False, cache: secret_cache.SecretCache | None = None) -> list[DownloadTask]:
+    """
+    Descarga los archivos indicados utilizando hasta `jobs` descargas simultáneas. Primero se encolan los índices de
+    todas las entradas y, a medida que cada índice se resuelve, se encolan sus partes. Los secretos se solicitan en
+    lotes de hasta aws.BATCH_SIZE nombres, combinando índices y partes de distintas entradas. Las partes de cada
+    archivo se escriben en orden a medida que llegan, en un archivo temporal que reemplaza al archivo local solo si su
+    hash coincide con el del índice. De cada archivo se solicitan a lo sumo `jobs` * WINDOW_FACTOR * aws.BATCH_SIZE
+    partes por delante de la última parte escrita, de manera que la memoria no dependa del tamaño del archivo. Los
+    errores de cada archivo se informan de forma independiente al resto. Los archivos locales cuyo hash coincide con
+    el del índice se omiten sin descargar sus partes, salvo que se indique `force`. Si se indica una caché, las partes
+    cuyo VersionId figura en el índice se obtienen de ella sin descargarlas, y las partes descargadas se registran en
+    ella.
+    Parameters:
+        tasks: Archivos a descargar.
+        fetch: Función que recibe una lista de nombres de secretos y retorna un diccionario con una tupla (valor, error)
+            por cada nombre, ver aws.retrieve_secrets.
+        jobs: Cantidad de descargas simultáneas.
+        force: Descargar los archivos aunque el contenido local coincida con el remoto.
+        cache: Caché local de partes, si hubiere.
+    """
+    jobs = max(1, jobs)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Futuros pendientes, asociados a los secretos solicitados en cada lote. Cada secreto se identifica por su
+        # nombre, tarea y número de parte (None para el índice).
+        futures = dict()
+
+        # Secretos pendientes de ser solicitados.
+        queue = list()
+
+        def submit(partial: bool) -> None:
+            """
+            Agrupa los secretos pendientes en lotes y los solicita. Los lotes incompletos solo se solicitan si se indica
+            `partial`, o si hay lugar disponible en el pool.
+            """
+            while len(queue) >= aws.BATCH_SIZE or (len(queue) > 0 and (partial or len(futures) < jobs)):
+                batch = queue[:aws.BATCH_SIZE]
+                del queue[:aws.BATCH_SIZE]
+                futures[executor.submit(fetch, [name for name, _, _ in batch])] = batch
+
+        # Encolar índices.
+        for task in tasks:
+            task.log("\n" + utils.bcolors.OKGREEN + "Descargando: " + task.entry.filename + utils.bcolors.ENDC)
+            indexname = index.index_name(task.entry.secretname)
+            task.log("Obteniendo índice: " + indexname)
+            task.window = jobs * WINDOW_FACTOR * aws.BATCH_SIZE
+            queue.append((indexname, task, None))
+        submit(True)
+
+        while len(futures) > 0:
+            done, _ = concurrent.futures.wait(futures.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                batch = futures.pop(future)
+                try:
+                    results = future.result()
+                except Exception as e:
+                    results = {name: (None, e) for name, _, _ in batch}
+
+                for name, task, partno in batch:
+                    if task.failed:
+                        continue
+
+                    value, err = results.get(name, (None, RuntimeError("No se obtuvo el secreto " + name)))
+                    if partno == None:
+                        on_index(task, value, err, queue, force, cache)
+                    elif partno == TABLE:
+                        on_table(task, name, value, err, queue, force, cache)
+                    else:
+                        on_part(task, name, partno, value, err, queue, cache)
+
+                    # Finalizar archivo.
+                    if task.failed or task.skipped or (task.index != None and task.pending == 0):
+                        finish(task)
+
+            submit(len(futures) == 0)
+
+    return tasks
+
+
+def on_index(task: DownloadTask, value: str, err: Exception, queue: list, force: bool, cache: secret_cache.SecretCache | None = None) -> None:
+    """
+    Procesa el índice descargado de un archivo y encola la descarga de sus partes. Si el archivo local ya tiene el
+    contenido indicado por el índice, se omite. Para índices v2, las partes que ya se encuentran en el archivo local
+    o en la caché, para el mismo VersionId, se reutilizan sin descargarlas. Para índices v3, primero se encolan sus
+    tablas de partes, ver on_table.
+    """
+    if err == None:
+        try:
+            task.index = index.parse(value)
+        except Exception as e:
+            err = e
+    if err != None:
+        task.log("Error: " + str(err))
+        task.log(utils.bcolors.FAIL + "Error: no se pudo descargar el archivo índice." + utils.bcolors.ENDC)
+        task.failed = True
+        return
+    if task.replaced != None and index.generation(task.index) == task.replaced:
+        task.log("Error: el índice no fue reemplazado y faltan partes de la generación {0}.".format(task.replaced))
+        task.log(utils.bcolors.FAIL + "Error: no se pudo descargar el archivo." + utils.bcolors.ENDC)
+        task.failed = True
+        return
+
+    # El valor del indice es un json con los siguientes campos:
+    # - hash: hash md5 de archivo completo.
+    # - parts (v1): cantidad de partes en la que se divide el archivo.
+    # - chunks (v2): clave, hash y tamaño de cada parte.
+    task.log("Archivo índice: ok.")
+
+    # Omitir archivos sin cambios. Con manifiesto, el hash local solo se calcula si el archivo cambió desde la última
+    # sincronización.
+    if force is False and os.path.exists(task.targetfile):
+        try:
+            task.stat = lockfile.file_stat(task.targetfile)
+            with tracer.phase("hashing"):
+                file_hash = task.lock.local_hash(task.entry, task.targetfile) if task.lock != None else utils.hash_file(task.targetfile)
+            if file_hash == task.index["hash"]:
+                task.log("Sin cambios, se omite.")
+                task.skipped = True
+                return
+        except Exception as e:
+            task.log("Advertencia: " + str(e))
+
+    # Índices v3: las partes se encolan una vez obtenidas todas sus tablas.
+    tablenames = index.tables(task.entry.secretname, task.index)
+    if len(tablenames) > 0:
+        task.log("Tablas de partes: {0}".format(len(tablenames)))
+        for name in tablenames:
+            task.pending = task.pending + 1
+            queue.append((name, task, TABLE))
+        return
+    queue_parts(task, queue, force, cache)
+
+
+def on_table(task: DownloadTask, name: str, value: str, err: Exception, queue: list, force: bool, cache: secret_cache.SecretCache | None = None) -> None:
+    """
+    Procesa una tabla de partes descargada de un índice v3. Una vez obtenidas todas sus tablas, se encolan las partes
+    del archivo, ver queue_parts.
+    """
+    task.pending = task.pending - 1
+    task.tables[name] = (value, err)
+    if task.pending > 0:
+        return
+    try:
+        task.index = index.attach(task.entry.secretname, task.index, task.tables)
+    except Exception as e:
+        task.log("Error: " + str(e))
+        task.log(utils.bcolors.FAIL + "Error: no se pudo descargar la tabla de partes del índice." + utils.bcolors.ENDC)
+        task.failed = True
+        return
+    queue_parts(task, queue, force, cache)
+
+
+def queue_parts(task: DownloadTask, queue: list, force: bool, cache: secret_cache.SecretCache | None = None) -> None:
+    """
+    Determina las partes de un archivo disponibles en el archivo local y encola las primeras partes a descargar, ver
+    on_index y advance.
+    """
+    # Partes disponibles en el archivo local.
+    task.parts = index.parts(task.entry.secretname, task.index)
+    task.hashes = [chunk_hash for _, chunk_hash in task.parts]
+    task.versions = index.versions(task.index)
+    local = dict()
+    if force is False and task.index["v"] != 1 and os.path.exists(task.targetfile):
+        with tracer.phase("hashing"):
+            local = read_local_chunks(task, set(task.hashes))
+    for i, chunk_hash in enumerate(task.hashes):
+        if chunk_hash in local:
+            task.local[i] = local[chunk_hash]
+    if len(local) > 0:
+        task.log("Partes locales reutilizadas: {0}/{1}".format(len(task.local), len(task.parts)))
+
+    # Crear archivo temporal.
+    try:
+        task.writer = utils.AtomicWriter(task.targetfile)
+    except Exception as e:
+        task.log("Error: " + str(e))
+        task.log(utils.bcolors.FAIL + "Error: no se pudo escribir el archivo." + utils.bcolors.ENDC)
+        task.failed = True
+        return
+    advance(task, queue, cache)
+
+
+def read_local_chunks(task: DownloadTask, hashes: set[str]) -> dict[str, tuple[int, int]]:
+    """
+    Divide el archivo local existente en partes delimitadas por contenido, con los parámetros de corte del codec y
+    modo de almacenamiento del índice remoto, y retorna la ubicación (offset, tamaño) de aquellas cuyo hash figura en
+    el índice. Al subir, las partes comprimidas que no entran en un secreto se subdividen a la mitad, ver
+    opt_upload.iter_encoded_chunks: para índices comprimidos, las partes locales que no figuran en el índice se
+    subdividen de la misma manera, sin comprimirlas, mientras sus mitades puedan coincidir con el tamaño de alguna
+    parte del índice.
+    Parameters:
+        task: Archivo a descargar.
+        hashes: Hashes de las partes del índice remoto.
+    """
+    local = dict()
+    offset = 0
+    chunk_codec = index.index_codec(task.index)
+    parameters = index.chunk_parameters(chunk_codec, index.index_mode(task.index))
+    sizes = set(chunk["size"] for chunk in task.index["chunks"])
+    smallest = min(sizes) if len(sizes) > 0 else 0
+    try:
+        with open(task.targetfile, "rb") as file:
+            for data in chunking.iter_chunks(file, *parameters):
+                pending = [(offset, data)]
+                while len(pending) > 0:
+                    start, piece = pending.pop()
+                    if len(piece) in sizes:
+                        chunk_hash = chunking.hash_chunk(piece)
+                        if chunk_hash in hashes:
+                            local[chunk_hash] = (start, len(piece))
+                            continue
+                    half = len(piece) // 2
+                    if chunk_codec != codec.NONE and half > 0 and len(piece) - half >= smallest:
+                        pending.append((start + half, piece[half:]))
+                        pending.append((start, piece[:half]))
+                offset += len(data)
+    except Exception as e:
+        task.log("Advertencia: " + str(e))
+        return dict()
+    return local
+
+
+def on_part(task: DownloadTask, partname: str, partno: int, value: str, err: Exception, queue: list, cache: secret_cache.SecretCache | None = None) -> None:
+    """
+    Procesa una parte descargada de un archivo, la registra en la caché si se indica, escribe las partes disponibles
+    en orden y encola las siguientes, ver advance. Ante un error, las partes restantes del mismo archivo se descartan.
+    Si falta una parte de un índice con generación, el índice pudo ser reemplazado por una subida posterior y sus
+    partes eliminadas por gc: una única vez, se vuelve a obtener el índice, ver reread.
+    """
+    # Índice reemplazado: se descartan las partes en curso y, una vez recibidas todas, se vuelve a obtener el índice.
+    if task.replaced != None and task.replaced == index.generation(task.index):
+        task.pending = task.pending - 1
+        if task.pending == 0:
+            reread(task, queue)
+        return
+
+    if err == None:
+        try:
+            # Decodificar, descomprimir y verificar el hash de la parte, si el índice lo incluye.
+            with tracer.phase("encoding"):
+                data = index.decode_part(value, index.index_mode(task.index))
+                data = codec.decompress(data, index.index_codec(task.index))
+            with tracer.phase("hashing"):
+                valid = task.hashes[partno] == None or chunking.hash_chunk(data) == task.hashes[partno]
+            if valid is False:
+                raise ValueError("El contenido de la parte {0} no coincide con su hash.".format(partno + 1))
+        except Exception as e:
+            err = e
+    if err != None:
+        if aws.not_found(err) and index.generation(task.index) != None and task.replaced == None:
+            task.log("La parte {0} no existe: la generación {1} del índice pudo ser reemplazada por una subida posterior y sus partes eliminadas por gc.".format(partno + 1, index.generation(task.index)))
+            task.replaced = index.generation(task.index)
+            task.pending = task.pending - 1
+            if task.pending == 0:
+                reread(task, queue)
+            return
+        task.log("Error: " + str(err))
+        task.log(utils.bcolors.FAIL + "Error: no se pudo descargar el archivo." + utils.bcolors.ENDC)
+        task.failed = True
+        return
+
+    task.log("Descargando parte: {0}/{1}".format(partno + 1, len(task.hashes)))
+    if cache != None and task.hashes[partno] != None:
+        cache.put(partname, task.versions[partno], data)
+    task.buffer[partno] = data
+    task.pending = task.pending - 1
+    advance(task, queue, cache)
+
+
+def reread(task: DownloadTask, queue: list) -> None:
+    """
+    Descarta el estado de descarga de un archivo cuyo índice fue reemplazado y encola nuevamente su índice. Si la
+    generación del índice obtenido es la misma, el archivo falla, ver on_index.
+    """
+    if task.writer != None:
+        task.writer.abort()
+    task.index = None
+    task.tables = dict()
+    task.parts = list()
+    task.hashes = list()
+    task.versions = list()
+    task.local = dict()
+    task.buffer = dict()
+    task.written = 0
+    task.requested = 0
+    task.cached = 0
+    task.pending = 0
+    task.writer = None
+    indexname = index.index_name(task.entry.secretname)
+    task.log("Obteniendo índice: " + indexname)
+    queue.append((indexname, task, None))
+
+
+def advance(task: DownloadTask, queue: list, cache: secret_cache.SecretCache | None = None) -> None:
+    """
+    Escribe en el archivo temporal, en orden, las partes disponibles a continuación de la última parte escrita, y
+    encola la descarga de las partes siguientes hasta `task.window` partes por delante de la última parte escrita, de
+    manera que las partes en espera de ser escritas no superen la ventana. Las partes locales se leen del archivo local
+    existente, que no se modifica hasta finalizar la descarga. Si se indica una caché, las partes cuyo VersionId figura
+    en el índice se obtienen de ella sin descargarlas.
+    """
+    while task.failed is False:
+        write_parts(task)
+        available = False
+        while task.failed is False and task.requested < len(task.parts) and task.requested < task.written + task.window:
+            partno = task.requested
+            task.requested = task.requested + 1
+            if partno < task.written:
+                continue
+            if partno in task.local:
+                available = True
                 continue
+            partname, chunk_hash = task.parts[partno]
+            if cache != None and chunk_hash != None:
+                data = cache.get(partname, task.versions[partno])
+                if data != None and chunking.hash_chunk(data) == chunk_hash:
+                    task.buffer[partno] = data
+                    task.cached = task.cached + 1
+                    available = True
+                    continue
+            task.pending = task.pending + 1
+            queue.append((partname, task, partno))
+        if available is False:
+            return
 
-            # Comprobación de contenido escrito.
-            target = value["hash"]
-            effective = utils.hash_file(targetfile)
-            if target == effective:
-                print("Comprobación: ok.")
+
+def write_parts(task: DownloadTask) -> None:
+    """
+    Escribe en el archivo temporal, en orden, las partes disponibles a continuación de la última parte escrita, ver
+    advance.
+    """
+    try:
+        while task.written < len(task.hashes):
+            partno = task.written
+            if partno in task.buffer:
+                data = task.buffer.pop(partno)
+            elif partno in task.local:
+                offset, size = task.local.pop(partno)
+                with open(task.targetfile, "rb") as file:
+                    file.seek(offset)
+                    data = file.read(size)
+                with tracer.phase("hashing"):
+                    changed = chunking.hash_chunk(data) != task.hashes[partno]
+                if changed:
+                    raise ValueError("El archivo local cambió durante la descarga.")
             else:
-                print("Comprobación: ko.")
+                break
+            with tracer.phase("write"):
+                task.writer.write(data)
+            task.written = task.written + 1
+    except Exception as e:
+        task.log("Error: " + str(e))
+        task.log(utils.bcolors.FAIL + "Error: no se pudo escribir el archivo." + utils.bcolors.ENDC)
+        task.failed = True
+
+
+def finish(task: DownloadTask) -> None:
+    """
+    Reemplaza el archivo local por el archivo temporal, si su contenido coincide con el índice, o lo descarta en caso
+    contrario. Imprime los mensajes registrados para el archivo.
+    """
+    if task.failed or task.skipped:
+        if task.writer != None:
+            task.writer.abort()
+        task.flush()
+        return
+
+    if task.cached > 0:
+        task.log("Partes en caché reutilizadas: {0}/{1}".format(task.cached, len(task.parts)))
+
+    # Comprobación de contenido escrito y reemplazo del archivo local.
+    try:
+        exists = os.path.exists(task.targetfile)
+        with tracer.phase("write"):
+            committed = task.writer.commit(task.index["hash"])
+        if committed:
+            task.stat = lockfile.file_stat(task.targetfile)
+            task.log("Archivo sobreescrito." if exists else "Archivo creado.")
+            task.log("Escritura: ok.")
+            task.log("Comprobación: ok.")
+        else:
+            task.log("Comprobación: ko.")
+            task.log(utils.bcolors.FAIL + "Error: el contenido descargado no coincide con el índice, no se modificó el archivo." + utils.bcolors.ENDC)
+            task.failed = True
+    except Exception as e:
+        task.writer.abort()
+        task.log("Error: " + str(e))
+        task.log(utils.bcolors.FAIL + "Error: no se pudo escribir el archivo." + utils.bcolors.ENDC)
+        task.failed = True
+    task.flush()
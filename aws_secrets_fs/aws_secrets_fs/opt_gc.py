@@ -0,0 +1,95 @@
+from . import utils
+from . import aws
+from . import index
+from . import plan as planner
+from .trace import tracer
+from . import opt_delete
+
+
+# Período de gracia por defecto, en segundos. Solo se eliminan las partes sin referencia de índices registrados hace más
+# tiempo, de manera que las descargas que obtuvieron el índice anterior puedan completarse, y que a su vez no se hayan
+# modificado en ese período, ya que pueden pertenecer a una subida en curso cuyo índice aún no se registró.
+GRACE = 3600
+
+
+def run(cwd: str, profile: str, region: str, jobs: int = 1, dry_run: bool = False, recursive: bool = False, ignore: list[str] | None = None, grace: float = GRACE) -> None:
+    """
+    Elimina las partes remotas de los archivos indicados en los descriptores que no son referenciadas por su índice:
+    partes v1 con número mayor o igual a la cantidad de partes del índice, y partes o tablas de partes de generaciones
+    anteriores o de otras versiones de índice. Se conservan las partes que pueden estar en uso, ver GRACE.
+    Parameters:
+        cwd: Carpeta de trabajo.
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+        jobs: Cantidad de eliminaciones simultáneas.
+        dry_run: Solo listar las partes a eliminar.
+        recursive: Buscar descriptores también en subcarpetas.
+        ignore: Patrones glob de carpetas o descriptores a omitir en la búsqueda recursiva.
+        grace: Período de gracia, en segundos.
+    """
+    # Obtener descriptores en carpeta actual.
+    with tracer.phase("discovery"):
+        descriptors = utils.get_descriptor_files(cwd, recursive, ignore)
+    if (len(descriptors) == 0):
+        print("No se encontraron archivos descriptores.")
+        exit(1)
+
+    # Incluir los secretos agrupados de descriptores con @pack.
+    secretnames = list()
+    for descriptor in descriptors:
+        for entry in utils.parse_descriptor_file(descriptor):
+            secretnames.append(entry.secretname)
+            if entry.pack != None and entry.pack not in secretnames:
+                secretnames.append(entry.pack)
+
+    # Obtener secretos existentes e índices.
+    plan = opt_delete.scan([secretname + "." for secretname in secretnames], profile, region)
+    indexnames = [index.index_name(secretname) for secretname in secretnames if plan.exists(index.index_name(secretname))]
+    plan.fetched(len(indexnames))
+    indexes = aws.retrieve_secrets(indexnames, profile, region) if len(indexnames) > 0 else dict()
+
+    # Obtener las tablas de partes de los índices v3.
+    parsed = dict()
+    for secretname in secretnames:
+        value, err = indexes.get(index.index_name(secretname), (None, None))
+        try:
+            parsed[secretname] = index.parse(value) if err == None and value != None else None
+        except Exception:
+            parsed[secretname] = None
+    tablenames = [name for secretname, value in parsed.items() if value != None for name in index.tables(secretname, value)]
+    plan.fetched(len(tablenames))
+    tables = aws.retrieve_secrets(tablenames, profile, region) if len(tablenames) > 0 else dict()
+
+    recent = 0
+    for secretname in secretnames:
+        indexname = index.index_name(secretname)
+        if indexname not in indexes:
+            continue
+        value, err = indexes[indexname]
+        try:
+            if err != None:
+                raise err
+            referenced = set(index.references(secretname, index.attach(secretname, index.parse(value), tables)))
+        except Exception as e:
+            # Sin índice válido no es posible determinar qué partes están en uso.
+            print(utils.bcolors.WARNING + "Advertencia: se omite " + secretname + ", no se pudo obtener su índice. " + str(e) + utils.bcolors.ENDC)
+            continue
+        for name in index.orphans(secretname, plan.existing.keys(), referenced):
+            if expired(plan, indexname, grace) and expired(plan, name, grace):
+                plan.add(planner.DELETE, name)
+            else:
+                recent = recent + 1
+
+    if recent > 0:
+        print("Se conservan {0} partes sin referencia modificadas hace menos de {1:g} segundos.".format(recent, grace))
+    opt_delete.execute(plan, profile, region, jobs, dry_run)
+
+
+def expired(plan: planner.Plan, secret_name: str, grace: float) -> bool:
+    """
+    Verifica si un secreto se modificó por última vez hace más de `grace` segundos. Si se desconoce, se considera
+    reciente.
+    """
+    age = plan.age(secret_name)
+    return age != None and age >= grace
+
@@ -0,0 +1,48 @@
+import os
+from . import utils
+from . import store
+from . import lock as lockfile
+from .trace import tracer
+
+
+def run(cwd: str, recursive: bool = False, ignore: list[str] | None = None) -> None:
+    """
+    Imprime el estado de los archivos indicados en los descriptores respecto de la última sincronización, según el
+    manifiesto de cada descriptor, sin acceder a AWS. Solo se calcula el hash de los archivos cuyo tamaño o fecha de
+    modificación cambió.
+    Parameters:
+        cwd: Carpeta de trabajo.
+        recursive: Buscar descriptores también en subcarpetas.
+        ignore: Patrones glob de carpetas o descriptores a omitir en la búsqueda recursiva.
+    """
+    # Obtener descriptores en carpeta actual.
+    with tracer.phase("discovery"):
+        descriptors = store.descriptors(cwd, recursive, ignore)
+    if (len(descriptors) == 0):
+        print("No se encontraron archivos descriptores.")
+        exit(1)
+
+    counts = {state: 0 for state in lockfile.STATES}
+    for descriptor in descriptors:
+        for entry in descriptor.entries:
+            targetfile = descriptor.targetfile(entry)
+            try:
+                with tracer.phase("hashing"):
+                    state = descriptor.lock.status(entry, targetfile)
+            except Exception as e:
+                print(utils.bcolors.WARNING + "Advertencia: " + str(e) + utils.bcolors.ENDC)
+                state = lockfile.MODIFIED
+            counts[state] += 1
+            color = utils.bcolors.OKGREEN if state == lockfile.UNCHANGED else utils.bcolors.WARNING
+            print("{0}{1:<14}{2}{3}".format(color, state, utils.bcolors.ENDC, os.path.relpath(targetfile, cwd)))
+        descriptor.lock.save()
+
+    color = utils.bcolors.WARNING if counts[lockfile.UNCHANGED] < sum(counts.values()) else utils.bcolors.OKCYAN
+    print("\n{0}Resumen: {1} sin cambios, {2} modificados, {3} inexistentes, {4} sin registro.{5}".format(
+        color,
+        counts[lockfile.UNCHANGED],
+        counts[lockfile.MODIFIED],
+        counts[lockfile.MISSING],
+        counts[lockfile.UNTRACKED],
+        utils.bcolors.ENDC
+    ))
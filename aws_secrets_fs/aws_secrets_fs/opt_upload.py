@@ -1,101 +1,670 @@
+import concurrent.futures
+import hashlib
+import io
 import os
-import json
-import base64
-from botocore.exceptions import ClientError
 from . import utils
 from . import aws
+from . import chunking
+from . import codec
+from . import index
+from . import lock as lockfile
+from . import pack
+from . import plan as planner
+from . import store
+from .trace import tracer
 
 
-def run(cwd: str, profile: str, region: str):
+# Número de parte con el que se identifican los envíos de tablas de partes de un índice v3, ver on_table.
+TABLE = -1
+
+
+class UploadTask(utils.FileTask):
+    """
+    Estado de subida de una entrada de archivo descriptor.
+    Attributes:
+        hash: Hash md5 del archivo completo.
+        size: Tamaño del archivo completo.
+        remote: Índice remoto existente, si hubiere.
+        chunk_codec: Codec utilizado para comprimir las partes.
+        mode: Modo de almacenamiento de las partes.
+        chunks: Partes del archivo, en orden, según se registran en el índice.
+        written: Cantidad de partes subidas.
+        reused: Cantidad de partes ya existentes en el índice remoto o repetidas en el archivo.
+        pending: Cantidad de partes, o tablas de partes, enviadas pendientes de confirmación.
+        submitted: Indica si ya se enviaron todas las partes del archivo.
+        orphans: Partes remotas que dejan de ser referenciadas por el índice, a eliminar por gc.
+        generation: Identificador de generación con el que se registra el índice, ver index.new_generation.
+        lock_skipped: Indica si el archivo se omitió, sin acceder a AWS, por no tener cambios según el manifiesto.
+        region: Región de destino, al replicar en varias regiones.
+        members: Archivos agrupados, si la tarea corresponde a un secreto agrupado, ver pack.
+        content: Contenido a subir, si no se lee del archivo local, ver pack.build.
+        index_value: Contenido del índice a registrar una vez registradas sus tablas de partes, ver index.build.
+    """
+    hash = ""
+    size = 0
+    remote = None
+    chunk_codec = codec.NONE
+    mode = index.MODE_STRING
+    chunks = None
+    written = 0
+    reused = 0
+    pending = 0
+    submitted = False
+    orphans = None
+    generation = None
+    lock_skipped = False
+    region = None
+    members = None
+    content = None
+    index_value = None
+
+    def __init__(self, entry: utils.DescriptorFileEntry, targetfile: str):
+        """
+        Constructor
+        """
+        super().__init__(entry, targetfile)
+        self.hash = ""
+        self.size = 0
+        self.remote = None
+        self.chunk_codec = codec.NONE
+        self.mode = index.MODE_STRING
+        self.chunks = list()
+        self.written = 0
+        self.reused = 0
+        self.pending = 0
+        self.submitted = False
+        self.orphans = list()
+        self.generation = None
+        self.lock_skipped = False
+        self.region = None
+        self.members = list()
+        self.content = None
+        self.index_value = None
+
+
+def run(cwd: str, profile: str, region: str | list[str], jobs: int = 1, force: bool = False, chunk_codec: str = codec.NONE, mode: str = index.MODE_STRING, recursive: bool = False, ignore: list[str] | None = None, dry_run: bool = False):
     """
     Procesa las entradas en archivos tipo descriptor y se encarga de subir el contenido de los archivos indicados y asociarlos
-    a un secreto de aws secrets manager.
+    a un secreto de aws secrets manager. Los archivos sin cambios desde la última sincronización, según el manifiesto de
+    cada descriptor, se omiten sin acceder a AWS, salvo que se indique `force`.
     Parameters:
         cwd: Carpeta de trabajo.
         profile: Perfil aws a utilizar.
-        region: Región aws a utilizar, si hubiere.
+        region: Región aws a utilizar, si hubiere, o lista de regiones en las que replicar los archivos.
+        jobs: Cantidad de partes a subir de forma simultánea, en cada región.
+        force: Subir los archivos y todas sus partes aunque el contenido remoto coincida con el local.
+        chunk_codec: Codec a utilizar para comprimir las partes.
+        mode: Modo de almacenamiento de las partes, texto en base64 o binario.
+        recursive: Buscar descriptores también en subcarpetas.
+        ignore: Patrones glob de carpetas o descriptores a omitir en la búsqueda recursiva.
+        dry_run: Solo imprimir el plan de operaciones y la cantidad estimada de llamadas, sin modificar secretos.
     """
     # Obtener descriptores en carpeta actual.
-    descriptors = utils.get_descriptor_files(cwd)
+    with tracer.phase("discovery"):
+        descriptors = store.descriptors(cwd, recursive, ignore)
     if (len(descriptors) == 0):
         print("No se encontraron archivos descriptores.")
         exit(1)
 
-    # Extraer entradas de cada archivo descriptor.
+    # Subir.
+    tasks, plans = upload_descriptors(descriptors, profile, store.regions(region), jobs, force, chunk_codec, mode, dry_run)
+    skipped = len([task for task in tasks if task.lock_skipped])
+    if skipped > 0:
+        print("Sin cambios desde la última sincronización: {0} archivos.".format(skipped))
+    if dry_run:
+        for region, plan in plans.items():
+            if len(plans) > 1:
+                print("\n{0}Región \"{1}\":{2}".format(utils.bcolors.OKBLUE, region, utils.bcolors.ENDC))
+            plan.show()
+    else:
+        utils.print_summary(tasks)
+
+
+def upload_descriptors(descriptors: list[store.Descriptor], profile: str, regions: list[str], jobs: int = 1, force: bool = False, chunk_codec: str = codec.NONE, mode: str = index.MODE_STRING, dry_run: bool = False) -> tuple[list[UploadTask], dict[str, planner.Plan]]:
+    """
+    Sube los archivos de los descriptores indicados que cambiaron desde la última sincronización, a todas las
+    regiones, ver sync.
+    Parameters:
+        descriptors: Archivos descriptores.
+        profile: Perfil aws a utilizar.
+        regions: Regiones en las que replicar los archivos.
+        jobs: Cantidad de partes a subir de forma simultánea, en cada región.
+        force: Subir los archivos y todas sus partes aunque el contenido remoto coincida con el local.
+        chunk_codec: Codec a utilizar para comprimir las partes.
+        mode: Modo de almacenamiento de las partes.
+        dry_run: Solo completar el plan de operaciones, sin modificar secretos.
+    Returns:
+        Estado de subida de cada archivo y plan de operaciones de cada región.
+    """
+    tasks = list()
     for descriptor in descriptors:
-        entries = utils.parse_descriptor_file(descriptor)
-        for entry in entries:
-            print("\n" + utils.bcolors.OKGREEN + "Subiendo: " + entry.filename + utils.bcolors.ENDC)
-
-            # El archivo debe existir.
-            targetfile = os.path.join(cwd, entry.filename)
-            if (os.path.exists(targetfile) == False):
-                print(utils.bcolors.FAIL + "Error: el archivo no existe." + utils.bcolors.ENDC)
-                continue
+        for entry in descriptor.entries:
+            task = UploadTask(entry, descriptor.targetfile(entry))
+            task.lock = descriptor.lock
+            tasks.append(task)
+    plans = sync(tasks, profile, regions, jobs, force, chunk_codec, mode, dry_run)
+    return tasks, plans
 
-            # Calcular hash md5 de archivo.
-            print("Calculando valor de comprobación ...")
-            hash_md5 = ""
-            try:
-                hash_md5 = utils.hash_file(targetfile)
-            except Exception as e:
-                print("Error: " + str(e))
-                print(utils.bcolors.FAIL + "Error: no se pudo calcular el valor de comprobación." + utils.bcolors.ENDC)
+
+def sync(tasks: list[UploadTask], profile: str, regions: list[str], jobs: int = 1, force: bool = False, chunk_codec: str = codec.NONE, mode: str = index.MODE_STRING, dry_run: bool = False) -> dict[str, planner.Plan]:
+    """
+    Sube los archivos indicados que cambiaron desde la última sincronización, según el manifiesto de su descriptor, y
+    registra en el manifiesto los archivos sincronizados. Los archivos sin cambios con todas las regiones se omiten sin
+    acceder a AWS, salvo que se indique `force`. Con varias regiones, cada región se sube de forma simultánea con su
+    propio cliente, regulador y plan, y un archivo se considera fallido si falla en alguna de ellas. Los archivos
+    pequeños de descriptores con @pack se suben agrupados, ver group_packs, por lo que deben indicarse todos los
+    archivos del descriptor.
+    Parameters:
+        tasks: Archivos a subir, asociados al manifiesto de su descriptor.
+        profile: Perfil aws a utilizar.
+        regions: Regiones aws a utilizar. "" para la región por defecto del perfil.
+        jobs: Cantidad de partes a subir de forma simultánea, en cada región.
+        force: Subir los archivos y todas sus partes aunque el contenido remoto coincida con el local.
+        chunk_codec: Codec a utilizar para comprimir las partes.
+        mode: Modo de almacenamiento de las partes.
+        dry_run: Solo completar el plan de operaciones, sin modificar secretos.
+    Returns:
+        Plan de operaciones de cada región.
+    """
+    # Omitir, sin acceder a AWS, los archivos sin cambios desde la última sincronización. Un secreto agrupado se
+    # omite si no cambió ninguno de sus archivos.
+    plans = {region: planner.Plan() for region in regions}
+    pending = list()
+    for task in group_packs(tasks):
+        files = task.members if len(task.members) > 0 else [task]
+        if force is False and all(item.lock != None and item.lock.unchanged(item.entry, item.targetfile, regions) for item in files):
+            for item in [task] + task.members:
+                item.skipped = True
+                item.lock_skipped = True
+            for plan in plans.values():
+                plan.add(planner.SKIP, index.index_name(task.entry.secretname))
+        elif len(task.members) > 0 and load_pack(task) is False:
+            task.flush()
+        else:
+            pending.append(task)
+    if len(pending) == 0:
+        return plans
+
+    # Con varias regiones, cada región tiene su propio estado de subida de cada archivo.
+    replicas = {regions[0]: pending}
+    if len(regions) > 1:
+        replicas = dict()
+        for region in regions:
+            replicas[region] = list()
+            for task in pending:
+                replica = UploadTask(task.entry, task.targetfile)
+                replica.region = region
+                replica.members = task.members
+                replica.content = task.content
+                replicas[region].append(replica)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(regions)) as executor:
+            futures = [executor.submit(sync_region, replicas[region], profile, region, plans[region], jobs, force, chunk_codec, mode, dry_run) for region in regions]
+            for future in futures:
+                future.result()
+        for i, task in enumerate(pending):
+            task.failed = any(replicas[region][i].failed for region in regions)
+            task.skipped = all(replicas[region][i].skipped for region in regions)
+    else:
+        sync_region(pending, profile, regions[0], plans[regions[0]], jobs, force, chunk_codec, mode, dry_run)
+    for task in pending:
+        for member in task.members:
+            member.failed = task.failed
+            member.skipped = task.skipped
+
+    # Registrar los archivos sincronizados en el manifiesto de cada descriptor, por región. Los archivos agrupados se
+    # registran con su propio hash y las partes del secreto agrupado.
+    if dry_run is False:
+        locks = list()
+        for i, task in enumerate(pending):
+            for region in regions:
+                replica = replicas[region][i]
+                if replica.failed:
+                    continue
+                files = [(member, member.hash, member.stat) for member in task.members] if len(task.members) > 0 else [(task, replica.hash, replica.stat)]
+                for item, file_hash, stat in files:
+                    if item.lock == None:
+                        continue
+                    item.lock.update(item.entry, file_hash, region, synced_versions(replica), stat)
+                    if item.lock not in locks:
+                        locks.append(item.lock)
+        for descriptor_lock in locks:
+            descriptor_lock.save()
+    return plans
+
+
+def group_packs(tasks: list[UploadTask]) -> list[UploadTask]:
+    """
+    Retorna los archivos a subir, reemplazando los archivos de hasta pack.MAX_SIZE de descriptores con @pack por una
+    tarea por secreto agrupado, cuyos archivos se registran en `members`. Los archivos de mayor tamaño, o inexistentes,
+    se suben de forma individual.
+    """
+    result = list()
+    packs = dict()
+    for task in tasks:
+        stat = lockfile.file_stat(task.targetfile)
+        if task.entry.pack == None or stat == None or stat[0] > pack.MAX_SIZE:
+            result.append(task)
+            continue
+        if task.entry.pack not in packs:
+            packs[task.entry.pack] = UploadTask(utils.DescriptorFileEntry(pack.PACK_DIRECTIVE + " " + task.entry.pack, task.entry.pack), "")
+            result.append(packs[task.entry.pack])
+        packs[task.entry.pack].members.append(task)
+    return result
+
+
+def load_pack(task: UploadTask) -> bool:
+    """
+    Lee los archivos de un secreto agrupado y genera su contenido, registrando el hash, tamaño y fecha de modificación
+    de cada archivo. Ante un error, la tarea y sus archivos se marcan como fallidos.
+    """
+    files = dict()
+    try:
+        for member in task.members:
+            member.stat = lockfile.file_stat(member.targetfile)
+            with open(member.targetfile, "rb") as file:
+                data = file.read()
+            with tracer.phase("hashing"):
+                member.hash = hashlib.md5(data).hexdigest()
+            member.size = len(data)
+            files[member.entry.secretname] = data
+        with tracer.phase("encoding"):
+            task.content = pack.build(files)
+        return True
+    except Exception as e:
+        task.log("\n" + utils.bcolors.OKGREEN + "Subiendo: " + task.entry.filename + utils.bcolors.ENDC)
+        task.log("Error: " + str(e))
+        task.log(utils.bcolors.FAIL + "Error: no se pudieron agrupar los archivos." + utils.bcolors.ENDC)
+        for item in [task] + task.members:
+            item.failed = True
+        return False
+
+
+def sync_region(tasks: list[UploadTask], profile: str, region: str, plan: planner.Plan, jobs: int = 1, force: bool = False, chunk_codec: str = codec.NONE, mode: str = index.MODE_STRING, dry_run: bool = False) -> None:
+    """
+    Obtiene el estado remoto de los archivos indicados en una región y los sube, ver upload.
+    """
+    # Obtener estado remoto de índices y partes en un único recorrido.
+    err = plan.scan([task.entry.secretname + "." for task in tasks], lambda prefixes, token: aws.list_secrets(prefixes, token, profile, region))
+    if err != None:
+        print(utils.bcolors.WARNING + "Advertencia: no se pudo obtener el estado remoto, se intentará actualizar cada secreto antes de crearlo. " + str(err) + utils.bcolors.ENDC)
+
+    put = lambda secret_name, secret_value, exists: put_secret(secret_name, secret_value, profile, region, exists)
+    fetch = lambda secret_names: aws.retrieve_secrets(secret_names, profile, region)
+    upload(tasks, put, fetch, jobs, force, chunk_codec, mode, plan, dry_run)
+
+
+def synced_versions(task: UploadTask) -> list[str | None]:
+    """
+    Retorna el VersionId de cada parte del índice remoto de un archivo sincronizado: el índice subido o, si se omitió
+    por no tener cambios, el índice remoto existente.
+    """
+    if task.skipped and task.remote != None:
+        return index.versions(task.remote)
+    return [chunk.get("version") for chunk in task.chunks]
+
+
+def put_secret(secret_name: str, secret_value: str | bytes, profile: str, region: str, exists: bool | None = None) -> tuple[any, None] | tuple[None, Exception]:
+    """
+    Crea o actualiza el valor de un secreto según exista o no. Si se desconoce si existe, o el estado remoto cambió
+    desde que se obtuvo, se intenta la otra operación solo si el error indica que el secreto no existe, o que ya
+    existe. Otros errores, como límites de uso, se retornan sin reintentar.
+    Parameters:
+        secret_name: Nombre del secreto a registrar.
+        secret_value: Valor para secreto.
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+        exists: Indica si el secreto existe, o None si se desconoce.
+    """
+    if exists is False:
+        response, err = aws.create_secret(secret_name, secret_value, profile, region)
+        if aws.error_code(err) == "ResourceExistsException":
+            response, err = aws.update_secret(secret_name, secret_value, profile, region)
+        return response, err
+
+    response, err = aws.update_secret(secret_name, secret_value, profile, region)
+    if aws.not_found(err):
+        response, err = aws.create_secret(secret_name, secret_value, profile, region)
+    return response, err
+
+
+def iter_encoded_chunks(file, chunk_codec: str, mode: str):
+    """
+    Lee un archivo binario y retorna, una a una, sus partes delimitadas por contenido junto a su contenido comprimido.
+    Las partes cuyo contenido comprimido no entra en un secreto se subdividen hasta que cada una entre.
+    Parameters:
+        file: Archivo abierto en modo binario.
+        chunk_codec: Codec a utilizar para comprimir las partes.
+        mode: Modo de almacenamiento de las partes.
+    """
+    chunks = chunking.iter_chunks(file, *index.chunk_parameters(chunk_codec, mode))
+    if chunk_codec == codec.NONE:
+        for data in chunks:
+            yield data, data
+        return
+
+    for data in chunks:
+        pending = [data]
+        while len(pending) > 0:
+            data = pending.pop()
+            payload = codec.compress(data, chunk_codec)
+            if len(payload) > index.payload_size(mode) and len(data) > 1:
+                half = len(data) // 2
+                pending.append(data[half:])
+                pending.append(data[:half])
                 continue
+            yield data, payload
+
 
-            # Codificar contenido en base64 y separar en chunks.
-            # NOTE: Cada chunk contiene 50kb de contenido en base64. El valor
-            # máximo a la fecha para un secret es de 64kb.
-            print("Calculando partes ...")
-            CHUNK_SIZE = 50 * 1024
-            chunks = list()
+def upload(tasks: list[UploadTask], put, fetch, jobs: int = 1, force: bool = False, chunk_codec: str = codec.NONE, mode: str = index.MODE_STRING, plan: planner.Plan | None = None, dry_run: bool = False) -> list[UploadTask]:
+    """
+    Sube los archivos indicados manteniendo hasta `jobs` partes en vuelo, de uno o varios archivos a la vez. Cada
+    archivo se lee una única vez por bloques, calculando su hash, partes y contenido codificado a medida que hay lugar
+    para enviarlas, por lo que la memoria utilizada depende de `jobs` y no del tamaño de los archivos. El índice de
+    cada archivo se registra recién cuando todas sus partes fueron subidas, de manera que una parte fallida no deja un
+    índice inconsistente.
+
+    Los archivos cuyo hash coincide con el del índice remoto se omiten y, para el resto, solo se suben las partes
+    cuyo hash no figura en el índice remoto, salvo que se indique `force`.
+
+    Cada subida registra sus índices con una nueva generación, ver index.new_generation. Las partes se almacenan con
+    una clave derivada de su contenido, por lo que nunca se sobreescriben con otro contenido, y el índice se registra
+    al final, de manera que una descarga simultánea obtiene el índice anterior o el nuevo, ambos con sus partes
+    completas. Las partes que dejan de ser referenciadas no se eliminan, para no afectar a descargas o subidas en
+    curso, sino que las elimina gc una vez transcurrido un período de gracia.
+
+    Cada secreto se crea o actualiza según el estado remoto del plan, y se registra en él la acción realizada. Con
+    `dry_run` solo se completa el plan, leyendo los archivos locales pero sin modificar secretos.
+    Parameters:
+        tasks: Archivos a subir.
+        put: Función que recibe el nombre y valor de un secreto (texto o bytes) y si el secreto existe (o None si se
+            desconoce), lo registra y retorna una tupla (respuesta, error).
+        fetch: Función que recibe una lista de nombres de secretos y retorna un diccionario con una tupla (valor, error)
+            por cada nombre, ver aws.retrieve_secrets.
+        jobs: Cantidad de partes a subir de forma simultánea.
+        force: Subir los archivos y todas sus partes aunque el contenido remoto coincida con el local.
+        chunk_codec: Codec a utilizar para comprimir las partes.
+        mode: Modo de almacenamiento de las partes.
+        plan: Plan con el estado remoto, ver planner.Plan.scan. Si no se indica, se desconoce qué secretos existen.
+        dry_run: Solo completar el plan, sin modificar secretos.
+    """
+    jobs = max(1, jobs)
+    plan = plan if plan != None else planner.Plan()
+    generation = index.new_generation()
+
+    # Obtener índices remotos, para omitir archivos y partes sin cambios. Los índices que no figuran en el estado
+    # remoto no se solicitan.
+    if force is False:
+        indexnames = [index.index_name(task.entry.secretname) for task in tasks]
+        indexnames = [name for name in indexnames if plan.exists(name) is not False]
+        plan.fetched(len(indexnames))
+        indexes = fetch(indexnames) if len(indexnames) > 0 else dict()
+        for task in tasks:
+            value, _ = indexes.get(index.index_name(task.entry.secretname), (None, None))
             try:
-                with open(targetfile, "rb") as file:
-                    b64 = base64.b64encode(file.read()).decode("utf-8")
-                    for i in range(0, len(b64), CHUNK_SIZE):
-                        chunks.append(b64[i: i + CHUNK_SIZE])
-            except Exception as e:
-                print("Error: " + str(e))
-                print(utils.bcolors.FAIL + "Error: no se pudieron calcular las partes del archivo." + utils.bcolors.ENDC)
+                task.remote = index.parse(value) if value != None else None
+            except Exception:
+                task.remote = None
+
+        # Obtener las tablas de partes de los índices v3, en un único pedido.
+        tablenames = [name for task in tasks if task.remote != None for name in index.tables(task.entry.secretname, task.remote)]
+        if len(tablenames) > 0:
+            plan.fetched(len(tablenames))
+            tables = fetch(tablenames)
+            for task in tasks:
+                try:
+                    task.remote = index.attach(task.entry.secretname, task.remote, tables) if task.remote != None else None
+                except Exception:
+                    task.remote = None
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        # Futuros pendientes, asociados a su tarea y número de parte (None para el índice).
+        futures = dict()
+
+        def drain(limit: int) -> None:
+            """
+            Procesa los envíos finalizados hasta que queden menos de `limit` en vuelo.
+            """
+            while len(futures) > 0 and len(futures) >= limit:
+                done, _ = concurrent.futures.wait(futures.keys(), return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    task, partno = futures.pop(future)
+                    try:
+                        response, err = future.result()
+                    except Exception as e:
+                        response, err = None, e
+                    if partno == None:
+                        on_index(task, err)
+                    elif partno == TABLE:
+                        on_table(task, err)
+                        if task.pending == 0:
+                            put_index(task, executor, futures, put, plan)
+                    else:
+                        on_part(task, partno, response, err)
+                        if task.submitted and task.pending == 0:
+                            commit(task, executor, futures, put, plan, dry_run)
+
+        for task in tasks:
+            destination = " → " + (task.region or "región por defecto") if task.region != None else ""
+            task.log("\n" + utils.bcolors.OKGREEN + "Subiendo: " + task.entry.filename + destination + utils.bcolors.ENDC)
+            if prepare(task) is False:
+                task.flush()
                 continue
+            task.stat = lockfile.file_stat(task.targetfile)
 
-            # Crear indice.
-            print("Creando archivo índice ...")
+            # Si las partes del índice remoto no pueden reutilizarse (índice v1, u otro codec o modo de
+            # almacenamiento), se calcula el hash antes de subir para omitir archivos sin cambios. En caso contrario,
+            # el hash se calcula durante la lectura de las partes, en una única pasada sobre el archivo.
+            stored = index.chunk_hashes(task.remote, chunk_codec, mode)
+            if task.remote != None and len(stored) == 0:
+                task.log("Calculando valor de comprobación ...")
+                try:
+                    with tracer.phase("hashing"):
+                        file_hash = hashlib.md5(task.content).hexdigest() if task.content != None else utils.hash_file(task.targetfile)
+                    if file_hash == task.remote.get("hash"):
+                        task.hash = file_hash
+                        task.log("Sin cambios, se omite.")
+                        task.skipped = True
+                        plan.add(planner.SKIP, index.index_name(task.entry.secretname))
+                        task.flush()
+                        continue
+                except Exception as e:
+                    task.log("Advertencia: " + str(e))
+
+            # Enviar partes nuevas a medida que se leen, esperando a que se liberen lugares si es necesario.
+            task.log("Calculando partes ...")
+            task.chunk_codec = chunk_codec
+            task.mode = mode
+            task.generation = generation
             try:
-                value = {
-                    "v": 1,
-                    "hash": hash_md5,
-                    "parts": len(chunks)
-                }
-                value = json.dumps(value)
-                indexname = entry.secretname + ".index"
-                _, err = aws.update_secret(indexname, value, profile, region)
-                if err != None and isinstance(err, ClientError):
-                    _, err = aws.create_secret(indexname, value, profile, region)
-                if err != None:
-                    raise err
-                print("Archivo índice: ok.")
+                with open_source(task) as file:
+                    reader = utils.HashingReader(file)
+                    for data, payload in tracer.iterate("encoding", iter_encoded_chunks(reader, chunk_codec, mode)):
+                        with tracer.phase("hashing"):
+                            chunk_hash = chunking.hash_chunk(data)
+                        key = stored.get(chunk_hash, index.chunk_key(chunk_hash, chunk_codec, mode))
+                        task.chunks.append({"key": key, "hash": chunk_hash, "size": len(data)})
+                        partname = task.entry.secretname + "." + key
+                        if chunk_hash in stored:
+                            task.reused = task.reused + 1
+                            if partname not in plan.actions:
+                                plan.add(planner.SKIP, partname)
+                            continue
+                        stored[chunk_hash] = key
+
+                        plan.put(partname)
+                        if dry_run:
+                            task.written = task.written + 1
+                            continue
+                        drain(jobs)
+                        if task.failed:
+                            break
+                        with tracer.phase("encoding"):
+                            value = index.encode_part(payload, mode)
+                        futures[executor.submit(put, partname, value, plan.exists(partname))] = (task, len(task.chunks) - 1)
+                        task.pending = task.pending + 1
+                    task.hash = reader.hexdigest()
+                    task.size = reader.size
             except Exception as e:
-                print("Error: " + str(e))
-                print(utils.bcolors.FAIL + "Error: no se puedo crear el archivo índice." + utils.bcolors.ENDC)
+                task.log("Error: " + str(e))
+                task.log(utils.bcolors.FAIL + "Error: no se pudieron calcular las partes del archivo." + utils.bcolors.ENDC)
+                task.failed = True
+
+            # Omitir archivos sin cambios. Al coincidir el hash, todas las partes ya existían y no se subió ninguna.
+            if task.failed is False and task.remote != None and task.remote.get("hash") == task.hash and task.reused == len(task.chunks):
+                task.log("Sin cambios, se omite.")
+                task.skipped = True
+                plan.add(planner.SKIP, index.index_name(task.entry.secretname))
+                task.flush()
                 continue
 
-            # Crear partes.
-            i = 0
-            for chunk in chunks:
-                print("Subiendo parte: {0}/{1}".format(i + 1, len(chunks)))
-                try:
-                    # Crear parte.
-                    partname = entry.secretname + ".{0}".format(i)
-                    _, err = aws.update_secret(partname, chunk, profile, region)
-                    if err != None and isinstance(err, ClientError):
-                        _, err = aws.create_secret(partname, chunk, profile, region)
-                    if err != None:
-                        raise err
-                except Exception as e:
-                    print("Error: " + str(e))
-                    print(utils.bcolors.FAIL + "Error: no se puedo subir la parte calculada." + utils.bcolors.ENDC)
-                    continue
+            # Si no quedan partes en vuelo, se registra el índice directamente.
+            task.submitted = True
+            if task.pending == 0:
+                commit(task, executor, futures, put, plan, dry_run)
+
+        drain(1)
+
+    # Las partes que dejaron de ser referenciadas se conservan hasta que las elimine gc.
+    orphans = len([name for task in tasks if task.failed is False and task.skipped is False for name in task.orphans])
+    if orphans > 0:
+        print("\nPartes sin referencia: {0}, se eliminarán con la acción gc.".format(orphans))
+
+    return tasks
+
+
+def open_source(task: UploadTask):
+    """
+    Abre en modo binario el contenido a subir: el contenido generado, si hubiere, o el archivo local.
+    """
+    if task.content != None:
+        return io.BytesIO(task.content)
+    return open(task.targetfile, "rb")
+
 
-                # Siguiente numero de parte.
-                i = i + 1
+def prepare(task: UploadTask) -> bool:
+    """
+    Verifica que el archivo a subir exista.
+    """
+    if task.content != None:
+        task.log("Archivos agrupados: {0}".format(len(task.members)))
+        return True
+
+    # El archivo debe existir.
+    if (os.path.exists(task.targetfile) == False):
+        task.log(utils.bcolors.FAIL + "Error: el archivo no existe." + utils.bcolors.ENDC)
+        task.failed = True
+        return False
+    return True
+
+
+def on_part(task: UploadTask, partno: int, response: dict | None, err: Exception) -> None:
+    """
+    Procesa el resultado de la subida de una parte y registra en el índice el VersionId obtenido, si hubiere.
+    """
+    task.pending = task.pending - 1
+    if err != None:
+        if task.failed is False:
+            task.log("Error: " + str(err))
+            task.log(utils.bcolors.FAIL + "Error: no se puedo subir la parte calculada." + utils.bcolors.ENDC)
+        task.failed = True
+        return
+    task.written = task.written + 1
+    if isinstance(response, dict) and response.get("VersionId") != None:
+        task.chunks[partno]["version"] = response["VersionId"]
+    task.log("Subiendo parte: {0}".format(partno + 1))
+
+
+def commit(task: UploadTask, executor, futures: dict, put, plan: planner.Plan, dry_run: bool = False) -> None:
+    """
+    Registra el índice de un archivo una vez subidas todas sus partes, con la generación de la subida, y las partes
+    remotas que dejan de ser referenciadas por el nuevo índice. Si el índice no entra en un secreto, se registran
+    primero sus tablas de partes, ver put_index. Si alguna parte falló, el índice existente no se modifica.
+    """
+    if task.failed:
+        task.log(utils.bcolors.FAIL + "Error: no se actualizó el archivo índice." + utils.bcolors.ENDC)
+        task.flush()
+        return
+
+    # Completar el VersionId de las partes reutilizadas, desde el índice remoto o desde la parte repetida subida.
+    versions = index.chunk_versions(task.remote, task.chunk_codec, task.mode)
+    versions.update({chunk["hash"]: chunk["version"] for chunk in task.chunks if "version" in chunk})
+    for chunk in task.chunks:
+        if "version" not in chunk and chunk["hash"] in versions:
+            chunk["version"] = versions[chunk["hash"]]
+
+    # Generar el índice y, si no entra en un secreto, sus tablas de partes.
+    try:
+        task.index_value, tables = index.build(task.hash, task.size, task.chunks, task.chunk_codec, task.mode, task.generation)
+    except Exception as e:
+        task.log("Error: " + str(e))
+        task.log(utils.bcolors.FAIL + "Error: no se puedo crear el archivo índice." + utils.bcolors.ENDC)
+        task.failed = True
+        task.flush()
+        return
+
+    # Partes y tablas remotas, de cualquier versión de índice, no referenciadas por el nuevo índice.
+    tablenames = [task.entry.secretname + "." + key for key, _ in tables]
+    referenced = set(task.entry.secretname + "." + chunk["key"] for chunk in task.chunks).union(tablenames)
+    task.orphans = index.orphans(task.entry.secretname, plan.existing.keys(), referenced)
+
+    # Las tablas se derivan de su contenido, por lo que las tablas existentes no se vuelven a registrar.
+    pending = list()
+    for name, (_, value) in zip(tablenames, tables):
+        if plan.exists(name) is True:
+            plan.add(planner.SKIP, name)
+        else:
+            plan.put(name)
+            pending.append((name, value))
+    plan.put(index.index_name(task.entry.secretname))
+    if dry_run:
+        task.log("Partes: {0} en total, {1} a subir, {2} reutilizadas, {3} sin referencia.".format(len(task.chunks), task.written, task.reused, len(task.orphans)))
+        task.flush()
+        return
+
+    task.log("Partes: {0} en total, {1} subidas, {2} reutilizadas.".format(len(task.chunks), task.written, task.reused))
+    if len(tablenames) > 0:
+        task.log("Tablas de partes: {0} en total, {1} a subir.".format(len(tablenames), len(pending)))
+    for name, value in pending:
+        futures[executor.submit(put, name, value, plan.exists(name))] = (task, TABLE)
+        task.pending = task.pending + 1
+    if task.pending == 0:
+        put_index(task, executor, futures, put, plan)
+
+
+def on_table(task: UploadTask, err: Exception) -> None:
+    """
+    Procesa el resultado del registro de una tabla de partes de un índice v3.
+    """
+    task.pending = task.pending - 1
+    if err != None:
+        if task.failed is False:
+            task.log("Error: " + str(err))
+            task.log(utils.bcolors.FAIL + "Error: no se puedo subir la tabla de partes." + utils.bcolors.ENDC)
+        task.failed = True
+
+
+def put_index(task: UploadTask, executor, futures: dict, put, plan: planner.Plan) -> None:
+    """
+    Registra el índice de un archivo una vez registradas sus tablas de partes, si hubiere. Si alguna tabla falló, el
+    índice existente no se modifica.
+    """
+    if task.failed:
+        task.log(utils.bcolors.FAIL + "Error: no se actualizó el archivo índice." + utils.bcolors.ENDC)
+        task.flush()
+        return
+    task.log("Creando archivo índice ...")
+    indexname = index.index_name(task.entry.secretname)
+    futures[executor.submit(put, indexname, task.index_value, plan.exists(indexname))] = (task, None)
+
+
+def on_index(task: UploadTask, err: Exception) -> None:
+    """
+    Procesa el resultado del registro del índice de un archivo e imprime los mensajes registrados para el archivo.
+    """
+    if err != None:
+        task.log("Error: " + str(err))
+        task.log(utils.bcolors.FAIL + "Error: no se puedo crear el archivo índice." + utils.bcolors.ENDC)
+        task.failed = True
+    else:
+        task.log("Archivo índice: ok.")
+    task.flush()
@@ -0,0 +1,278 @@
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import signal
+import struct
+import threading
+import time
+from . import utils
+from . import store
+from . import codec
+from . import index
+from . import lock as lockfile
+from . import opt_upload
+from .trace import tracer
+
+
+# Intervalo de comprobación de cambios sin inotify, en segundos.
+POLL_INTERVAL = 1.0
+
+# Tiempo sin cambios, en segundos, a esperar antes de subir un archivo modificado, de manera que una ráfaga de
+# escrituras resulte en una única subida.
+DEBOUNCE = 0.5
+
+# Cantidad máxima de archivos en espera de ser subidos. Por encima, los archivos modificados permanecen pendientes
+# hasta que se libere lugar.
+QUEUE_SIZE = 100
+
+# Eventos de inotify, ver inotify(7).
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+# Encabezado de cada evento de inotify: wd, mask, cookie, len.
+IN_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """
+    Detecta cambios en archivos a través de inotify, observando las carpetas que los contienen, de manera que se
+    detecten también los archivos reemplazados al guardarse. Solo disponible en Linux.
+    Attributes:
+        fd: Descriptor de inotify.
+        folders: Carpeta observada por cada descriptor de observación.
+    """
+    fd = -1
+    folders = None
+
+    def __init__(self, paths: list[str]):
+        """
+        Constructor. Registra las carpetas de los archivos indicados.
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        self.folders = dict()
+        for folder in sorted(set(os.path.dirname(path) for path in paths)):
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), IN_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                self.close()
+                raise OSError(errno, "inotify_add_watch: " + folder)
+            self.folders[wd] = folder
+
+    def read(self, timeout: float) -> list[str] | None:
+        """
+        Espera hasta `timeout` segundos y retorna los paths modificados, o None si se perdieron eventos.
+        """
+        ready, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if len(ready) == 0:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = list()
+        offset = 0
+        while offset + IN_EVENT.size <= len(data):
+            wd, mask, _, length = IN_EVENT.unpack_from(data, offset)
+            name = data[offset + IN_EVENT.size: offset + IN_EVENT.size + length].rstrip(b"\0")
+            offset += IN_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if wd in self.folders and name != b"":
+                paths.append(os.path.join(self.folders[wd], os.fsdecode(name)))
+        return paths
+
+    def close(self) -> None:
+        """
+        Libera el descriptor de inotify.
+        """
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingWatcher:
+    """
+    Detecta cambios en archivos comparando periódicamente su tamaño y fecha de modificación.
+    Attributes:
+        stats: Último tamaño y fecha de modificación de cada archivo, ver lock.file_stat.
+        interval: Intervalo de comprobación, en segundos.
+    """
+    stats = None
+    interval = POLL_INTERVAL
+
+    def __init__(self, paths: list[str], interval: float = POLL_INTERVAL):
+        """
+        Constructor
+        """
+        self.stats = {path: lockfile.file_stat(path) for path in paths}
+        self.interval = interval
+        self._next = time.monotonic() + interval
+
+    def read(self, timeout: float) -> list[str] | None:
+        """
+        Espera hasta `timeout` segundos y, si corresponde comprobar, retorna los paths modificados.
+        """
+        time.sleep(max(0.0, min(timeout, self._next - time.monotonic())))
+        if time.monotonic() < self._next:
+            return []
+        self._next = time.monotonic() + self.interval
+        paths = list()
+        for path, stat in self.stats.items():
+            current = lockfile.file_stat(path)
+            if current != stat:
+                self.stats[path] = current
+                paths.append(path)
+        return paths
+
+    def close(self) -> None:
+        """
+        Sin recursos a liberar.
+        """
+        pass
+
+
+def create_watcher(paths: list[str], interval: float = POLL_INTERVAL):
+    """
+    Crea un observador de cambios con inotify si está disponible, o por comprobación periódica en caso contrario.
+    """
+    try:
+        return InotifyWatcher(paths)
+    except (OSError, AttributeError, TypeError):
+        return PollingWatcher(paths, interval)
+
+
+def run(cwd: str, profile: str, region: str | list[str], jobs: int = 1, chunk_codec: str = codec.NONE, mode: str = index.MODE_STRING, recursive: bool = False, ignore: list[str] | None = None, interval: float = POLL_INTERVAL, debounce: float = DEBOUNCE) -> None:
+    """
+    Observa los archivos indicados en los descriptores y sube los archivos modificados, hasta recibir SIGTERM o SIGINT.
+    Los descriptores se leen una única vez, y los clientes AWS se reutilizan durante toda la ejecución. Al iniciar se
+    suben los archivos modificados desde la última sincronización. Cada archivo modificado se sube una vez
+    transcurrido `debounce` sin nuevos cambios, y solo si su hash cambió según el manifiesto de su descriptor.
+    Parameters:
+        cwd: Carpeta de trabajo.
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere, o lista de regiones en las que replicar los archivos.
+        jobs: Cantidad de partes a subir de forma simultánea.
+        chunk_codec: Codec a utilizar para comprimir las partes.
+        mode: Modo de almacenamiento de las partes.
+        recursive: Buscar descriptores también en subcarpetas.
+        ignore: Patrones glob de carpetas o descriptores a omitir en la búsqueda recursiva.
+        interval: Intervalo de comprobación de cambios sin inotify, en segundos.
+        debounce: Tiempo sin cambios a esperar antes de subir un archivo, en segundos.
+    """
+    # Obtener descriptores en carpeta actual.
+    with tracer.phase("discovery"):
+        descriptors = store.descriptors(cwd, recursive, ignore)
+    if (len(descriptors) == 0):
+        print("No se encontraron archivos descriptores.")
+        exit(1)
+
+    # Entradas de cada archivo observado. Un mismo archivo puede figurar en varios descriptores.
+    targets = dict()
+    for descriptor in descriptors:
+        for entry in descriptor.entries:
+            targetfile = os.path.normpath(descriptor.targetfile(entry))
+            targets.setdefault(targetfile, list()).append((descriptor.lock, entry))
+
+    # Finalizar ante SIGTERM o SIGINT, una vez finalizada la subida en curso.
+    stop = threading.Event()
+    handler = lambda signum, frame: stop.set()
+    signal.signal(signal.SIGTERM, handler)
+    signal.signal(signal.SIGINT, handler)
+
+    work = queue.Queue(maxsize=QUEUE_SIZE)
+    worker = threading.Thread(target=upload_worker, args=(work, targets, profile, region if isinstance(region, list) else [region], jobs, chunk_codec, mode), daemon=True)
+    worker.start()
+
+    watcher = create_watcher(list(targets.keys()), interval)
+    method = "inotify" if isinstance(watcher, InotifyWatcher) else "comprobación cada {0}s".format(interval)
+    print("{0}Observando {1} archivos ({2}). Finalizar con Ctrl+C o SIGTERM.{3}".format(utils.bcolors.OKBLUE, len(targets), method, utils.bcolors.ENDC))
+
+    # Archivos modificados, con el momento a partir del cual pueden subirse. Al iniciar se incluyen todos.
+    dirty = {targetfile: time.monotonic() for targetfile in targets}
+    try:
+        while stop.is_set() is False:
+            now = time.monotonic()
+            timeout = min([deadline - now for deadline in dirty.values()] + [interval])
+            changed = watcher.read(timeout)
+            if changed == None:
+                # Se perdieron eventos, se consideran modificados todos los archivos.
+                changed = list(targets.keys())
+            for path in changed:
+                path = os.path.normpath(path)
+                if path in targets:
+                    dirty[path] = time.monotonic() + debounce
+
+            # Encolar los archivos sin cambios recientes, mientras haya lugar. Con la cola llena se espera a que se
+            # libere lugar hasta `interval` segundos, ya que los archivos pendientes con plazo vencido anulan la espera
+            # por cambios.
+            now = time.monotonic()
+            for path, deadline in sorted(dirty.items(), key=lambda item: item[1]):
+                if deadline > now:
+                    continue
+                try:
+                    work.put(path, timeout=interval)
+                except queue.Full:
+                    break
+                del dirty[path]
+    finally:
+        watcher.close()
+        print("\nFinalizando ...")
+        work.put(None)
+        worker.join()
+        if len(dirty) > 0:
+            print(utils.bcolors.WARNING + "Advertencia: {0} archivos modificados no se subieron.".format(len(dirty)) + utils.bcolors.ENDC)
+
+
+def upload_worker(work: queue.Queue, targets: dict, profile: str, regions: list[str], jobs: int, chunk_codec: str, mode: str) -> None:
+    """
+    Sube los archivos encolados hasta recibir None. Los archivos encolados mientras se sube un lote se agrupan en el
+    siguiente lote, que requiere un único recorrido del estado remoto.
+    """
+    while True:
+        paths = [work.get()]
+        while True:
+            try:
+                paths.append(work.get_nowait())
+            except queue.Empty:
+                break
+        finished = None in paths
+        paths = set(path for path in paths if path != None)
+
+        # Un archivo agrupado se sube junto a todos los archivos de su secreto agrupado, ver opt_upload.group_packs.
+        packed = set(entry.pack for path in paths for _, entry in targets[path] if entry.pack != None)
+        if len(packed) > 0:
+            paths.update(path for path, items in targets.items() for _, entry in items if entry.pack in packed)
+        paths = sorted(paths)
+
+        tasks = list()
+        for path in paths:
+            if os.path.exists(path) is False:
+                continue
+            for descriptor_lock, entry in targets[path]:
+                task = opt_upload.UploadTask(entry, path)
+                task.lock = descriptor_lock
+                tasks.append(task)
+        if len(tasks) > 0:
+            try:
+                opt_upload.sync(tasks, profile, regions, jobs, False, chunk_codec, mode)
+                uploaded = [task for task in tasks if task.lock_skipped is False]
+                if len(uploaded) > 0:
+                    utils.print_summary(uploaded)
+            except Exception as e:
+                print("Error: " + str(e))
+                print(utils.bcolors.FAIL + "Error: no se pudieron subir los archivos modificados." + utils.bcolors.ENDC)
+
+        if finished:
+            return
@@ -0,0 +1,61 @@
+import hashlib
+import json
+
+
+# Directiva de archivo descriptor que agrupa sus archivos pequeños en un único secreto: @pack => <secreto>.
+PACK_DIRECTIVE = "@pack"
+
+# Tamaño máximo de un archivo a agrupar. Los archivos de mayor tamaño se almacenan de forma individual.
+MAX_SIZE = 64 * 1024
+
+# Versión del formato del contenido agrupado.
+# - v1: una línea JSON {"v": 1, "files": [{"secret": s, "offset": o, "size": n, "hash": md5}, ...]} seguida del
+#   contenido de cada archivo, en orden de nombre de secreto. El offset de cada archivo es relativo al final de la
+#   línea JSON. El contenido agrupado se almacena como cualquier otro archivo, con su índice y partes, ver index.
+VERSION = 1
+
+
+def build(files: dict[str, bytes]) -> bytes:
+    """
+    Genera el contenido agrupado de varios archivos. Para un mismo contenido, el resultado es siempre el mismo.
+    Parameters:
+        files: Contenido de cada archivo, indexado por nombre de secreto.
+    """
+    table = list()
+    offset = 0
+    for secretname in sorted(files.keys()):
+        data = files[secretname]
+        table.append({"secret": secretname, "offset": offset, "size": len(data), "hash": hashlib.md5(data).hexdigest()})
+        offset += len(data)
+    header = json.dumps({"v": VERSION, "files": table}, sort_keys=True).encode("utf-8")
+    return b"".join([header, b"\n"] + [files[item["secret"]] for item in table])
+
+
+def parse(payload: bytes) -> dict[str, dict]:
+    """
+    Retorna la tabla de un contenido agrupado, indexada por nombre de secreto. El offset de cada archivo se retorna
+    relativo al inicio del contenido.
+    """
+    end = payload.find(b"\n")
+    if end < 0:
+        raise ValueError("Contenido agrupado inválido.")
+    header = json.loads(payload[:end].decode("utf-8"))
+    if header.get("v") != VERSION:
+        raise ValueError("Versión de contenido agrupado no soportada: {0}".format(header.get("v")))
+    table = dict()
+    for item in header["files"]:
+        table[item["secret"]] = dict(item, offset=end + 1 + item["offset"])
+    return table
+
+
+def extract(payload: bytes, item: dict) -> bytes:
+    """
+    Retorna el contenido de un archivo agrupado, verificando su hash.
+    Parameters:
+        payload: Contenido agrupado.
+        item: Entrada de la tabla del archivo, ver parse.
+    """
+    data = payload[item["offset"]: item["offset"] + item["size"]]
+    if len(data) != item["size"] or hashlib.md5(data).hexdigest() != item["hash"]:
+        raise ValueError("El contenido de {0} no coincide con su hash.".format(item["secret"]))
+    return data
@@ -0,0 +1,144 @@
+import datetime
+import math
+from . import utils
+from . import aws
+
+
+# Acciones a realizar sobre cada secreto.
+CREATE = "create"
+UPDATE = "update"
+SKIP = "skip"
+DELETE = "delete"
+ACTIONS = [CREATE, UPDATE, SKIP, DELETE]
+
+
+class Plan:
+    """
+    Plan de operaciones sobre los secretos remotos. El estado remoto se obtiene en un único recorrido paginado de
+    list_secrets filtrando por prefijo de nombre, sin obtener valores, de manera que cada secreto puede crearse o
+    actualizarse directamente, sin intentar una operación y luego la otra.
+    Attributes:
+        existing: Metadatos de los secretos remotos encontrados, indexados por nombre.
+        complete: Indica si el estado remoto se obtuvo por completo. En caso contrario se desconoce si un secreto
+            existe.
+        actions: Acción planificada para cada secreto, indexada por nombre, en orden de registro.
+        list_calls: Cantidad de llamadas a list_secrets realizadas.
+        get_calls: Cantidad estimada de llamadas para obtener secretos existentes.
+    """
+    existing = None
+    complete = False
+    actions = None
+    list_calls = 0
+    get_calls = 0
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self.existing = dict()
+        self.complete = False
+        self.actions = dict()
+        self.list_calls = 0
+        self.get_calls = 0
+
+    def scan(self, prefixes: list[str], list_page) -> Exception | None:
+        """
+        Obtiene los metadatos de todos los secretos cuyo nombre comienza con alguno de los prefijos indicados,
+        agrupando hasta aws.LIST_FILTER_SIZE prefijos por filtro y recorriendo todas las páginas de cada consulta.
+        Parameters:
+            prefixes: Prefijos de nombre a consultar.
+            list_page: Función que recibe una lista de prefijos y un token de página (o None) y retorna una tupla
+                (respuesta, error), ver aws.list_secrets.
+        """
+        prefixes = sorted(set(prefixes))
+        for i in range(0, len(prefixes), aws.LIST_FILTER_SIZE):
+            group = prefixes[i:i + aws.LIST_FILTER_SIZE]
+            token = None
+            while True:
+                response, err = list_page(group, token)
+                self.list_calls = self.list_calls + 1
+                if err != None:
+                    self.existing.clear()
+                    return err
+                # El filtro de aws no distingue mayúsculas de minúsculas, se verifica el prefijo exacto.
+                for secret in response.get("SecretList", []):
+                    name = secret.get("Name", "")
+                    if any(name.startswith(prefix) for prefix in group):
+                        self.existing[name] = secret
+                token = response.get("NextToken")
+                if token == None or token == "":
+                    break
+        self.complete = True
+        return None
+
+    def exists(self, secret_name: str) -> bool | None:
+        """
+        Indica si un secreto existe en el estado remoto, o None si el estado remoto no se obtuvo.
+        """
+        if self.complete is False:
+            return None
+        return secret_name in self.existing
+
+    def age(self, secret_name: str) -> float | None:
+        """
+        Retorna los segundos transcurridos desde la última modificación de un secreto según el estado remoto, o None si
+        se desconoce.
+        """
+        secret = self.existing.get(secret_name, dict())
+        changed = secret.get("LastChangedDate") or secret.get("CreatedDate")
+        if isinstance(changed, datetime.datetime) is False:
+            return None
+        if changed.tzinfo == None:
+            changed = changed.replace(tzinfo=datetime.timezone.utc)
+        return (datetime.datetime.now(datetime.timezone.utc) - changed).total_seconds()
+
+    def add(self, action: str, secret_name: str) -> None:
+        """
+        Registra la acción a realizar sobre un secreto. Las acciones posteriores reemplazan a las anteriores.
+        """
+        self.actions[secret_name] = action
+
+    def put(self, secret_name: str) -> None:
+        """
+        Registra la creación o actualización de un secreto, según exista o no en el estado remoto.
+        """
+        self.add(UPDATE if self.exists(secret_name) else CREATE, secret_name)
+
+    def names(self, action: str) -> list[str]:
+        """
+        Retorna los nombres de los secretos con la acción indicada, en orden de registro.
+        """
+        return [name for name, value in self.actions.items() if value == action]
+
+    def fetched(self, count: int) -> None:
+        """
+        Registra la obtención de `count` secretos existentes, en lotes de hasta aws.BATCH_SIZE.
+        """
+        self.get_calls = self.get_calls + math.ceil(count / aws.BATCH_SIZE)
+
+    def calls(self) -> int:
+        """
+        Retorna la cantidad estimada de llamadas al API necesarias para ejecutar el plan, incluyendo el recorrido
+        inicial. Si el estado remoto no se obtuvo, cada creación puede requerir un intento de actualización previo.
+        """
+        calls = self.list_calls + self.get_calls + len(self.names(UPDATE)) + len(self.names(DELETE))
+        creates = len(self.names(CREATE))
+        return calls + (creates if self.complete else 2 * creates)
+
+    def show(self) -> None:
+        """
+        Imprime las acciones planificadas y la cantidad estimada de llamadas al API.
+        """
+        labels = {CREATE: "Crear", UPDATE: "Actualizar", SKIP: "Omitir", DELETE: "Eliminar"}
+        print("\n" + utils.bcolors.OKGREEN + "Plan:" + utils.bcolors.ENDC)
+        for name, action in self.actions.items():
+            print("{0}: {1}".format(labels[action], name))
+        print("\n{0}Plan: {1} a crear, {2} a actualizar, {3} sin cambios, {4} a eliminar. Llamadas estimadas: {5}.{6}".format(
+            utils.bcolors.OKCYAN,
+            len(self.names(CREATE)),
+            len(self.names(UPDATE)),
+            len(self.names(SKIP)),
+            len(self.names(DELETE)),
+            self.calls(),
+            utils.bcolors.ENDC
+        ))
@@ -0,0 +1,172 @@
+"""
+Lectura de archivos almacenados en AWS Secrets Manager y acceso a los archivos descriptores y su manifiesto, compartidos
+por la API y las acciones de la herramienta, ver api, opt_download y opt_upload.
+"""
+import concurrent.futures
+import hashlib
+import os
+from . import utils
+from . import aws
+from . import chunking
+from . import codec
+from . import index
+from . import lock as lockfile
+from .trace import tracer
+
+
+class Descriptor:
+    """
+    Archivo descriptor, junto a sus entradas y su manifiesto de sincronización.
+    Attributes:
+        path: Path del archivo descriptor.
+        entries: Entradas del descriptor.
+        lock: Manifiesto de sincronización del descriptor.
+    """
+    path = ""
+    entries = None
+    lock = None
+
+    def __init__(self, path: str):
+        """
+        Constructor. Lee las entradas del descriptor y su manifiesto.
+        """
+        self.path = path
+        self.entries = utils.parse_descriptor_file(path)
+        self.lock = lockfile.Lock(path)
+
+    def names(self) -> list[str]:
+        """
+        Retorna los nombres de archivo de las entradas del descriptor.
+        """
+        return [entry.filename for entry in self.entries]
+
+    def entry(self, name: str) -> utils.DescriptorFileEntry:
+        """
+        Retorna la entrada del descriptor con el nombre de archivo, o nombre de secreto, indicado.
+        """
+        for entry in self.entries:
+            if entry.filename == name or entry.secretname == name:
+                return entry
+        raise KeyError("No se encontró la entrada {0} en {1}.".format(name, self.path))
+
+    def targetfile(self, entry: utils.DescriptorFileEntry) -> str:
+        """
+        Retorna el path del archivo local de una entrada, relativo a la carpeta del descriptor.
+        """
+        return os.path.join(os.path.dirname(self.path), entry.filename)
+
+    def status(self) -> dict[str, str]:
+        """
+        Retorna el estado de cada archivo del descriptor respecto de la última sincronización, sin acceder a AWS, ver
+        lock.STATES. Los datos actualizados del manifiesto se guardan.
+        """
+        states = {entry.filename: self.lock.status(entry, self.targetfile(entry)) for entry in self.entries}
+        self.lock.save()
+        return states
+
+
+def descriptors(cwd: str = ".", recursive: bool = False, ignore: list[str] | None = None) -> list[Descriptor]:
+    """
+    Retorna los archivos descriptores de una carpeta, ver utils.get_descriptor_files.
+    """
+    return [Descriptor(path) for path in utils.get_descriptor_files(cwd, recursive, ignore)]
+
+
+def regions(region: str | list[str]) -> list[str]:
+    """
+    Retorna la lista de regiones a utilizar, a partir de una región o lista de regiones.
+    """
+    return region if isinstance(region, list) else [region]
+
+
+def fetch_first(secretname: str, profile: str, region: str | list[str], jobs: int = 1) -> tuple[dict, bytes, str]:
+    """
+    Retorna el índice y el contenido verificado de un archivo, y la región de la que se obtuvo, probando cada región
+    en orden, ver fetch_secret.
+    """
+    err = None
+    for candidate in regions(region):
+        try:
+            parsed, data = fetch_secret(secretname, profile, candidate, jobs)
+            return parsed, data, candidate
+        except Exception as e:
+            err = e
+    raise err
+
+
+def read_secret(secretname: str, profile: str, region: str, jobs: int = 1) -> bytes:
+    """
+    Retorna el contenido verificado de un archivo, ver fetch_secret.
+    """
+    return fetch_secret(secretname, profile, region, jobs)[1]
+
+
+def fetch_secret(secretname: str, profile: str, region: str, jobs: int = 1) -> tuple[dict, bytes]:
+    """
+    Obtiene el índice y las partes de un archivo y retorna el índice y su contenido, verificando el hash de cada parte,
+    si el índice lo incluye, y del archivo completo. Las partes se solicitan en lotes de hasta aws.BATCH_SIZE, de forma
+    simultánea. Si faltan partes de un índice con generación, el índice pudo ser reemplazado por una subida posterior
+    y sus partes eliminadas por gc: si la generación del índice actual es otra, se vuelve a leer con ese índice.
+    Parameters:
+        secretname: Nombre base del secreto.
+        profile: Perfil aws a utilizar.
+        region: Región aws a utilizar, si hubiere.
+        jobs: Cantidad de lotes a solicitar de forma simultánea.
+    """
+    parsed = fetch_index(secretname, profile, region)
+    try:
+        return parsed, fetch_parts(secretname, parsed, profile, region, jobs)
+    except Exception as e:
+        if aws.not_found(e) is False or index.generation(parsed) == None:
+            raise
+        current = fetch_index(secretname, profile, region)
+        if index.generation(current) == index.generation(parsed):
+            raise
+        return current, fetch_parts(secretname, current, profile, region, jobs)
+
+
+def fetch_index(secretname: str, profile: str, region: str) -> dict:
+    """
+    Obtiene y parsea el índice de un archivo, junto a sus tablas de partes si es un índice v3.
+    """
+    indexname = index.index_name(secretname)
+    value, err = aws.retrieve_secrets([indexname], profile, region)[indexname]
+    if err != None:
+        raise err
+    return index.resolve(secretname, index.parse(value), lambda names: aws.retrieve_secrets(names, profile, region))
+
+
+def fetch_parts(secretname: str, parsed: dict, profile: str, region: str, jobs: int = 1) -> bytes:
+    """
+    Obtiene las partes de un índice y retorna el contenido del archivo, verificando el hash de cada parte y del archivo
+    completo, ver fetch_secret.
+    """
+    parts = index.parts(secretname, parsed)
+    names = [name for name, _ in parts]
+
+    values = dict()
+    batches = [names[i: i + aws.BATCH_SIZE] for i in range(0, len(names), aws.BATCH_SIZE)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(batches)))) as executor:
+        for results in executor.map(lambda batch: aws.retrieve_secrets(batch, profile, region), batches):
+            values.update(results)
+
+    buffer = bytearray()
+    for partno, (name, chunk_hash) in enumerate(parts):
+        value, err = values.get(name, (None, RuntimeError("No se obtuvo el secreto " + name)))
+        if err != None:
+            raise err
+        with tracer.phase("encoding"):
+            data = index.decode_part(value, index.index_mode(parsed))
+            data = codec.decompress(data, index.index_codec(parsed))
+        with tracer.phase("hashing"):
+            valid = chunk_hash == None or chunking.hash_chunk(data) == chunk_hash
+        if valid is False:
+            raise ValueError("El contenido de la parte {0} de {1} no coincide con su hash.".format(partno + 1, secretname))
+        buffer += data
+
+    data = bytes(buffer)
+    with tracer.phase("hashing"):
+        valid = hashlib.md5(data).hexdigest() == parsed["hash"]
+    if valid is False:
+        raise ValueError("El contenido de {0} no coincide con el hash del índice.".format(secretname))
+    return data
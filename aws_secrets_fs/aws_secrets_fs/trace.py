@@ -0,0 +1,197 @@
+import contextlib
+import json
+import math
+import threading
+import time
+from . import utils
+
+
+# Fases de ejecución medidas. El tiempo de cada fase es la suma del tiempo de todos los hilos, por lo que con
+# operaciones simultáneas puede superar al tiempo total. La fase "wait" corresponde a la espera de las llamadas al API
+# en el regulador, por límites de uso y entre reintentos, y no se incluye en "network".
+PHASES = ["discovery", "hashing", "encoding", "network", "wait", "write"]
+
+# Percentiles de latencia informados.
+PERCENTILES = [50, 95, 99]
+
+
+class Tracer:
+    """
+    Registro de llamadas al API y tiempos por fase de una ejecución. Es compartido por todos los hilos.
+    Attributes:
+        started: Momento de inicio del registro, ver time.time.
+        calls: Llamadas registradas, en orden de finalización.
+        phases: Tiempo total y cantidad de mediciones de cada fase.
+    """
+    started = 0.0
+    calls = None
+    phases = None
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        Descarta los registros y reinicia el momento de inicio.
+        """
+        with self._lock:
+            self.started = time.time()
+            self._start = time.perf_counter()
+            self.calls = list()
+            self.phases = {name: {"seconds": 0.0, "count": 0} for name in PHASES}
+
+    def record(self, operation: str, secret: str | list[str], latency: float, size: int, retries: int, outcome: str, wait: float = 0.0) -> None:
+        """
+        Registra una llamada al API.
+        Parameters:
+            operation: Acción del API.
+            secret: Nombre del secreto, o nombres para llamadas por lotes.
+            latency: Duración de la llamada, sumando la de cada intento, en segundos.
+            size: Bytes de valores de secretos enviados y recibidos.
+            retries: Cantidad de reintentos.
+            outcome: "ok", o el código de error.
+            wait: Tiempo de espera en el regulador, por límites de uso y entre reintentos, en segundos.
+        """
+        call = {
+            "operation": operation,
+            "secret": secret,
+            "start": round(time.perf_counter() - self._start - latency - wait, 6),
+            "latency": round(latency, 6),
+            "wait": round(wait, 6),
+            "bytes": size,
+            "retries": retries,
+            "outcome": outcome
+        }
+        with self._lock:
+            self.calls.append(call)
+        self.add("network", latency)
+        self.add("wait", wait)
+
+    def add(self, phase: str, seconds: float) -> None:
+        """
+        Suma una medición de tiempo a una fase.
+        """
+        with self._lock:
+            self.phases[phase]["seconds"] += seconds
+            self.phases[phase]["count"] += 1
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Mide el tiempo del bloque indicado y lo suma a una fase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def iterate(self, name: str, iterable):
+        """
+        Retorna los elementos de un iterable, sumando a una fase el tiempo utilizado para obtener cada uno.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - start)
+                return
+            self.add(name, time.perf_counter() - start)
+            yield item
+
+    def elapsed(self) -> float:
+        """
+        Retorna el tiempo transcurrido desde el inicio del registro, en segundos.
+        """
+        return time.perf_counter() - self._start
+
+    def summary(self) -> dict:
+        """
+        Retorna, para cada acción del API, la cantidad de llamadas, errores, reintentos, bytes, tiempo de espera en el
+        regulador, percentiles de latencia y throughput; y el tiempo de cada fase.
+        """
+        elapsed = max(self.elapsed(), 1e-9)
+        with self._lock:
+            calls = list(self.calls)
+            phases = {name: dict(value) for name, value in self.phases.items()}
+
+        operations = dict()
+        for call in calls:
+            operations.setdefault(call["operation"], list()).append(call)
+        summary = {"elapsed": round(elapsed, 6), "operations": dict(), "phases": phases}
+        for operation, items in sorted(operations.items()):
+            latencies = sorted(call["latency"] for call in items)
+            size = sum(call["bytes"] for call in items)
+            summary["operations"][operation] = {
+                "calls": len(items),
+                "errors": len([call for call in items if call["outcome"] != "ok"]),
+                "retries": sum(call["retries"] for call in items),
+                "bytes": size,
+                "wait": round(sum(call.get("wait", 0.0) for call in items), 6),
+                "latency": {"p{0}".format(p): round(percentile(latencies, p), 6) for p in PERCENTILES},
+                "calls_per_second": round(len(items) / elapsed, 3),
+                "bytes_per_second": round(size / elapsed, 3)
+            }
+        return summary
+
+    def print_stats(self) -> None:
+        """
+        Imprime los percentiles de latencia y throughput de cada acción del API, y el tiempo de cada fase.
+        """
+        summary = self.summary()
+        print("\n{0}Estadísticas ({1:.2f}s):{2}".format(utils.bcolors.OKCYAN, summary["elapsed"], utils.bcolors.ENDC))
+        for operation, stats in summary["operations"].items():
+            latency = stats["latency"]
+            print("{0}: {1} llamadas ({2:.1f}/s, {3:.1f} KB/s), p50 {4:.1f}ms, p95 {5:.1f}ms, p99 {6:.1f}ms, errores: {7}, reintentos: {8}, espera: {9:.2f}s.".format(
+                operation,
+                stats["calls"],
+                stats["calls_per_second"],
+                stats["bytes_per_second"] / 1024,
+                latency["p50"] * 1000,
+                latency["p95"] * 1000,
+                latency["p99"] * 1000,
+                stats["errors"],
+                stats["retries"],
+                stats["wait"]
+            ))
+        phases = ", ".join("{0} {1:.2f}s".format(name, value["seconds"]) for name, value in summary["phases"].items())
+        print("Fases: " + phases + ".")
+
+    def save(self, path: str, profile: list[dict] | None = None) -> None:
+        """
+        Guarda el registro completo en formato JSON.
+        Parameters:
+            path: Archivo de destino.
+            profile: Funciones con mayor tiempo acumulado según cProfile, si hubiere.
+        """
+        with self._lock:
+            calls = list(self.calls)
+        report = {
+            "started": self.started,
+            "summary": self.summary(),
+            "calls": calls
+        }
+        if profile != None:
+            report["profile"] = profile
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+def percentile(values: list[float], p: float) -> float:
+    """
+    Retorna el percentil `p` de una lista ordenada de valores, por el método del rango más cercano.
+    """
+    if len(values) == 0:
+        return 0.0
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
+# Registro compartido por toda la ejecución.
+tracer = Tracer()
@@ -1,5 +1,25 @@
+import fnmatch
 import hashlib
+import json
 import os
+import stat
+import tempfile
+from . import pack
+
+
+# Extensión de archivos de tipo descriptor.
+DESCRIPTOR_EXTENSION = ".aws_secrets"
+
+# Carpetas que no se recorren al buscar descriptores de forma recursiva.
+DEFAULT_IGNORE = [".git", "node_modules", "vendor"]
+
+# Versión del formato de caché de descubrimiento de descriptores.
+DISCOVERY_CACHE_VERSION = 1
+
+# Máscara de permisos del proceso, leída una única vez al importar el módulo. os.umask solo permite leerla
+# modificándola, lo que afectaría a la creación de archivos en otros hilos.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
 
 class bcolors:
@@ -33,16 +53,19 @@ class DescriptorFileEntry:
     Attributes:
         filename: nombre para archivo en sistema de archivos local.
         secretname: nombre para secreto en Secrets Manager.
+        pack: nombre del secreto en el que se agrupan los archivos pequeños del descriptor, si hubiere, ver pack.
     """
     filename = ""
     secretname = ""
+    pack = None
 
-    def __init__(self, filename, secretname):
+    def __init__(self, filename, secretname, pack=None):
         """
         Constructor
         """
         self.filename = filename
         self.secretname = secretname
+        self.pack = pack
 
     def __repr__(self):
         """
@@ -51,38 +74,342 @@ class DescriptorFileEntry:
         return "[{0} → {1}]".format(self.filename, self.secretname)
 
 
-def get_descriptor_files(path: str) -> list[str]:
+class FileTask:
+    """
+    Estado de procesamiento de una entrada de archivo descriptor.
+    Attributes:
+        entry: Entrada de archivo descriptor.
+        targetfile: Path de archivo local asociado.
+        failed: Indica si el procesamiento falló.
+        skipped: Indica si el archivo se omitió por no tener cambios.
+        messages: Mensajes a imprimir al finalizar el procesamiento.
+        lock: Manifiesto de sincronización del descriptor, si hubiere, ver lock.Lock.
+        stat: Tamaño y fecha de modificación del archivo local al leerlo o escribirlo, ver lock.file_stat.
+    """
+    entry = None
+    targetfile = ""
+    failed = False
+    skipped = False
+    messages = None
+    lock = None
+    stat = None
+
+    def __init__(self, entry: DescriptorFileEntry, targetfile: str):
+        """
+        Constructor
+        """
+        self.entry = entry
+        self.targetfile = targetfile
+        self.failed = False
+        self.skipped = False
+        self.messages = list()
+        self.lock = None
+        self.stat = None
+
+    def log(self, message: str) -> None:
+        """
+        Registra un mensaje a imprimir al finalizar el procesamiento. Los mensajes se agrupan por archivo para que la
+        salida no se entremezcle al procesar varios archivos en paralelo.
+        """
+        self.messages.append(message)
+
+    def flush(self) -> None:
+        """
+        Imprime los mensajes registrados.
+        """
+        for message in self.messages:
+            print(message)
+        self.messages.clear()
+
+
+def print_summary(tasks: list[FileTask]) -> None:
+    """
+    Imprime la cantidad de archivos transferidos, omitidos y fallidos.
+    Parameters:
+        tasks: Archivos procesados.
+    """
+    failed = len([task for task in tasks if task.failed])
+    skipped = len([task for task in tasks if task.failed is False and task.skipped])
+    transferred = len(tasks) - failed - skipped
+    color = bcolors.FAIL if failed > 0 else bcolors.OKCYAN
+    print("\n{0}Resumen: {1} transferidos, {2} omitidos, {3} fallidos.{4}".format(color, transferred, skipped, failed, bcolors.ENDC))
+
+
+def get_descriptor_files(path: str, recursive: bool = False, ignore: list[str] | None = None, cache: bool = True) -> list[str]:
     """
     Obtiene la lista de archivos de tipo descriptor. Archivos con extensión: .aws_secrets.
     Parameters:
         path: Path donde buscar los archivos de tipo descriptor.
+        recursive: Buscar también en subcarpetas, omitiendo DEFAULT_IGNORE y las carpetas indicadas en `ignore`.
+        ignore: Patrones glob de carpetas o descriptores a omitir, aplicados al nombre y al path relativo a `path`.
+        cache: Reutilizar el resultado de una búsqueda recursiva anterior si ninguna carpeta fue modificada.
     """
-    filepaths = list()
-    for filepath in os.listdir(path):
-        if filepath.endswith(".aws_secrets"):
-            p = os.path.join(path, filepath).strip()
-            filepaths.append(p)
-    return filepaths
+    if recursive is False:
+        filepaths = list()
+        for filepath in os.listdir(path):
+            if filepath.endswith(DESCRIPTOR_EXTENSION):
+                p = os.path.join(path, filepath).strip()
+                filepaths.append(p)
+        return filepaths
+
+    patterns = DEFAULT_IGNORE + (ignore if ignore != None else [])
+    cachefile = None
+    if cache:
+        try:
+            cachefile = discovery_cache_file(path)
+        except OSError:
+            cachefile = None
+    if cachefile != None:
+        descriptors = load_discovery_cache(cachefile, path, patterns)
+        if descriptors != None:
+            return [os.path.join(path, descriptor) for descriptor in descriptors]
+
+    descriptors, folders = walk_descriptor_files(path, patterns)
+    if cachefile != None:
+        save_discovery_cache(cachefile, path, patterns, descriptors, folders)
+    return [os.path.join(path, descriptor) for descriptor in descriptors]
+
+
+def ignored(name: str, relpath: str, patterns: list[str]) -> bool:
+    """
+    Verifica si una carpeta o archivo coincide con alguno de los patrones a omitir, por nombre o por path relativo.
+    """
+    relpath = relpath.replace(os.sep, "/")
+    for pattern in patterns:
+        if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relpath, pattern):
+            return True
+    return False
+
+
+def walk_descriptor_files(path: str, patterns: list[str]) -> tuple[list[str], dict[str, int]]:
+    """
+    Recorre la carpeta indicada y sus subcarpetas con os.scandir, sin recorrer las carpetas que coinciden con los
+    patrones indicados.
+    Parameters:
+        path: Carpeta a recorrer.
+        patterns: Patrones glob a omitir.
+    Returns:
+        Paths de descriptores relativos a `path`, y fecha de modificación (ns) de cada carpeta recorrida.
+    """
+    descriptors = list()
+    folders = dict()
+    stack = [""]
+    while len(stack) > 0:
+        relfolder = stack.pop()
+        folder = os.path.join(path, relfolder) if relfolder != "" else path
+        try:
+            folders[relfolder] = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as it:
+                for entry in it:
+                    relpath = os.path.join(relfolder, entry.name) if relfolder != "" else entry.name
+                    if entry.is_dir(follow_symlinks=False):
+                        if ignored(entry.name, relpath, patterns) is False:
+                            stack.append(relpath)
+                    elif entry.name.endswith(DESCRIPTOR_EXTENSION) and entry.is_file():
+                        if ignored(entry.name, relpath, patterns) is False:
+                            descriptors.append(relpath)
+        except (PermissionError, FileNotFoundError):
+            continue
+    descriptors.sort()
+    return descriptors, folders
+
+
+def cache_dir() -> str:
+    """
+    Retorna la carpeta de caché de la herramienta, creándola si no existe.
+    """
+    base = os.environ.get("XDG_CACHE_HOME", "")
+    if base == "":
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    folder = os.path.join(base, "aws_secrets_fs")
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def discovery_cache_file(path: str) -> str:
+    """
+    Retorna el path del archivo de caché de descubrimiento de descriptores para la carpeta indicada.
+    """
+    key = hashlib.sha256(os.path.abspath(path).encode("utf-8")).hexdigest()[:32]
+    return os.path.join(cache_dir(), "discovery-" + key + ".json")
+
+
+def load_discovery_cache(cachefile: str, path: str, patterns: list[str]) -> list[str] | None:
+    """
+    Retorna los descriptores registrados en caché si las carpetas recorridas no fueron modificadas desde entonces.
+    Al agregar, eliminar o renombrar un archivo o carpeta se modifica la fecha de la carpeta que lo contiene, por lo
+    que basta con comparar la fecha de cada carpeta, sin volver a listarlas.
+    """
+    try:
+        with open(cachefile, "r", encoding="utf-8") as file:
+            cache = json.load(file)
+        if cache.get("v") != DISCOVERY_CACHE_VERSION or cache.get("root") != os.path.abspath(path) or cache.get("ignore") != patterns:
+            return None
+        for relfolder, mtime in cache["folders"].items():
+            folder = os.path.join(path, relfolder) if relfolder != "" else path
+            if os.stat(folder).st_mtime_ns != mtime:
+                return None
+        return cache["descriptors"]
+    except Exception:
+        return None
+
+
+def save_discovery_cache(cachefile: str, path: str, patterns: list[str], descriptors: list[str], folders: dict[str, int]) -> None:
+    """
+    Registra en caché los descriptores encontrados junto a la fecha de modificación de cada carpeta recorrida. Los
+    errores de escritura se ignoran, la caché es solo una optimización.
+    """
+    cache = {
+        "v": DISCOVERY_CACHE_VERSION,
+        "root": os.path.abspath(path),
+        "ignore": patterns,
+        "folders": folders,
+        "descriptors": descriptors
+    }
+    try:
+        tmppath = cachefile + ".{0}.tmp".format(os.getpid())
+        with open(tmppath, "w", encoding="utf-8") as file:
+            json.dump(cache, file)
+        os.replace(tmppath, cachefile)
+    except Exception:
+        pass
 
 
 def parse_descriptor_file(path: str) -> list[DescriptorFileEntry]:
     """
-    Parsea el contenido de un archivo de tipo descriptor y retorna las entradas encontradas.
+    Parsea el contenido de un archivo de tipo descriptor y retorna las entradas encontradas. Con la directiva
+    `@pack => <secreto>`, todas las entradas del descriptor se asocian a ese secreto, ver pack.
     Parameters:
         path: Path de archivo tipo descriptor.
     """
     entries = list()
+    pack_secret = None
     with open(path, "r", encoding="utf-8") as file:
         lines = file.readlines()
         for line in lines:
             line = line.strip()
             if line != "" and line.startswith("#") is False:
                 a, b = line.split("=>")
+                if a.strip() == pack.PACK_DIRECTIVE:
+                    pack_secret = b.strip()
+                    continue
                 entry = DescriptorFileEntry(a.strip(), b.strip())
                 entries.append(entry)
+    for entry in entries:
+        entry.pack = pack_secret
     return entries
 
 
+class HashingReader:
+    """
+    Envoltorio para archivos abiertos en modo binario que calcula el hash md5 y tamaño del contenido a medida que se
+    lee, evitando una segunda lectura del archivo.
+    Attributes:
+        file: Archivo envuelto.
+        md5: Hash md5 del contenido leído.
+        size: Cantidad de bytes leídos.
+    """
+    file = None
+    md5 = None
+    size = 0
+
+    def __init__(self, file):
+        """
+        Constructor
+        """
+        self.file = file
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """
+        Lee del archivo envuelto y actualiza el hash con el contenido leído.
+        """
+        data = self.file.read(size)
+        self.md5.update(data)
+        self.size += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        """
+        Retorna el hash md5 del contenido leído hasta el momento.
+        """
+        return self.md5.hexdigest()
+
+
+class AtomicWriter:
+    """
+    Escribe un archivo a través de un archivo temporal en la misma carpeta, calculando su hash md5 a medida que se
+    escribe. El archivo destino solo se reemplaza, de forma atómica, si el hash coincide con el esperado. Ante
+    cualquier error el archivo destino no se modifica.
+    Attributes:
+        path: Path de archivo destino.
+        tmppath: Path de archivo temporal.
+        md5: Hash md5 del contenido escrito.
+        size: Cantidad de bytes escritos.
+    """
+    path = ""
+    tmppath = ""
+    md5 = None
+    size = 0
+    _file = None
+
+    def __init__(self, path: str):
+        """
+        Constructor. Crea el archivo temporal.
+        """
+        self.path = path
+        self.md5 = hashlib.md5()
+        self.size = 0
+        folder, name = os.path.split(os.path.abspath(path))
+        fd, self.tmppath = tempfile.mkstemp(prefix="." + name + ".", suffix=".tmp", dir=folder)
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data: bytes) -> None:
+        """
+        Escribe contenido al final del archivo temporal.
+        """
+        self._file.write(data)
+        self.md5.update(data)
+        self.size += len(data)
+
+    def commit(self, expected_hash: str) -> bool:
+        """
+        Cierra el archivo temporal y, si su hash coincide con el esperado, reemplaza el archivo destino. En caso
+        contrario se descarta el archivo temporal.
+        Parameters:
+            expected_hash: Hash md5 esperado.
+        """
+        if self.md5.hexdigest() != expected_hash:
+            self.abort()
+            return False
+
+        # Conservar los permisos del archivo reemplazado, o los permisos por defecto para archivos nuevos. Los permisos
+        # se aplican sobre el descriptor abierto, donde esté disponible.
+        if os.path.exists(self.path):
+            mode = stat.S_IMODE(os.stat(self.path).st_mode)
+        else:
+            mode = 0o666 & ~_UMASK
+        if hasattr(os, "fchmod"):
+            os.fchmod(self._file.fileno(), mode)
+            self._file.close()
+        else:
+            self._file.close()
+            os.chmod(self.tmppath, mode)
+        os.replace(self.tmppath, self.path)
+        return True
+
+    def abort(self) -> None:
+        """
+        Descarta el archivo temporal sin modificar el archivo destino.
+        """
+        self._file.close()
+        try:
+            os.remove(self.tmppath)
+        except FileNotFoundError:
+            pass
+
+
 def hash_file(path: str) -> str:
     """
     Obtiene el valor de hash md5 para un archivo dado.
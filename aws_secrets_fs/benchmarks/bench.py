@@ -0,0 +1,426 @@
+"""
+Pruebas de rendimiento de aws_secrets_fs contra un reemplazo en memoria de AWS Secrets Manager.
+
+Cada escenario se ejecuta en un proceso separado y registra tiempo total, cantidad de llamadas al API, bytes
+transferidos y memoria máxima (RSS). Los resultados se comparan contra una línea base, y cualquier regresión por
+encima de la tolerancia finaliza con error.
+
+Uso, desde la carpeta del paquete:
+
+    python -m benchmarks.bench
+    python -m benchmarks.bench --full --output resultados.json
+    python -m benchmarks.bench --save
+
+Los escenarios de inicio ejecutan la herramienta con `python -X importtime` y finalizan con error si se importa boto3
+sin necesidad. Los escenarios de memoria miden con tracemalloc la memoria asignada durante la subida, y finalizan con
+error si crece con el tamaño del archivo.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from aws_secrets_fs import utils
+
+KB = 1024
+MB = 1024 * KB
+
+# Escenarios disponibles. Los escenarios "full" solo se ejecutan con --full.
+SCENARIOS = {
+    "upload-1k-x1": {"kind": "upload", "size": KB, "count": 1},
+    "upload-1k-x1000": {"kind": "upload", "size": KB, "count": 1000},
+    "upload-1m-x10": {"kind": "upload", "size": MB, "count": 10},
+    "upload-100m-x1": {"kind": "upload", "size": 100 * MB, "count": 1, "full": True},
+    "download-1k-x1": {"kind": "download", "size": KB, "count": 1},
+    "download-1k-x1000": {"kind": "download", "size": KB, "count": 1000},
+    "download-1m-x10": {"kind": "download", "size": MB, "count": 10},
+    "download-100m-x1": {"kind": "download", "size": 100 * MB, "count": 1, "full": True},
+    "upload-pack-1k-x200": {"kind": "upload", "size": KB, "count": 200, "pack": True},
+    "download-pack-1k-x200": {"kind": "download", "size": KB, "count": 200, "pack": True},
+    "replica-1k-x100": {"kind": "replica", "size": KB, "count": 100, "regions": 3},
+    "upload-memory-50m": {"kind": "memory", "size": 50 * MB, "count": 1, "reference": 5 * MB, "full": True},
+    "discovery-x1": {"kind": "discovery", "count": 1},
+    "discovery-x1000": {"kind": "discovery", "count": 1000},
+    "discovery-100k-files": {"kind": "discovery", "count": 1000, "files": 100000, "full": True},
+    "discovery-100k-files-cached": {"kind": "discovery", "count": 1000, "files": 100000, "cached": True, "full": True},
+    "startup-help": {"kind": "startup", "args": ["--help"]},
+    "startup-check": {"kind": "startup", "args": ["--action", "check"]}
+}
+
+# Módulos que no deben importarse en los escenarios de inicio.
+LAZY_MODULES = ("boto3", "botocore", "cryptography")
+
+# Línea base por defecto.
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Tolerancia de regresión por métrica, como proporción sobre la línea base. El tiempo y la memoria dependen del
+# equipo; las llamadas y bytes transferidos son determinísticos.
+TOLERANCE = {
+    "wall": 0.5,
+    "rss": 0.25,
+    "calls": 0.0,
+    "bytes": 0.01,
+    "imports": 0.1,
+    "traced": 0.25
+}
+
+# Diferencia mínima por métrica para considerar una regresión, para evitar falsos positivos en escenarios breves.
+MIN_DELTA = {
+    "wall": 0.05,
+    "rss": 8 * MB,
+    "calls": 0,
+    "bytes": 0,
+    "imports": 10,
+    "traced": MB
+}
+
+# Factor aplicado a las cuotas del regulador de llamadas, para medir la herramienta y no las cuotas del servicio.
+QUOTA_SCALE = 100
+
+# Crecimiento máximo de la memoria medida con tracemalloc, en bytes por cada byte de aumento del tamaño del archivo.
+# La memoria depende de la cantidad de partes, por sus entradas en el índice y el trazado, y no de su contenido: leer
+# el archivo completo en memoria supera 1.
+MAX_MEMORY_GROWTH = 0.25
+
+# Semilla para el contenido de los archivos generados.
+SEED = 1234
+
+
+def write_random_file(path: str, size: int, rnd: random.Random) -> None:
+    """
+    Genera un archivo con contenido aleatorio, por bloques, sin cargarlo por completo en memoria.
+    """
+    with open(path, "wb") as file:
+        remaining = size
+        while remaining > 0:
+            block = min(remaining, MB)
+            file.write(rnd.randbytes(block))
+            remaining -= block
+
+
+def prepare_files(folder: str, size: int, count: int, pack: bool = False) -> None:
+    """
+    Genera `count` archivos de `size` bytes y su archivo descriptor en la carpeta indicada, con la directiva @pack si
+    se indica `pack`.
+    """
+    rnd = random.Random(SEED)
+    lines = ["@pack => /bench/pack"] if pack else list()
+    for i in range(count):
+        filename = "file{0}.bin".format(i)
+        write_random_file(os.path.join(folder, filename), size, rnd)
+        lines.append("{0} => /bench/file{1}".format(filename, i))
+    with open(os.path.join(folder, "bench.aws_secrets"), "w") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def prepare_tree(folder: str, count: int, files: int = 0) -> None:
+    """
+    Genera un árbol de carpetas con `count` archivos descriptores, y carpetas ignoradas con contenido. Si se indica
+    `files`, se agregan archivos vacíos hasta completar esa cantidad de archivos en el árbol, la mitad en las carpetas
+    de los descriptores y la mitad en las carpetas ignoradas.
+    """
+    for i in range(count):
+        subfolder = os.path.join(folder, "app{0}".format(i // 100), "module{0}".format(i % 100))
+        os.makedirs(subfolder, exist_ok=True)
+        with open(os.path.join(subfolder, "config.aws_secrets"), "w") as file:
+            file.write("config.json => /bench/config{0}\n".format(i))
+        with open(os.path.join(subfolder, "index.js"), "w") as file:
+            file.write("\n")
+    for i in range(count // 10):
+        subfolder = os.path.join(folder, "node_modules", "dep{0}".format(i))
+        os.makedirs(subfolder, exist_ok=True)
+        with open(os.path.join(subfolder, "index.js"), "w") as file:
+            file.write("\n")
+    for i in range(files - 2 * count - count // 10):
+        if i % 2 == 0:
+            j = i // 2 % count
+            subfolder = os.path.join(folder, "app{0}".format(j // 100), "module{0}".format(j % 100))
+        else:
+            subfolder = os.path.join(folder, "node_modules", "dep{0}".format(i // 2 % max(1, count // 10)))
+            os.makedirs(subfolder, exist_ok=True)
+        open(os.path.join(subfolder, "file{0}.txt".format(i)), "w").close()
+
+
+def run_startup(folder: str, args: list[str]) -> dict:
+    """
+    Ejecuta la herramienta en un proceso separado con `-X importtime` y retorna el tiempo total, la cantidad de
+    módulos importados y la memoria máxima del proceso. Los archivos de configuración de AWS se generan en la carpeta
+    indicada.
+    """
+    os.makedirs(os.path.join(folder, ".aws"))
+    with open(os.path.join(folder, ".aws", "config"), "w") as file:
+        file.write("[default]\nregion = us-east-1\n\n[profile bench]\nregion = us-east-1\n")
+    env = dict(os.environ, AWS_CONFIG_FILE=os.path.join(folder, ".aws", "config"), AWS_SHARED_CREDENTIALS_FILE=os.path.join(folder, ".aws", "credentials"))
+    command = [sys.executable, "-X", "importtime", "-m", "aws_secrets_fs"] + args
+    start = time.perf_counter()
+    proc = subprocess.run(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError("Falló la ejecución: " + proc.stdout + proc.stderr)
+
+    modules = [line.split("|")[-1].strip() for line in proc.stderr.splitlines() if line.startswith("import time:") and "|" in line]
+    modules = [module for module in modules if module != "package"]
+    loaded = sorted(set(module.split(".")[0] for module in modules if module.split(".")[0] in LAZY_MODULES))
+    if len(loaded) > 0:
+        raise RuntimeError("Se importaron módulos innecesarios: " + ", ".join(loaded))
+    rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if sys.platform != "darwin":
+        rss = rss * 1024
+    return {"wall": round(wall, 4), "calls": 0, "bytes": 0, "imports": len(modules), "rss": rss}
+
+
+def run_replica(folder: str, scenario: dict, fakes: list, jobs: int) -> float:
+    """
+    Sube los archivos a varias regiones, cada una con su propio reemplazo de AWS Secrets Manager, elimina las partes
+    de la región más rápida y los descarga de todas las regiones, de manera que la descarga deba pasar a otra región.
+    Retorna el tiempo de la subida y descarga.
+    """
+    from aws_secrets_fs import opt_download, opt_upload
+
+    regions = ["region-{0}".format(i) for i in range(len(fakes))]
+    start = time.perf_counter()
+    opt_upload.run(folder, "bench", regions, jobs)
+    for name in [name for name in fakes[0].secrets.keys() if name.endswith(".index") is False]:
+        del fakes[0].secrets[name]
+    for i in range(scenario["count"]):
+        os.remove(os.path.join(folder, "file{0}.bin".format(i)))
+    opt_download.run(folder, "bench", regions, jobs)
+    wall = time.perf_counter() - start
+    for i in range(scenario["count"]):
+        if os.path.exists(os.path.join(folder, "file{0}.bin".format(i))) is False:
+            raise RuntimeError("No se descargó file{0}.bin.".format(i))
+    return wall
+
+
+def run_memory(folder: str, scenario: dict, fake, jobs: int) -> tuple[float, int]:
+    """
+    Sube un archivo de tamaño de referencia y luego uno de `size` bytes, cada uno en su propia carpeta, midiendo con
+    tracemalloc la memoria máxima asignada durante cada subida. Los valores de los secretos se descartan, ver
+    FakeSecretsManager.discard. Finaliza con error si la memoria crece con el tamaño del archivo por encima de
+    MAX_MEMORY_GROWTH. Retorna el tiempo y la memoria máxima de la subida del archivo de mayor tamaño; las llamadas y
+    bytes registrados corresponden a esa subida.
+    """
+    from aws_secrets_fs import opt_upload
+
+    fake.discard = True
+    sizes = [scenario["reference"], scenario["size"]]
+    peaks = list()
+    for i, size in enumerate(sizes):
+        subfolder = os.path.join(folder, "size{0}".format(i))
+        os.makedirs(subfolder)
+        prepare_files(subfolder, size, 1)
+        fake.secrets.clear()
+        fake.calls.clear()
+        fake.bytes_in = 0
+        fake.bytes_out = 0
+        tracemalloc.start()
+        try:
+            start = time.perf_counter()
+            opt_upload.run(subfolder, "bench", "", jobs)
+            wall = time.perf_counter() - start
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+        os.remove(os.path.join(subfolder, "file0.bin"))
+
+    growth = (peaks[1] - peaks[0]) / (sizes[1] - sizes[0])
+    if growth > MAX_MEMORY_GROWTH:
+        raise RuntimeError("La memoria crece con el tamaño del archivo: {0} bytes con {1} bytes, {2} bytes con {3} bytes.".format(peaks[0], sizes[0], peaks[1], sizes[1]))
+    return wall, peaks[1]
+
+
+def verify(folder: str, scenario: dict, fake) -> None:
+    """
+    Verifica que la subida registró el índice de cada archivo, o que la descarga escribió cada archivo, de manera que
+    un escenario con errores no se informe como válido.
+    """
+    names = ["/bench/pack"] if scenario.get("pack", False) else ["/bench/file{0}".format(i) for i in range(scenario["count"])]
+    for name in names:
+        if name + ".index" not in fake.secrets:
+            raise RuntimeError("No se registró el índice de {0}.".format(name))
+    for i in range(scenario["count"]):
+        if scenario["kind"] == "download" and os.path.exists(os.path.join(folder, "file{0}.bin".format(i))) is False:
+            raise RuntimeError("No se descargó file{0}.bin.".format(i))
+
+
+def run_scenario(name: str, latency: float, throttle: int, error_rate: float, jobs: int) -> dict:
+    """
+    Ejecuta un escenario en el proceso actual y retorna sus métricas.
+    """
+    from aws_secrets_fs import aws, governor, opt_download, opt_upload
+    from benchmarks.fake import FakeSecretsManager
+
+    scenario = SCENARIOS[name]
+    folder = tempfile.mkdtemp(prefix="aws_secrets_fs_bench_")
+    if scenario["kind"] == "startup":
+        try:
+            return run_startup(folder, scenario["args"])
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    os.environ["XDG_CACHE_HOME"] = os.path.join(folder, ".cache")
+    fake = FakeSecretsManager(latency, throttle, error_rate, SEED)
+    quotas = {action: quota * QUOTA_SCALE for action, quota in governor.QUOTAS.items()}
+    aws.reset_clients()
+    aws.set_client("bench", "", fake, quotas)
+
+    # Un reemplazo por región, con latencia creciente.
+    fakes = [fake]
+    if scenario["kind"] == "replica":
+        fakes = [FakeSecretsManager(latency * (i + 1), throttle, error_rate, SEED + i) for i in range(scenario["regions"])]
+        for i, region_fake in enumerate(fakes):
+            aws.set_client("bench", "region-{0}".format(i), region_fake, quotas)
+
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            if scenario["kind"] == "discovery":
+                # El árbol se genera en una subcarpeta, fuera de la caché de búsqueda.
+                tree = os.path.join(folder, "tree")
+                prepare_tree(tree, scenario["count"], scenario.get("files", 0))
+                cached = scenario.get("cached", False)
+                if cached:
+                    utils.get_descriptor_files(tree, recursive=True)
+                start = time.perf_counter()
+                found = utils.get_descriptor_files(tree, recursive=True, cache=cached)
+                wall = time.perf_counter() - start
+                if len(found) != scenario["count"]:
+                    raise RuntimeError("Se encontraron {0} descriptores.".format(len(found)))
+            elif scenario["kind"] == "replica":
+                prepare_files(folder, scenario["size"], scenario["count"])
+                wall = run_replica(folder, scenario, fakes, jobs)
+            elif scenario["kind"] == "memory":
+                wall, traced = run_memory(folder, scenario, fake, jobs)
+                verify(folder, scenario, fake)
+            else:
+                prepare_files(folder, scenario["size"], scenario["count"], scenario.get("pack", False))
+                if scenario["kind"] == "download":
+                    opt_upload.run(folder, "bench", "", jobs)
+                    for i in range(scenario["count"]):
+                        os.remove(os.path.join(folder, "file{0}.bin".format(i)))
+                    fake.calls.clear()
+                    fake.bytes_in = 0
+                    fake.bytes_out = 0
+                start = time.perf_counter()
+                if scenario["kind"] == "upload":
+                    opt_upload.run(folder, "bench", "", jobs)
+                else:
+                    opt_download.run(folder, "bench", "", jobs)
+                wall = time.perf_counter() - start
+                verify(folder, scenario, fake)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    # ru_maxrss se informa en KB en Linux y en bytes en macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        rss = rss * 1024
+    metrics = {
+        "wall": round(wall, 4),
+        "calls": sum(sum(item.calls.values()) for item in fakes),
+        "bytes": sum(item.bytes_in + item.bytes_out for item in fakes),
+        "rss": rss
+    }
+    if scenario["kind"] == "memory":
+        metrics["traced"] = traced
+    return metrics
+
+
+def compare(results: dict, baseline: dict) -> list[str]:
+    """
+    Compara los resultados contra la línea base y retorna la descripción de cada regresión encontrada.
+    """
+    regressions = list()
+    for name, metrics in results.items():
+        base = baseline.get(name)
+        if base == None:
+            continue
+        for metric, tolerance in TOLERANCE.items():
+            if metric in base and metric in metrics and metrics[metric] > base[metric] * (1 + tolerance) and metrics[metric] - base[metric] > MIN_DELTA[metric]:
+                regressions.append("{0}: {1} {2} > {3} (+{4:.0%})".format(name, metric, metrics[metric], base[metric], metrics[metric] / max(base[metric], 1e-9) - 1))
+    return regressions
+
+
+def main() -> None:
+    """
+    Ejecuta los escenarios indicados y compara los resultados contra la línea base.
+    """
+    parser = argparse.ArgumentParser(prog="benchmarks.bench", description="Pruebas de rendimiento de aws_secrets_fs.")
+    parser.add_argument("--only", type=str, action="append", required=False, choices=list(SCENARIOS.keys()), help="Escenario a ejecutar. Puede indicarse varias veces.")
+    parser.add_argument("--full", action="store_true", help="Incluir los escenarios de archivos y árboles de carpetas grandes.")
+    parser.add_argument("--latency", type=float, default=0.002, help="Latencia de cada llamada, en segundos.")
+    parser.add_argument("--throttle", type=int, default=0, help="Llamadas por segundo por acción por encima de las cuales se responde ThrottlingException.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probabilidad de error transitorio en cada llamada.")
+    parser.add_argument("--jobs", type=int, default=8, help="Cantidad de operaciones simultáneas.")
+    parser.add_argument("--baseline", type=str, default=BASELINE, help="Archivo de línea base.")
+    parser.add_argument("--save", action="store_true", help="Guardar los resultados como línea base.")
+    parser.add_argument("--output", type=str, required=False, help="Archivo JSON donde guardar los resultados.")
+    parser.add_argument("--run", type=str, required=False, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Ejecución de un escenario en un proceso separado.
+    if args.run != None:
+        print(json.dumps(run_scenario(args.run, args.latency, args.throttle, args.error_rate, args.jobs)))
+        return
+
+    names = args.only if args.only != None else [name for name, scenario in SCENARIOS.items() if args.full or scenario.get("full", False) is False]
+    params = {"latency": args.latency, "throttle": args.throttle, "error_rate": args.error_rate, "jobs": args.jobs}
+    results = dict()
+    for name in names:
+        command = [sys.executable, "-m", "benchmarks.bench", "--run", name]
+        command += ["--latency", str(args.latency), "--throttle", str(args.throttle), "--error-rate", str(args.error_rate), "--jobs", str(args.jobs)]
+        proc = subprocess.run(command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(proc.stderr)
+            print(utils.bcolors.FAIL + "Error: falló el escenario " + name + "." + utils.bcolors.ENDC)
+            exit(1)
+        results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+        metrics = results[name]
+        line = "{0:<28} {1:>9.3f}s {2:>7} llamadas {3:>12} bytes {4:>7.1f} MB RSS".format(name, metrics["wall"], metrics["calls"], metrics["bytes"], metrics["rss"] / MB)
+        if "traced" in metrics:
+            line += " {0:>7.1f} MB tracemalloc".format(metrics["traced"] / MB)
+        print(line)
+
+    report = {"params": params, "results": results}
+    if args.output != None:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.save:
+        baseline = dict()
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r") as file:
+                baseline = json.load(file).get("results", dict())
+        baseline.update(results)
+        with open(args.baseline, "w") as file:
+            json.dump({"params": params, "results": baseline}, file, indent=2, sort_keys=True)
+            file.write("\n")
+        print("Línea base guardada: " + args.baseline)
+        return
+
+    if os.path.exists(args.baseline) is False:
+        print("Sin línea base para comparar: " + args.baseline)
+        return
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)
+    if baseline.get("params") != params:
+        print(utils.bcolors.WARNING + "Advertencia: la línea base se generó con otros parámetros, no se compara: " + json.dumps(baseline.get("params")) + utils.bcolors.ENDC)
+        return
+    regressions = compare(results, baseline.get("results", dict()))
+    if len(regressions) > 0:
+        print(utils.bcolors.FAIL + "\nREGRESIÓN DE RENDIMIENTO:")
+        for regression in regressions:
+            print("  " + regression)
+        print(utils.bcolors.ENDC)
+        exit(1)
+    print("\nSin regresiones respecto de la línea base.")
+
+
+if __name__ == "__main__":
+    main()
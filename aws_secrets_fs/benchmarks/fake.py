@@ -0,0 +1,182 @@
+import datetime
+import random
+import threading
+import time
+import uuid
+from botocore.exceptions import ClientError
+
+
+# Tamaño máximo del valor de un secreto, SecretString o SecretBinary, en bytes, según las cuotas del servicio.
+MAX_SECRET_SIZE = 65536
+
+
+class FakeSecretsManager:
+    """
+    Reemplazo en memoria del cliente de AWS Secrets Manager, con la interfaz del cliente de boto3 utilizada por la
+    herramienta. Permite inyectar latencia, límites de uso y errores transitorios, y registra la cantidad de llamadas y
+    bytes transferidos.
+    Attributes:
+        latency: Latencia de cada llamada, en segundos. Se agrega una variación aleatoria de hasta el 50%.
+        throttle_rate: Cantidad máxima de llamadas por segundo por acción. Por encima se responde ThrottlingException.
+            0 para no limitar.
+        error_rate: Probabilidad de responder InternalServiceError en cada llamada.
+        denied: Acciones a las que se responde AccessDeniedException, como ante un permiso faltante en IAM.
+        discard: Descartar el valor de los secretos registrados, conservando sus metadatos, de manera que no se
+            incluyan en la memoria medida.
+        secrets: Secretos registrados, indexados por nombre.
+        calls: Cantidad de llamadas por acción.
+        bytes_in: Bytes de valores de secretos recibidos.
+        bytes_out: Bytes de valores de secretos enviados.
+    """
+    latency = 0.0
+    throttle_rate = 0
+    error_rate = 0.0
+    denied = None
+    discard = False
+    secrets = None
+    calls = None
+    bytes_in = 0
+    bytes_out = 0
+
+    def __init__(self, latency: float = 0.0, throttle_rate: int = 0, error_rate: float = 0.0, seed: int = 0):
+        """
+        Constructor
+        """
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.denied = set()
+        self.discard = False
+        self.secrets = dict()
+        self.calls = dict()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self._random = random.Random(seed)
+        self._window = dict()
+        self._lock = threading.Lock()
+
+    def _call(self, action: str) -> None:
+        """
+        Registra una llamada, aplicando permisos, límites de uso, errores inyectados y latencia.
+        """
+        with self._lock:
+            self.calls[action] = self.calls.get(action, 0) + 1
+            if action in self.denied:
+                raise _error("AccessDeniedException", action, "User is not authorized to perform: secretsmanager:" + action)
+            if self.throttle_rate > 0:
+                now = time.monotonic()
+                window = [t for t in self._window.get(action, []) if now - t < 1.0]
+                if len(window) >= self.throttle_rate:
+                    self._window[action] = window
+                    raise _error("ThrottlingException", action, "Rate exceeded.")
+                window.append(now)
+                self._window[action] = window
+            failed = self.error_rate > 0 and self._random.random() < self.error_rate
+            delay = self.latency * (1 + self._random.random() / 2)
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise _error("InternalServiceError", action, "Injected error.")
+
+    def _value(self, name: str) -> dict:
+        """
+        Retorna el valor de un secreto en el formato de respuesta de get_secret_value.
+        """
+        secret = self.secrets[name]
+        response = {"ARN": "arn:" + name, "Name": name, "VersionId": secret["version"]}
+        response[secret["field"]] = secret["value"]
+        with self._lock:
+            self.bytes_out += len(secret["value"])
+        return response
+
+    def _store(self, action: str, name: str, values: dict) -> dict:
+        """
+        Registra un nuevo valor para un secreto. Los valores que exceden MAX_SECRET_SIZE se rechazan, como en el
+        servicio.
+        """
+        field = "SecretBinary" if "SecretBinary" in values else "SecretString"
+        value = values[field]
+        size = len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+        if size > MAX_SECRET_SIZE:
+            raise _error("ValidationException", action, "Secret value exceeds the maximum allowed size of {0} bytes.".format(MAX_SECRET_SIZE))
+        version = uuid.uuid4().hex
+        with self._lock:
+            self.secrets[name] = {"field": field, "value": value if self.discard is False else value[:0], "version": version, "changed": datetime.datetime.now(datetime.timezone.utc)}
+            self.bytes_in += len(value)
+        return {"ARN": "arn:" + name, "Name": name, "VersionId": version}
+
+    def get_secret_value(self, SecretId: str, **kwargs) -> dict:
+        """
+        Obtiene el valor de un secreto.
+        """
+        self._call("GetSecretValue")
+        if SecretId not in self.secrets:
+            raise _error("ResourceNotFoundException", "GetSecretValue", "Secrets Manager can't find the specified secret.")
+        return self._value(SecretId)
+
+    def batch_get_secret_value(self, SecretIdList: list[str], **kwargs) -> dict:
+        """
+        Obtiene el valor de varios secretos, informando los secretos inexistentes como errores.
+        """
+        self._call("BatchGetSecretValue")
+        values = list()
+        errors = list()
+        for name in SecretIdList:
+            if name in self.secrets:
+                values.append(self._value(name))
+            else:
+                errors.append({"SecretId": name, "ErrorCode": "ResourceNotFoundException", "Message": "Secrets Manager can't find the specified secret."})
+        return {"SecretValues": values, "Errors": errors}
+
+    def list_secrets(self, Filters: list[dict] | None = None, MaxResults: int = 100, NextToken: str | None = None, **kwargs) -> dict:
+        """
+        Retorna una página de metadatos de secretos, filtrando por prefijo de nombre sin distinguir mayúsculas.
+        """
+        self._call("ListSecrets")
+        names = sorted(self.secrets.keys())
+        for item in Filters or []:
+            if item["Key"] == "name":
+                prefixes = [value.lower() for value in item["Values"]]
+                names = [name for name in names if any(name.lower().startswith(prefix) for prefix in prefixes)]
+        start = int(NextToken or 0)
+        page = names[start:start + MaxResults]
+        response = {"SecretList": [{"ARN": "arn:" + name, "Name": name, "LastChangedDate": self.secrets[name]["changed"], "VersionIdsToStages": {self.secrets[name]["version"]: ["AWSCURRENT"]}} for name in page]}
+        if start + MaxResults < len(names):
+            response["NextToken"] = str(start + MaxResults)
+        return response
+
+    def create_secret(self, Name: str, **kwargs) -> dict:
+        """
+        Registra un nuevo secreto.
+        """
+        self._call("CreateSecret")
+        if Name in self.secrets:
+            raise _error("ResourceExistsException", "CreateSecret", "The secret already exists.")
+        return self._store("CreateSecret", Name, kwargs)
+
+    def update_secret(self, SecretId: str, **kwargs) -> dict:
+        """
+        Actualiza el valor de un secreto existente.
+        """
+        self._call("UpdateSecret")
+        if SecretId not in self.secrets:
+            raise _error("ResourceNotFoundException", "UpdateSecret", "Secrets Manager can't find the specified secret.")
+        return self._store("UpdateSecret", SecretId, kwargs)
+
+    def delete_secret(self, SecretId: str, **kwargs) -> dict:
+        """
+        Elimina un secreto existente.
+        """
+        self._call("DeleteSecret")
+        if SecretId not in self.secrets:
+            raise _error("ResourceNotFoundException", "DeleteSecret", "Secrets Manager can't find the specified secret.")
+        with self._lock:
+            del self.secrets[SecretId]
+        return {"ARN": "arn:" + SecretId, "Name": SecretId}
+
+
+def _error(code: str, action: str, message: str) -> ClientError:
+    """
+    Genera un error de aws con el código indicado.
+    """
+    return ClientError({"Error": {"Code": code, "Message": message}}, action)
@@ -13,5 +13,9 @@ setup(
     python_requires='>=3.10',
     install_requires=[
         'boto3==1.34.120'
-    ]
+    ],
+    extras_require={
+        'zstd': ['zstandard'],
+        'cache': ['cryptography']
+    }
 )
@@ -0,0 +1,37 @@
+import pytest
+from aws_secrets_fs import aws
+from aws_secrets_fs.trace import tracer
+from benchmarks.fake import FakeSecretsManager
+from .helpers import PROFILE, scaled_quotas
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path, monkeypatch):
+    """
+    Aísla cada prueba: caché de búsqueda en una carpeta temporal, sin clientes registrados y trazado reiniciado.
+    """
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / ".cache"))
+    aws.reset_clients()
+    tracer.reset()
+    yield
+    aws.reset_clients()
+
+
+@pytest.fixture
+def folder(tmp_path) -> str:
+    """
+    Carpeta de trabajo de la prueba.
+    """
+    path = tmp_path / "work"
+    path.mkdir()
+    return str(path)
+
+
+@pytest.fixture
+def fake() -> FakeSecretsManager:
+    """
+    Reemplazo de AWS Secrets Manager registrado para PROFILE en la región por defecto.
+    """
+    client = FakeSecretsManager()
+    aws.set_client(PROFILE, "", client, scaled_quotas())
+    return client
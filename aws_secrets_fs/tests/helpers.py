@@ -0,0 +1,83 @@
+import os
+import random
+import threading
+from aws_secrets_fs import governor
+from benchmarks.fake import _error
+
+
+# Perfil aws utilizado en las pruebas.
+PROFILE = "test"
+
+# Factor aplicado a las cuotas del regulador de llamadas, para no demorar las pruebas, ver benchmarks.bench.QUOTA_SCALE.
+QUOTA_SCALE = 100
+
+
+def scaled_quotas(scale: float = QUOTA_SCALE) -> dict[str, float]:
+    """
+    Retorna las cuotas del regulador de llamadas multiplicadas por `scale`.
+    """
+    return {action: quota * scale for action, quota in governor.QUOTAS.items()}
+
+
+def text_content(size: int, seed: int = 0) -> bytes:
+    """
+    Genera contenido de texto pseudoaleatorio y comprimible, de `size` bytes.
+    """
+    rnd = random.Random(seed)
+    words = [rnd.randbytes(4).hex().encode() for _ in range(5000)]
+    content = bytearray()
+    while len(content) < size:
+        content += rnd.choice(words) + b" "
+    return bytes(content[:size])
+
+
+def write_files(folder: str, files: dict[str, bytes], prefix: str = "/test/", descriptor: str = "test") -> None:
+    """
+    Escribe los archivos indicados y su archivo descriptor, asociando cada archivo al secreto `prefix` + nombre.
+    """
+    lines = list()
+    for filename, content in files.items():
+        with open(os.path.join(folder, filename), "wb") as file:
+            file.write(content)
+        lines.append("{0} => {1}{0}".format(filename, prefix))
+    with open(os.path.join(folder, descriptor + ".aws_secrets"), "w") as file:
+        file.write("\n".join(lines) + "\n")
+
+
+def read_file(folder: str, filename: str) -> bytes | None:
+    """
+    Retorna el contenido de un archivo, o None si no existe.
+    """
+    path = os.path.join(folder, filename)
+    if os.path.exists(path) is False:
+        return None
+    with open(path, "rb") as file:
+        return file.read()
+
+
+def record_writes(fake, fail=None) -> list[str]:
+    """
+    Registra, en orden, los secretos creados o actualizados en el reemplazo indicado. Si se indica `fail`, una función
+    que recibe el nombre de un secreto, la creación de los secretos para los que retorna True se rechaza con un error
+    que no se reintenta.
+    """
+    writes = list()
+    lock = threading.Lock()
+    create_secret = fake.create_secret
+    update_secret = fake.update_secret
+
+    def create(Name: str, **kwargs) -> dict:
+        if fail != None and fail(Name):
+            raise _error("AccessDeniedException", "CreateSecret", "Injected error.")
+        with lock:
+            writes.append(Name)
+        return create_secret(Name=Name, **kwargs)
+
+    def update(SecretId: str, **kwargs) -> dict:
+        with lock:
+            writes.append(SecretId)
+        return update_secret(SecretId=SecretId, **kwargs)
+
+    fake.create_secret = create
+    fake.update_secret = update
+    return writes
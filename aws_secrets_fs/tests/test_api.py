@@ -0,0 +1,115 @@
+import os
+import time
+import pytest
+from aws_secrets_fs import aws, index, opt_gc, opt_upload, store
+from aws_secrets_fs.api import SecretsFS
+from .helpers import PROFILE, text_content, write_files
+
+
+# Tamaño del archivo de varias partes, en bytes.
+SIZE = 160 * 1024
+
+
+def descriptor(folder: str) -> str:
+    """
+    Retorna el path del archivo descriptor de las pruebas, ver helpers.write_files.
+    """
+    return os.path.join(folder, "test.aws_secrets")
+
+
+def replace_during_read(fake, other: str) -> None:
+    """
+    Hace que, entre la obtención del índice de /test/a.txt y la de sus partes, se suba el contenido de la carpeta
+    `other` y gc elimine las partes anteriores.
+    """
+    batch_get_secret_value = fake.batch_get_secret_value
+    state = {"indexes": 0, "replaced": False}
+
+    def replace(SecretIdList: list[str], **kwargs) -> dict:
+        if "/test/a.txt.index" in SecretIdList:
+            state["indexes"] += 1
+        elif state["replaced"] is False and state["indexes"] == 1:
+            state["replaced"] = True
+            opt_upload.run(other, PROFILE, "", 4)
+            opt_gc.run(other, PROFILE, "", 4, grace=0)
+        return batch_get_secret_value(SecretIdList=SecretIdList, **kwargs)
+
+    fake.batch_get_secret_value = replace
+
+
+def test_descriptor_read_bytes(folder, fake):
+    """
+    Los archivos de un descriptor, individuales o agrupados con @pack, se leen en memoria sin escribirlos en disco.
+    """
+    files = {"a.txt": text_content(SIZE, 1), "b.txt": b"b\n"}
+    write_files(folder, files)
+    with open(descriptor(folder), "a", encoding="utf-8") as file:
+        file.write("@pack => /test/pack\n")
+    opt_upload.run(folder, PROFILE, "", 4)
+    assert "/test/pack.index" in fake.secrets and "/test/b.txt.index" not in fake.secrets
+    for filename in files:
+        os.remove(os.path.join(folder, filename))
+
+    config = SecretsFS(PROFILE).descriptor(descriptor(folder))
+    assert config.read_bytes("a.txt") == files["a.txt"]
+    assert config.read_bytes("/test/b.txt") == files["b.txt"]
+    assert config.read_text("b.txt") == "b\n"
+    with config.open("a.txt") as file:
+        assert file.read() == files["a.txt"]
+    assert all(os.path.exists(os.path.join(folder, filename)) is False for filename in files)
+    with pytest.raises(KeyError):
+        config.read_bytes("missing.txt")
+
+
+def test_read_secret_ttl(folder, fake):
+    """
+    Con `ttl`, el contenido leído se conserva en memoria hasta su vencimiento, y luego se vuelve a obtener.
+    """
+    write_files(folder, {"a.txt": b"v1\n"})
+    opt_upload.run(folder, PROFILE, "", 4)
+    ttl = 0.3
+    fs = SecretsFS(PROFILE, ttl=ttl)
+    assert fs.read_secret("/test/a.txt") == b"v1\n"
+
+    write_files(folder, {"a.txt": b"v2\n"})
+    opt_upload.run(folder, PROFILE, "", 4)
+    fake.calls.clear()
+    assert fs.read_secret("/test/a.txt") == b"v1\n"
+    assert fake.calls == {}
+
+    time.sleep(ttl)
+    assert fs.read_secret("/test/a.txt") == b"v2\n"
+    assert fake.calls.get("BatchGetSecretValue", 0) > 0
+    assert SecretsFS(PROFILE).read_secret("/test/a.txt") == b"v2\n"
+
+
+def test_fetch_secret_rereads_replaced_index(folder, fake, tmp_path):
+    """
+    Si las partes del índice obtenido se eliminan tras una subida posterior, se vuelve a leer con el índice actual.
+    """
+    write_files(folder, {"a.txt": text_content(SIZE, 1)})
+    opt_upload.run(folder, PROFILE, "", 4)
+    first = index.parse(fake.secrets["/test/a.txt.index"]["value"])
+    other = tmp_path / "other"
+    other.mkdir()
+    content = text_content(SIZE, 2)
+    write_files(other, {"a.txt": content})
+    replace_during_read(fake, other)
+
+    parsed, data = store.fetch_secret("/test/a.txt", PROFILE, "", 4)
+    assert data == content
+    assert index.generation(parsed) != index.generation(first)
+
+
+def test_fetch_secret_fails_without_new_generation(folder, fake):
+    """
+    Si faltan partes y el índice no fue reemplazado, se lanza el error sin reintentar.
+    """
+    write_files(folder, {"a.txt": text_content(SIZE, 1)})
+    opt_upload.run(folder, PROFILE, "", 4)
+    parts = index.parts("/test/a.txt", index.parse(fake.secrets["/test/a.txt.index"]["value"]))
+    del fake.secrets[parts[-1][0]]
+
+    with pytest.raises(Exception) as raised:
+        store.fetch_secret("/test/a.txt", PROFILE, "", 4)
+    assert aws.not_found(raised.value)
@@ -0,0 +1,104 @@
+import math
+import os
+import pytest
+from aws_secrets_fs import aws, index, opt_download, opt_upload
+from benchmarks.fake import FakeSecretsManager
+from .helpers import PROFILE, read_file, text_content, write_files
+
+
+# Cantidad de secretos obtenidos en las pruebas de lotes.
+COUNT = 45
+
+
+def create_secrets(fake, count: int) -> list[str]:
+    """
+    Registra `count` secretos en el reemplazo indicado y retorna sus nombres.
+    """
+    names = ["/test/secret.{0}".format(i) for i in range(count)]
+    for name in names:
+        fake.create_secret(Name=name, SecretString="value " + name)
+    fake.calls.clear()
+    return names
+
+
+def test_retrieve_secrets_in_batches(fake):
+    """
+    45 secretos se obtienen en 3 llamadas a BatchGetSecretValue, y los secretos inexistentes se informan de forma
+    individual.
+    """
+    names = create_secrets(fake, COUNT)
+    results = aws.retrieve_secrets(names[:-1] + ["/test/missing"], PROFILE, "")
+    assert fake.calls == {"BatchGetSecretValue": 3}
+    for name in names[:-1]:
+        assert results[name] == ("value " + name, None)
+    value, err = results["/test/missing"]
+    assert value == None and aws.not_found(err)
+
+
+def test_retrieve_secrets_falls_back_when_batch_denied(fake):
+    """
+    Si BatchGetSecretValue no está permitido, cada secreto se obtiene con GetSecretValue, y el lote no se vuelve a
+    intentar en las siguientes llamadas.
+    """
+    names = create_secrets(fake, COUNT)
+    fake.denied = {"BatchGetSecretValue"}
+    results = aws.retrieve_secrets(names, PROFILE, "")
+    assert fake.calls == {"BatchGetSecretValue": 1, "GetSecretValue": COUNT}
+    for name in names:
+        assert results[name] == ("value " + name, None)
+
+    fake.calls.clear()
+    results = aws.retrieve_secrets(names[:5], PROFILE, "")
+    assert fake.calls == {"GetSecretValue": 5}
+
+
+def test_download_batches_index_and_parts(folder, fake):
+    """
+    La descarga obtiene el índice en un lote y las partes en lotes de hasta aws.BATCH_SIZE secretos.
+    """
+    content = text_content(1024 * 1024)
+    write_files(folder, {"a.txt": content})
+    opt_upload.run(folder, PROFILE, "", 4)
+    os.remove(os.path.join(folder, "a.txt"))
+    parts = index.parts("/test/a.txt", index.parse(fake.secrets["/test/a.txt.index"]["value"]))
+    assert len(parts) > aws.BATCH_SIZE
+
+    fake.calls.clear()
+    opt_download.run(folder, PROFILE, "", 1)
+    assert read_file(folder, "a.txt") == content
+    assert fake.calls == {"BatchGetSecretValue": 1 + math.ceil(len(parts) / aws.BATCH_SIZE)}
+
+
+def test_one_client_per_region(folder, monkeypatch):
+    """
+    Una subida y una descarga de varios archivos en varias regiones crean una única sesión y un único cliente de boto3
+    por región.
+    """
+    boto3 = pytest.importorskip("boto3")
+    pytest.importorskip("botocore.config")
+    regions = ["region-0", "region-1"]
+    fakes = {region: FakeSecretsManager() for region in regions}
+
+    class Session:
+        """
+        Sesión de boto3 que retorna el reemplazo de la región indicada.
+        """
+        def __init__(self, profile_name=None, region_name=None):
+            self.region_name = region_name
+
+        def client(self, service_name, config=None):
+            return fakes[self.region_name]
+
+    monkeypatch.setattr(boto3, "Session", Session)
+    files = {"file{0}.txt".format(i): text_content(40 * 1024, i) for i in range(3)}
+    write_files(folder, files)
+    opt_upload.run(folder, PROFILE, regions, 4)
+    for filename in files:
+        os.remove(os.path.join(folder, filename))
+    opt_download.run(folder, PROFILE, regions, 4)
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
+
+    stats = aws.client_stats()
+    assert (stats["sessions"], stats["clients"], stats["injected"]) == (len(regions), len(regions), 0)
+    assert all(sum(fake.calls.values()) > 0 for fake in fakes.values())
@@ -0,0 +1,74 @@
+import os
+import pytest
+from aws_secrets_fs import cache as secret_cache
+from aws_secrets_fs import index, opt_download, opt_upload
+from .helpers import PROFILE, read_file, text_content, write_files
+
+# El cifrado de la caché requiere cryptography, ver cache.available.
+pytest.importorskip("cryptography")
+
+
+def upload(folder: str, fake) -> tuple[dict[str, bytes], int]:
+    """
+    Sube dos archivos de varias partes y elimina las copias locales. Retorna el contenido de cada archivo y la
+    cantidad total de partes.
+    """
+    files = {"a.txt": text_content(300 * 1024, 1), "b.txt": text_content(200 * 1024, 2)}
+    write_files(folder, files)
+    opt_upload.run(folder, PROFILE, "", 4)
+    remove(folder, files)
+    parts = sum(len(index.parse(fake.secrets["/test/" + filename + ".index"]["value"])["chunks"]) for filename in files)
+    return files, parts
+
+
+def remove(folder: str, files: dict[str, bytes]) -> None:
+    """
+    Elimina las copias locales de los archivos indicados.
+    """
+    for filename in files:
+        os.remove(os.path.join(folder, filename))
+
+
+def test_warm_download_only_fetches_indexes(folder, fake):
+    """
+    Con todas las partes en la caché, la descarga solo obtiene los índices.
+    """
+    files, parts = upload(folder, fake)
+    cache = secret_cache.SecretCache()
+    opt_download.run(folder, PROFILE, "", 4, cache=cache)
+    assert (cache.hits, cache.misses) == (0, parts)
+    remove(folder, files)
+
+    fake.calls.clear()
+    fake.bytes_out = 0
+    cache = secret_cache.SecretCache()
+    opt_download.run(folder, PROFILE, "", 4, cache=cache)
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
+    assert fake.calls == {"BatchGetSecretValue": 1}
+    assert fake.bytes_out == sum(len(fake.secrets["/test/" + filename + ".index"]["value"]) for filename in files)
+    assert (cache.hits, cache.misses, cache.evictions) == (parts, 0, 0)
+
+
+def test_eviction_past_cache_size(folder, fake):
+    """
+    Con una caché menor al contenido descargado, se descartan entradas hasta no superar el tamaño máximo, y la
+    siguiente descarga obtiene solo las partes descartadas.
+    """
+    files, parts = upload(folder, fake)
+    max_size = 200 * 1024
+    cache = secret_cache.SecretCache(max_size=max_size)
+    opt_download.run(folder, PROFILE, "", 4, cache=cache)
+    assert cache.evictions > 0
+    assert cache.size <= max_size
+    cached = len([name for name in os.listdir(cache.folder) if name.endswith(".bin")])
+    assert 0 < cached < parts
+    remove(folder, files)
+
+    fake.calls.clear()
+    cache = secret_cache.SecretCache(max_size=max_size)
+    opt_download.run(folder, PROFILE, "", 4, cache=cache)
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
+    assert (cache.hits, cache.misses) == (cached, parts - cached)
+    assert cache.size <= max_size
@@ -0,0 +1,161 @@
+import datetime
+import os
+import threading
+import time
+import pytest
+from aws_secrets_fs import index, opt_delete, opt_download, opt_gc, opt_upload
+from .helpers import PROFILE, read_file, text_content, write_files
+
+
+# Antigüedad asignada a los secretos para superar el período de gracia, en segundos.
+AGE = 2 * opt_gc.GRACE
+
+
+def age(fake, names) -> None:
+    """
+    Modifica la fecha de último cambio de los secretos indicados, como si se hubieran registrado hace AGE segundos.
+    """
+    changed = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=AGE)
+    for name in names:
+        fake.secrets[name]["changed"] = changed
+
+
+def secrets_of(fake, secretname: str) -> set[str]:
+    """
+    Retorna el índice y las partes registradas de un archivo.
+    """
+    return set(name for name in fake.secrets if name == index.index_name(secretname) or index.is_part(secretname, name))
+
+
+def replace(folder: str, fake) -> tuple[bytes, set[str]]:
+    """
+    Sube un archivo de varias partes, lo modifica por completo y lo vuelve a subir. Retorna el contenido final y las
+    partes de la primera generación, que quedan sin referencia.
+    """
+    write_files(folder, {"a.txt": text_content(300 * 1024, 1)})
+    opt_upload.run(folder, PROFILE, "", 4)
+    before = secrets_of(fake, "/test/a.txt") - {"/test/a.txt.index"}
+    content = text_content(300 * 1024, 2)
+    write_files(folder, {"a.txt": content})
+    opt_upload.run(folder, PROFILE, "", 4)
+    orphans = before - set(index.references("/test/a.txt", index.parse(fake.secrets["/test/a.txt.index"]["value"])))
+    assert len(orphans) > 0
+    return content, orphans
+
+
+def test_delete_entries_removes_index_and_parts(folder, fake):
+    """
+    La eliminación de un archivo elimina su índice y todas sus partes, sin afectar a otros archivos. Con dry_run no se
+    elimina ningún secreto.
+    """
+    write_files(folder, {"a.txt": text_content(300 * 1024, 1), "b.txt": b"b\n"})
+    opt_upload.run(folder, PROFILE, "", 4)
+    names = secrets_of(fake, "/test/a.txt")
+    assert len(names) > 2
+
+    fake.calls.clear()
+    opt_delete.run_entries(folder, ["a.txt"], PROFILE, "", 4, dry_run=True)
+    assert "DeleteSecret" not in fake.calls
+    assert secrets_of(fake, "/test/a.txt") == names
+
+    fake.calls.clear()
+    opt_delete.run_entries(folder, ["a.txt"], PROFILE, "", 4)
+    assert fake.calls["DeleteSecret"] == len(names)
+    assert secrets_of(fake, "/test/a.txt") == set()
+    assert "/test/b.txt.index" in fake.secrets
+
+
+def test_delete_packed_entries(folder, fake, capsys):
+    """
+    Un archivo agrupado con @pack solo se elimina junto con los demás archivos del grupo, eliminando el secreto
+    agrupado. Si se indica solo una parte del grupo, no se elimina ningún secreto.
+    """
+    files = {"a.txt": b"a\n", "b.txt": b"b\n"}
+    write_files(folder, files)
+    with open(os.path.join(folder, "test.aws_secrets"), "a", encoding="utf-8") as file:
+        file.write("@pack => /test/pack\n")
+    opt_upload.run(folder, PROFILE, "", 4)
+    names = set(fake.secrets.keys())
+    assert "/test/pack.index" in names
+    capsys.readouterr()
+
+    with pytest.raises(SystemExit):
+        opt_delete.run_entries(folder, ["a.txt"], PROFILE, "", 4)
+    assert "junto con b.txt" in capsys.readouterr().out
+    assert set(fake.secrets.keys()) == names
+
+    opt_delete.run_entries(folder, ["a.txt", "b.txt"], PROFILE, "", 4)
+    assert secrets_of(fake, "/test/pack") == set()
+
+
+def test_delete_secrets_paced_by_rate():
+    """
+    Las eliminaciones se distribuyen de forma uniforme a razón de `rate` por segundo, aun con varias simultáneas.
+    """
+    rate = 20
+    times = list()
+    lock = threading.Lock()
+
+    def delete(secret_name: str):
+        with lock:
+            times.append(time.monotonic())
+        return None, None
+
+    failed = opt_delete.delete_secrets(["/test/secret.{0}".format(i) for i in range(10)], delete, 4, rate)
+    assert failed == []
+    times.sort()
+    gaps = [b - a for a, b in zip(times, times[1:])]
+    assert min(gaps) >= 0.8 / rate
+    assert times[-1] - times[0] >= 0.9 * (len(times) - 1) / rate
+
+
+def test_gc_keeps_recent_orphans(folder, fake, capsys):
+    """
+    Las partes sin referencia modificadas dentro del período de gracia se conservan.
+    """
+    replace(folder, fake)
+    names = set(fake.secrets.keys())
+    capsys.readouterr()
+
+    fake.calls.clear()
+    opt_gc.run(folder, PROFILE, "", 4)
+    assert "DeleteSecret" not in fake.calls
+    assert set(fake.secrets.keys()) == names
+    assert "Se conservan" in capsys.readouterr().out
+
+
+def test_gc_deletes_expired_orphans(folder, fake):
+    """
+    Vencido el período de gracia se eliminan solo las partes sin referencia, y el archivo se sigue descargando. Con
+    dry_run no se elimina ningún secreto.
+    """
+    content, orphans = replace(folder, fake)
+    age(fake, fake.secrets.keys())
+    names = set(fake.secrets.keys())
+
+    fake.calls.clear()
+    opt_gc.run(folder, PROFILE, "", 4, dry_run=True)
+    assert "DeleteSecret" not in fake.calls
+    assert set(fake.secrets.keys()) == names
+
+    fake.calls.clear()
+    opt_gc.run(folder, PROFILE, "", 4)
+    assert fake.calls["DeleteSecret"] == len(orphans)
+    assert set(fake.secrets.keys()) == names - orphans
+
+    os.remove(os.path.join(folder, "a.txt"))
+    opt_download.run(folder, PROFILE, "", 4)
+    assert read_file(folder, "a.txt") == content
+
+
+def test_gc_keeps_orphans_of_recent_index(folder, fake):
+    """
+    Si el índice se modificó dentro del período de gracia, se conservan las partes anteriores aunque sean antiguas, ya
+    que una descarga en curso puede haber obtenido el índice anterior.
+    """
+    replace(folder, fake)
+    age(fake, [name for name in fake.secrets if name != "/test/a.txt.index"])
+    names = set(fake.secrets.keys())
+
+    opt_gc.run(folder, PROFILE, "", 4)
+    assert set(fake.secrets.keys()) == names
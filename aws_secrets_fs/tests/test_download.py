@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+import time
+import pytest
+from aws_secrets_fs import aws, index, opt_download, opt_gc, opt_upload, utils
+from benchmarks.fake import FakeSecretsManager
+from .helpers import PROFILE, read_file, scaled_quotas, text_content, write_files
+
+
+# Cantidad de archivos y tamaño de cada uno, en bytes. Cada archivo se divide en varias partes.
+COUNT = 6
+SIZE = 160 * 1024
+
+
+def upload(folder: str, fake: FakeSecretsManager) -> dict[str, bytes]:
+    """
+    Sube COUNT archivos de texto y elimina las copias locales. Retorna el contenido de cada archivo.
+    """
+    files = {"file{0}.txt".format(i): text_content(SIZE, i) for i in range(COUNT)}
+    write_files(folder, files)
+    opt_upload.run(folder, PROFILE, "", 4)
+    for filename in files:
+        os.remove(os.path.join(folder, filename))
+    return files
+
+
+def blocks(output: str) -> dict[str, list[str]]:
+    """
+    Agrupa la salida de una descarga por archivo, a partir del encabezado "Descargando: <archivo>" de cada uno.
+    """
+    result = dict()
+    current = None
+    for line in output.splitlines():
+        found = re.search(r"Descargando: ([^\s\x1b]+)", line)
+        if found != None:
+            current = found.group(1)
+            assert current not in result, "La salida de " + current + " se imprimió más de una vez."
+            result[current] = list()
+        elif current != None and line.strip() != "":
+            result[current].append(line)
+    return result
+
+
+@pytest.mark.parametrize("jobs", [1, 8])
+def test_parts_written_in_order_with_latency_and_errors(folder, fake, capsys, jobs):
+    """
+    Con latencia variable y errores transitorios, las partes de cada archivo se escriben en orden y la salida de cada
+    archivo se imprime agrupada, sin mezclarse con la de otros archivos.
+    """
+    files = upload(folder, fake)
+    slow = FakeSecretsManager(latency=0.005, error_rate=0.3, seed=jobs)
+    slow.secrets = fake.secrets
+    aws.reset_clients()
+    aws.set_client(PROFILE, "", slow, scaled_quotas())
+    capsys.readouterr()
+
+    opt_download.run(folder, PROFILE, "", jobs)
+    output = capsys.readouterr().out
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
+    found = blocks(output)
+    assert set(found.keys()) == set(files.keys())
+    for filename, lines in found.items():
+        parts = [line for line in lines if line.startswith("Descargando parte:")]
+        total = len(index.parse(fake.secrets["/test/" + filename + ".index"]["value"])["chunks"])
+        assert sorted(int(line.split(" ")[-1].split("/")[0]) for line in parts) == list(range(1, total + 1))
+        assert "Comprobación: ok." in lines
+    assert "Resumen: {0} transferidos, 0 omitidos, 0 fallidos.".format(COUNT) in output
+    assert aws.governor_stats()["retries"] > 0
+
+
+def test_failed_entries_reported_independently(folder, fake, capsys):
+    """
+    Un archivo sin índice y otro con una parte inexistente fallan de forma independiente: el resto de los archivos se
+    descarga, los archivos fallidos no se crean y el resumen informa los fallidos.
+    """
+    files = upload(folder, fake)
+    del fake.secrets["/test/file1.txt.index"]
+    parts = index.parts("/test/file4.txt", index.parse(fake.secrets["/test/file4.txt.index"]["value"]))
+    del fake.secrets[parts[len(parts) // 2][0]]
+    capsys.readouterr()
+
+    opt_download.run(folder, PROFILE, "", 8)
+    output = capsys.readouterr().out
+    found = blocks(output)
+    for filename, content in files.items():
+        expected = None if filename in ["file1.txt", "file4.txt"] else content
+        assert read_file(folder, filename) == expected
+    assert "Error: no se pudo descargar el archivo índice." in " ".join(found["file1.txt"])
+    assert "Error: no se pudo descargar el archivo." in " ".join(found["file4.txt"])
+    assert "Resumen: {0} transferidos, 0 omitidos, 2 fallidos.".format(COUNT - 2) in output
+
+    # Los archivos temporales de las descargas fallidas se eliminan.
+    assert [name for name in os.listdir(folder) if name.endswith(".tmp")] == []
+
+
+def test_buffered_parts_bounded_by_window(folder, fake, monkeypatch):
+    """
+    Si las partes llegan en orden inverso, las partes en espera de ser escritas no superan la ventana de cada archivo.
+    """
+    content = text_content(1024 * 1024)
+    write_files(folder, {"a.txt": content})
+    opt_upload.run(folder, PROFILE, "", 4)
+    os.remove(os.path.join(folder, "a.txt"))
+    monkeypatch.setattr(aws, "BATCH_SIZE", 4)
+    jobs = 2
+    window = jobs * opt_download.WINDOW_FACTOR * aws.BATCH_SIZE
+    assert len(index.parse(fake.secrets["/test/a.txt.index"]["value"])["chunks"]) > 2 * window
+
+    # El primer lote de partes demora, de manera que las partes siguientes lleguen antes.
+    requested = [0]
+    lock = threading.Lock()
+
+    def fetch(names: list[str]) -> dict:
+        with lock:
+            requested[0] += 1
+            first = requested[0] == 2
+        if first:
+            time.sleep(0.2)
+        return aws.retrieve_secrets(names, PROFILE, "")
+
+    buffered = list()
+    write_parts = opt_download.write_parts
+
+    def record(task):
+        buffered.append(len(task.buffer))
+        write_parts(task)
+
+    monkeypatch.setattr(opt_download, "write_parts", record)
+    task = opt_download.DownloadTask(utils.DescriptorFileEntry("a.txt", "/test/a.txt"), os.path.join(folder, "a.txt"))
+    opt_download.download([task], fetch, jobs)
+    assert task.failed is False
+    assert read_file(folder, "a.txt") == content
+    assert max(buffered) > 0
+    assert max(buffered) <= window
+
+
+def test_rereads_index_replaced_during_download(folder, fake, tmp_path, capsys):
+    """
+    Si entre la obtención del índice y la de sus partes una subida posterior reemplaza el índice y gc elimina las
+    partes anteriores, se vuelve a obtener el índice una única vez y se descarga el contenido actual.
+    """
+    write_files(folder, {"a.txt": text_content(SIZE, 1)})
+    opt_upload.run(folder, PROFILE, "", 4)
+    os.remove(os.path.join(folder, "a.txt"))
+    other = tmp_path / "other"
+    other.mkdir()
+    content = text_content(SIZE, 2)
+    write_files(other, {"a.txt": content})
+    batch_get_secret_value = fake.batch_get_secret_value
+    reads = list()
+    state = {"replacing": False, "replaced": False}
+
+    def replace(SecretIdList: list[str], **kwargs) -> dict:
+        # Reemplazar el archivo antes de obtener el primer lote de partes de la descarga. Solo se registran los
+        # índices obtenidos por la descarga.
+        if state["replacing"] is False and "/test/a.txt.index" in SecretIdList:
+            reads.append(SecretIdList)
+        elif state["replaced"] is False and len(reads) == 1:
+            state["replaced"] = state["replacing"] = True
+            opt_upload.run(other, PROFILE, "", 4)
+            opt_gc.run(other, PROFILE, "", 4, grace=0)
+            state["replacing"] = False
+        return batch_get_secret_value(SecretIdList=SecretIdList, **kwargs)
+
+    fake.batch_get_secret_value = replace
+    capsys.readouterr()
+    opt_download.run(folder, PROFILE, "", 4)
+    output = capsys.readouterr().out
+    assert read_file(folder, "a.txt") == content
+    assert "no existe" in output
+    assert "Resumen: 1 transferidos, 0 omitidos, 0 fallidos." in output
+    assert len(reads) == 2
+
+
+def test_unchanged_download_skips_parts(folder, fake, capsys):
+    """
+    Sin manifiesto, los archivos locales cuyo hash coincide con el del índice se omiten obteniendo solo el índice. Con
+    `force` se vuelven a obtener todas las partes.
+    """
+    files = upload(folder, fake)
+    opt_download.run(folder, PROFILE, "", 4)
+    os.remove(os.path.join(folder, "test.aws_secrets.lock"))
+    parts = sum(len(index.parse(fake.secrets["/test/" + filename + ".index"]["value"])["chunks"]) for filename in files)
+    capsys.readouterr()
+
+    fake.calls.clear()
+    opt_download.run(folder, PROFILE, "", 4)
+    assert fake.calls == {"BatchGetSecretValue": 1}
+    assert "Resumen: 0 transferidos, {0} omitidos, 0 fallidos.".format(COUNT) in capsys.readouterr().out
+
+    fake.calls.clear()
+    fake.bytes_out = 0
+    opt_download.run(folder, PROFILE, "", 4, force=True)
+    assert fake.calls["BatchGetSecretValue"] >= 1 + parts / aws.BATCH_SIZE
+    assert fake.bytes_out >= sum(len(content) for content in files.values())
+    assert "Resumen: {0} transferidos, 0 omitidos, 0 fallidos.".format(COUNT) in capsys.readouterr().out
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
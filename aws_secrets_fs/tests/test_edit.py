@@ -0,0 +1,39 @@
+import pytest
+from aws_secrets_fs import codec, index, opt_download, opt_upload
+from .helpers import PROFILE, read_file, text_content, write_files
+
+
+# Tamaño del archivo modificado, en bytes.
+SIZE = 1024 * 1024
+
+
+@pytest.mark.parametrize("chunk_codec", [codec.NONE, codec.ZLIB])
+@pytest.mark.parametrize("mode", index.MODES)
+def test_edit_transfers_only_changed_part(folder, fake, chunk_codec, mode):
+    """
+    Al modificar unos pocos bytes de un archivo, la nueva subida registra una única parte además del índice, y la
+    descarga sobre el contenido anterior obtiene solo esa parte además del índice, reutilizando el resto del archivo
+    local.
+    """
+    original = text_content(SIZE)
+    write_files(folder, {"a.txt": original})
+    opt_upload.run(folder, PROFILE, "", 4, chunk_codec=chunk_codec, mode=mode)
+    uploaded = set(fake.secrets.keys())
+
+    edited = bytearray(original)
+    edited[SIZE // 2: SIZE // 2 + 3] = b"xyz"
+    write_files(folder, {"a.txt": bytes(edited)})
+    fake.calls.clear()
+    opt_upload.run(folder, PROFILE, "", 4, chunk_codec=chunk_codec, mode=mode)
+    created = set(fake.secrets.keys()) - uploaded
+    assert len(created) == 1
+    assert fake.calls.get("CreateSecret", 0) == 1
+    assert fake.calls.get("UpdateSecret", 0) == 1
+
+    # Volver al contenido anterior, de manera que la descarga deba reemplazar la parte modificada.
+    write_files(folder, {"a.txt": original})
+    fake.bytes_out = 0
+    opt_download.run(folder, PROFILE, "", 4)
+    assert read_file(folder, "a.txt") == bytes(edited)
+    part = created.pop()
+    assert fake.bytes_out == len(fake.secrets["/test/a.txt.index"]["value"]) + len(fake.secrets[part]["value"])
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+import pytest
+from aws_secrets_fs import aws, governor, opt_download, opt_upload
+from benchmarks.fake import FakeSecretsManager
+from .helpers import PROFILE, read_file, write_files
+
+
+# Llamadas por segundo por acción por encima de las cuales el reemplazo responde ThrottlingException, menor a las
+# cuotas del regulador.
+THROTTLE_RATE = 10
+
+# Cantidad de archivos subidos y descargados.
+COUNT = 20
+
+
+def test_governor_backs_off_when_throttled(folder, capsys):
+    """
+    Contra un reemplazo que limita las llamadas por debajo de las cuotas del regulador, el regulador reduce la cantidad
+    de llamadas por segundo y reintenta, y la subida y descarga finalizan sin archivos fallidos.
+    """
+    fake = FakeSecretsManager(throttle_rate=THROTTLE_RATE)
+    aws.set_client(PROFILE, "", fake, {action: max(quota, THROTTLE_RATE * 4) for action, quota in governor.QUOTAS.items()})
+    files = {"file{0}.txt".format(i): "content {0}\n".format(i).encode() for i in range(COUNT)}
+    write_files(folder, files)
+
+    opt_upload.run(folder, PROFILE, "", 8)
+    for filename in files:
+        os.remove(os.path.join(folder, filename))
+    opt_download.run(folder, PROFILE, "", 8)
+    output = capsys.readouterr().out
+
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
+    assert output.count("Resumen: {0} transferidos, 0 omitidos, 0 fallidos.".format(COUNT)) == 2
+    assert "Error" not in output
+
+    stats = aws.get_governor(PROFILE, "").stats()
+    assert stats["CreateSecret"]["throttled"] > 0
+    assert stats["CreateSecret"]["retries"] >= stats["CreateSecret"]["throttled"]
+    assert aws.governor_stats()["wait"] > 0
+
+
+def test_token_acquired_before_slot():
+    """
+    Una llamada que espera el limitador de su acción no ocupa un lugar de llamada simultánea, por lo que las llamadas
+    de otras acciones no esperan.
+    """
+    regulator = governor.Governor(lambda e: None, max_concurrency=1, quotas={"Slow": 1, "Fast": 100})
+    regulator.call("Slow", lambda: None)
+    waiting = threading.Thread(target=regulator.call, args=("Slow", lambda: None))
+    waiting.start()
+    time.sleep(0.1)
+    start = time.monotonic()
+    regulator.call("Fast", lambda: None)
+    elapsed = time.monotonic() - start
+    waiting.join()
+    assert elapsed < 0.5
+    assert regulator.stats()["Slow"]["wait"] > 0.5
+
+
+def test_limit_unchanged_on_non_retryable_error():
+    """
+    Un error que no debe reintentarse se lanza sin reintentos y no modifica el límite de llamadas simultáneas, que
+    solo se incrementa tras una llamada exitosa.
+    """
+    regulator = governor.Governor(lambda e: None, max_concurrency=8)
+    regulator.limit = 2.0
+
+    def fail():
+        raise ValueError("denied")
+
+    with pytest.raises(ValueError):
+        regulator.call("GetSecretValue", fail)
+    assert (regulator.limit, regulator.in_flight) == (2.0, 0)
+    assert regulator.stats()["GetSecretValue"]["retries"] == 0
+
+    regulator.call("GetSecretValue", lambda: None)
+    assert regulator.limit == 2.5
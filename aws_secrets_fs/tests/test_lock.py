@@ -0,0 +1,134 @@
+import hashlib
+import os
+import time
+from aws_secrets_fs import lock as lockfile
+from aws_secrets_fs import opt_download, opt_upload, store, utils
+from .helpers import PROFILE, read_file, text_content, write_files
+
+
+def count_hashes(monkeypatch) -> list[str]:
+    """
+    Registra los archivos cuyo hash se calcula, ver utils.hash_file.
+    """
+    hashed = list()
+    hash_file = utils.hash_file
+
+    def counted(path: str) -> str:
+        hashed.append(path)
+        return hash_file(path)
+
+    monkeypatch.setattr(utils, "hash_file", counted)
+    return hashed
+
+
+def synced(folder: str) -> tuple[lockfile.Lock, utils.DescriptorFileEntry, str]:
+    """
+    Escribe un archivo y registra su sincronización con la región por defecto en un manifiesto guardado. Retorna el
+    manifiesto, la entrada y el path del archivo.
+    """
+    write_files(folder, {"a.txt": b"v1\n"})
+    path = os.path.join(folder, "test.aws_secrets")
+    targetfile = os.path.join(folder, "a.txt")
+    entry = store.Descriptor(path).entry("a.txt")
+    lock = lockfile.Lock(path)
+    lock.update(entry, utils.hash_file(targetfile), "", ["v1"], lockfile.file_stat(targetfile))
+    lock.save()
+    return lock, entry, targetfile
+
+
+def test_status(folder, fake):
+    """
+    El estado de cada archivo respecto de la última sincronización se obtiene sin acceder a AWS.
+    """
+    write_files(folder, {"a.txt": b"a\n", "b.txt": b"b\n", "c.txt": b"c\n"})
+    path = os.path.join(folder, "test.aws_secrets")
+    assert store.Descriptor(path).status() == {name: lockfile.UNTRACKED for name in ["a.txt", "b.txt", "c.txt"]}
+
+    opt_upload.run(folder, PROFILE, "", 4)
+    with open(os.path.join(folder, "b.txt"), "ab") as file:
+        file.write(b"b\n")
+    os.remove(os.path.join(folder, "c.txt"))
+    fake.calls.clear()
+    assert store.Descriptor(path).status() == {"a.txt": lockfile.UNCHANGED, "b.txt": lockfile.MODIFIED, "c.txt": lockfile.MISSING}
+    assert fake.calls == {}
+
+
+def test_racily_clean_record_is_rehashed(folder, monkeypatch):
+    """
+    Un registro cuya fecha de modificación no es anterior a la escritura del manifiesto se considera dudoso: el
+    archivo pudo modificarse sin que cambie su tamaño ni su fecha de modificación, por lo que su hash se vuelve a
+    calcular. El resto de los registros se utilizan sin leer el archivo.
+    """
+    lock, entry, targetfile = synced(folder)
+    record = lock.record(entry)
+    with open(targetfile, "wb") as file:
+        file.write(b"v2\n")
+    os.utime(targetfile, ns=(record["mtime"], record["mtime"]))
+    hashed = count_hashes(monkeypatch)
+
+    lock.written = record["mtime"] + 1
+    assert lock.local_hash(entry, targetfile) == record["hash"]
+    assert hashed == []
+
+    lock.written = record["mtime"]
+    assert lock.local_hash(entry, targetfile) == hashlib.md5(b"v2\n").hexdigest()
+    assert hashed == [targetfile]
+    assert lock.status(entry, targetfile) == lockfile.MODIFIED
+
+
+def test_unchanged_requires_every_region(folder):
+    """
+    Un archivo no cambió solo si su contenido coincide con el registrado y se sincronizó con todas las regiones.
+    """
+    lock, entry, targetfile = synced(folder)
+    assert lock.unchanged(entry, targetfile, [""])
+    assert lock.unchanged(entry, targetfile, ["", "region-1"]) is False
+
+    with open(targetfile, "wb") as file:
+        file.write(b"v2 modificado\n")
+    assert lock.unchanged(entry, targetfile, [""]) is False
+
+
+def test_update_keeps_regions_of_same_hash(folder):
+    """
+    Las regiones registradas se conservan mientras el hash no cambie. Sin datos del archivo no se registra.
+    """
+    lock, entry, targetfile = synced(folder)
+    stat = lockfile.file_stat(targetfile)
+    lock.update(entry, lock.record(entry)["hash"], "region-1", ["v1"], stat)
+    assert sorted(lock.record(entry)["regions"].keys()) == ["", "region-1"]
+    lock.save()
+    assert lockfile.Lock(os.path.join(folder, "test.aws_secrets")).record(entry) == lock.record(entry)
+
+    lock.update(entry, hashlib.md5(b"v2\n").hexdigest(), "region-1", ["v2"], stat)
+    assert lock.record(entry)["regions"] == {"region-1": ["v2"]}
+    assert lock.record(entry)["remote"] == hashlib.md5(b"v2\n").hexdigest()
+
+    lock.modified = False
+    lock.update(entry, hashlib.md5(b"v3\n").hexdigest(), "", ["v3"], None)
+    assert lock.modified is False
+
+
+def test_second_unchanged_sync_calls(folder, fake, monkeypatch):
+    """
+    Una segunda subida sin cambios no accede a AWS, y una segunda descarga sin cambios solo obtiene los índices, en
+    un lote, sin calcular el hash de los archivos locales.
+    """
+    files = {"a.txt": text_content(100 * 1024, 1), "b.txt": b"b\n"}
+    write_files(folder, files)
+    opt_upload.run(folder, PROFILE, "", 4)
+    # Evitar registros dudosos, ver test_racily_clean_record_is_rehashed, según la resolución de fechas del sistema.
+    time.sleep(0.05)
+    os.utime(os.path.join(folder, "test.aws_secrets.lock"))
+    hashed = count_hashes(monkeypatch)
+
+    fake.calls.clear()
+    opt_upload.run(folder, PROFILE, "", 4)
+    assert fake.calls == {}
+
+    fake.calls.clear()
+    opt_download.run(folder, PROFILE, "", 4)
+    assert fake.calls == {"BatchGetSecretValue": 1}
+    assert hashed == []
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
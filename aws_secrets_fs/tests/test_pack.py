@@ -0,0 +1,85 @@
+import os
+import pytest
+from aws_secrets_fs import index, opt_download, opt_upload, pack, store, utils
+from .helpers import PROFILE, read_file, record_writes, text_content, write_files
+
+
+# Cantidad de archivos pequeños de cada descriptor.
+COUNT = 20
+
+
+def write_packs(folder: str) -> dict[str, bytes]:
+    """
+    Escribe dos descriptores con @pack, cada uno con COUNT archivos pequeños, y un archivo de mayor tamaño que
+    pack.MAX_SIZE en el primero. Retorna el contenido de cada archivo.
+    """
+    files = dict()
+    for name in ["one", "two"]:
+        group = {"{0}{1}.env".format(name, i): "{0} {1}\n".format(name, i).encode() for i in range(COUNT)}
+        if name == "one":
+            group["large.bin"] = text_content(pack.MAX_SIZE + 1024, 1)
+        write_files(folder, group, prefix="/test/" + name + "/", descriptor=name)
+        with open(os.path.join(folder, name + ".aws_secrets"), "a", encoding="utf-8") as file:
+            file.write("@pack => /test/pack-{0}\n".format(name))
+        files.update(group)
+    return files
+
+
+def test_packed_round_trip(folder, fake, capsys):
+    """
+    Los archivos pequeños de cada descriptor se suben en un único secreto agrupado, con pocas llamadas, y se
+    descargan verificando el hash de cada archivo. Los archivos de mayor tamaño se suben de forma individual.
+    """
+    files = write_packs(folder)
+    opt_upload.run(folder, PROFILE, "", 4)
+    names = set(fake.secrets.keys())
+    assert "/test/pack-one.index" in names and "/test/pack-two.index" in names
+    assert "/test/one/large.bin.index" in names
+    assert not any(name.startswith("/test/one/one") or name.startswith("/test/two/") for name in names)
+    assert fake.calls == {"ListSecrets": 1, "CreateSecret": len(names)}
+    assert len(names) < 10
+    for filename in files:
+        os.remove(os.path.join(folder, filename))
+    capsys.readouterr()
+
+    fake.calls.clear()
+    opt_download.run(folder, PROFILE, "", 4)
+    output = capsys.readouterr().out
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
+    assert "Resumen: {0} transferidos, 0 omitidos, 0 fallidos.".format(len(files)) in output
+    # Índice y parte de cada secreto agrupado, e índice y partes del archivo de mayor tamaño.
+    assert fake.calls == {"BatchGetSecretValue": 6}
+
+    # El hash de cada archivo se verifica al extraerlo del contenido agrupado.
+    payload = store.fetch_secret("/test/pack-one", PROFILE, "", 4)[1]
+    item = pack.parse(payload)["/test/one/one0.env"]
+    with pytest.raises(ValueError):
+        pack.extract(payload[:item["offset"]] + b"X" + payload[item["offset"] + 1:], item)
+
+
+def test_edit_reuploads_only_its_pack(folder, fake, capsys):
+    """
+    Al modificar un archivo agrupado solo se vuelve a subir su secreto agrupado.
+    """
+    files = write_packs(folder)
+    opt_upload.run(folder, PROFILE, "", 4)
+    two = {name: dict(secret) for name, secret in fake.secrets.items() if name.startswith("/test/pack-two")}
+    with open(os.path.join(folder, "one3.env"), "wb") as file:
+        file.write(b"one 3 modificado\n")
+    files["one3.env"] = b"one 3 modificado\n"
+    writes = record_writes(fake)
+    capsys.readouterr()
+
+    opt_upload.run(folder, PROFILE, "", 4)
+    assert len(writes) > 0
+    assert all(index.is_part("/test/pack-one", name) or name == "/test/pack-one.index" for name in writes)
+    assert {name: secret for name, secret in fake.secrets.items() if name.startswith("/test/pack-two")} == two
+    table = pack.parse(store.fetch_secret("/test/pack-one", PROFILE, "", 4)[1])
+    assert table["/test/one/one3.env"]["hash"] == utils.hash_file(os.path.join(folder, "one3.env"))
+
+    for filename in files:
+        os.remove(os.path.join(folder, filename))
+    opt_download.run(folder, PROFILE, "", 4)
+    for filename, content in files.items():
+        assert read_file(folder, filename) == content
@@ -0,0 +1,96 @@
+from aws_secrets_fs import aws, opt_upload, store
+from aws_secrets_fs import plan as planner
+from .helpers import PROFILE, text_content, write_files
+
+
+# Cantidad de archivos subidos, más que aws.LIST_FILTER_SIZE para consultar en varios grupos de prefijos.
+COUNT = 12
+
+
+def upload(folder: str, dry_run: bool = False) -> planner.Plan:
+    """
+    Sube los archivos de los descriptores de la carpeta y retorna el plan de la región por defecto.
+    """
+    _, plans = opt_upload.upload_descriptors(store.descriptors(folder), PROFILE, [""], 4, dry_run=dry_run)
+    return plans[""]
+
+
+def test_scan_pages_and_prefix_groups(fake):
+    """
+    El recorrido agrupa hasta aws.LIST_FILTER_SIZE prefijos por consulta, obtiene todas las páginas, y descarta los
+    secretos que solo coinciden sin distinguir mayúsculas.
+    """
+    names = ["/test/file{0}.txt.{1}".format(i, j) for i in range(COUNT) for j in range(20)]
+    for name in names + ["/TEST/file0.txt.index"]:
+        fake.create_secret(Name=name, SecretString="x")
+    fake.calls.clear()
+
+    plan = planner.Plan()
+    prefixes = ["/test/file{0}.txt.".format(i) for i in range(COUNT)]
+    err = plan.scan(prefixes, lambda group, token: aws.list_secrets(group, token, PROFILE, ""))
+    assert err == None and plan.complete
+    assert set(plan.existing.keys()) == set(names)
+    # Primer grupo: 10 prefijos con 201 secretos, en 3 páginas. Segundo grupo: 2 prefijos con 40 secretos, 1 página.
+    assert (aws.LIST_FILTER_SIZE, aws.LIST_PAGE_SIZE) == (10, 100)
+    assert fake.calls == {"ListSecrets": 4}
+    assert plan.list_calls == 4
+    assert plan.exists(names[0]) and plan.exists("/test/missing.index") is False
+
+
+def test_scan_error_leaves_state_unknown(fake):
+    """
+    Si el recorrido falla, se desconoce qué secretos existen y cada creación estima un intento de actualización previo.
+    """
+    fake.create_secret(Name="/test/a.txt.index", SecretString="x")
+    fake.denied = {"ListSecrets"}
+    plan = planner.Plan()
+    err = plan.scan(["/test/a.txt."], lambda group, token: aws.list_secrets(group, token, PROFILE, ""))
+    assert err != None and plan.complete is False
+    assert plan.exists("/test/a.txt.index") == None
+    plan.put("/test/b.txt.index")
+    assert plan.names(planner.CREATE) == ["/test/b.txt.index"]
+    assert plan.calls() == plan.list_calls + 2
+
+
+def test_upload_calls_match_plan(folder, fake):
+    """
+    Una subida de archivos nuevos solo recorre los secretos existentes y crea cada secreto planificado, con una
+    llamada por secreto.
+    """
+    write_files(folder, {"file{0}.txt".format(i): text_content(20 * 1024, i) for i in range(COUNT)})
+    plan = upload(folder)
+    assert set(fake.calls.keys()) == {"ListSecrets", "CreateSecret"}
+    assert fake.calls["ListSecrets"] == plan.list_calls
+    assert fake.calls["CreateSecret"] == len(plan.names(planner.CREATE))
+    assert sum(fake.calls.values()) == plan.calls()
+
+
+def test_dry_run_plan(folder, fake, capsys):
+    """
+    Con dry_run no se registra ningún secreto, y el plan y su cantidad estimada de llamadas coinciden con los de la
+    subida posterior.
+    """
+    files = {"file{0}.txt".format(i): text_content(20 * 1024, i) for i in range(COUNT)}
+    write_files(folder, files)
+    upload(folder)
+    files["file0.txt"] = text_content(20 * 1024, 100)
+    files["new.txt"] = b"new\n"
+    write_files(folder, files)
+    secrets = {name: dict(secret) for name, secret in fake.secrets.items()}
+    capsys.readouterr()
+
+    fake.calls.clear()
+    planned = upload(folder, dry_run=True)
+    assert set(fake.calls.keys()) <= {"ListSecrets", "BatchGetSecretValue"}
+    assert fake.secrets == secrets
+    assert planned.names(planner.UPDATE) == ["/test/file0.txt.index"]
+    assert "/test/new.txt.index" in planned.names(planner.CREATE)
+    planned.show()
+    assert "Llamadas estimadas: {0}.".format(planned.calls()) in capsys.readouterr().out
+
+    fake.calls.clear()
+    plan = upload(folder)
+    assert plan.actions == planned.actions
+    assert sum(fake.calls.values()) == planned.calls()
+    assert fake.calls["UpdateSecret"] == len(planned.names(planner.UPDATE))
+    assert fake.calls["CreateSecret"] == len(planned.names(planner.CREATE))
@@ -0,0 +1,99 @@
+import os
+import pytest
+from aws_secrets_fs import aws, index, opt_download, opt_upload, utils
+from benchmarks.fake import FakeSecretsManager
+from .helpers import PROFILE, read_file, scaled_quotas, text_content, write_files
+
+
+# Regiones de las pruebas, de la más rápida a la más lenta.
+REGIONS = ["region-0", "region-1", "region-2"]
+
+# Latencia de cada región, en segundos. El reemplazo agrega hasta un 50%, sin alterar el orden.
+LATENCY = 0.02
+
+
+@pytest.fixture
+def fakes() -> dict[str, FakeSecretsManager]:
+    """
+    Un reemplazo de AWS Secrets Manager por región, con latencia creciente.
+    """
+    result = dict()
+    for i, region in enumerate(REGIONS):
+        result[region] = FakeSecretsManager(latency=LATENCY * i, seed=i)
+        aws.set_client(PROFILE, region, result[region], scaled_quotas())
+    return result
+
+
+def index_of(fake: FakeSecretsManager, filename: str) -> dict:
+    """
+    Retorna el índice de un archivo registrado en un reemplazo.
+    """
+    return index.parse(fake.secrets["/test/" + filename + ".index"]["value"])
+
+
+def retrieve(names: list[str], region: str) -> dict:
+    """
+    Obtiene secretos de una región, ver opt_download.failover.
+    """
+    return aws.retrieve_secrets(names, PROFILE, region)
+
+
+def test_upload_fans_out_to_all_regions(folder, fakes):
+    """
+    La subida registra el índice y las partes de cada archivo en todas las regiones.
+    """
+    files = {"a.txt": text_content(100 * 1024, 1), "b.txt": b"b\n"}
+    write_files(folder, files)
+    opt_upload.run(folder, PROFILE, REGIONS, 4)
+    names = set(fakes[REGIONS[0]].secrets.keys())
+    for filename in files:
+        assert index_of(fakes[REGIONS[0]], filename)["hash"] == utils.hash_file(os.path.join(folder, filename))
+    for fake in fakes.values():
+        assert set(fake.secrets.keys()) == names
+        for filename in files:
+            assert index_of(fake, filename)["hash"] == index_of(fakes[REGIONS[0]], filename)["hash"]
+
+
+@pytest.mark.parametrize("regions, chosen", [(REGIONS, "region-1"), (REGIONS[:2], "region-0")])
+def test_failover_chooses_majority_then_fastest(folder, fakes, capsys, regions, chosen):
+    """
+    Si el índice de la región más rápida no coincide con el resto, se utiliza el índice de la mayoría. Ante un empate
+    se utiliza el de la región más rápida.
+    """
+    write_files(folder, {"a.txt": b"v1\n"})
+    opt_upload.run(folder, PROFILE, REGIONS, 4)
+    write_files(folder, {"a.txt": b"v2\n"})
+    opt_upload.run(folder, PROFILE, REGIONS[0], 4)
+    capsys.readouterr()
+
+    task = opt_download.DownloadTask(utils.DescriptorFileEntry("a.txt", "/test/a.txt"), os.path.join(folder, "a.txt"))
+    fetch, sources = opt_download.failover([task], regions, retrieve)
+    assert sources == {"/test/a.txt": chosen}
+    value, err = fetch([index.index_name("/test/a.txt")])["/test/a.txt.index"]
+    assert err == None and index.parse(value)["hash"] == index_of(fakes[chosen], "a.txt")["hash"]
+    assert "Advertencia: índice inconsistente" in capsys.readouterr().out
+
+
+def test_download_fails_over_missing_parts(folder, fakes, capsys):
+    """
+    Si la región más rápida no tiene las partes de un archivo, se obtienen de la siguiente región consistente.
+    """
+    content = text_content(100 * 1024, 1)
+    write_files(folder, {"a.txt": content})
+    opt_upload.run(folder, PROFILE, REGIONS, 4)
+    fastest = fakes[REGIONS[0]]
+    for name in [name for name in fastest.secrets.keys() if name.endswith(".index") is False]:
+        del fastest.secrets[name]
+    os.remove(os.path.join(folder, "a.txt"))
+    for fake in fakes.values():
+        fake.calls.clear()
+    capsys.readouterr()
+
+    opt_download.run(folder, PROFILE, REGIONS, 4)
+    output = capsys.readouterr().out
+    assert read_file(folder, "a.txt") == content
+    assert "reintentando" in output
+    assert "Resumen: 1 transferidos, 0 omitidos, 0 fallidos." in output
+    assert fastest.calls.get("BatchGetSecretValue", 0) > 1
+    assert fakes[REGIONS[1]].calls.get("BatchGetSecretValue", 0) > 1
+    assert fakes[REGIONS[2]].calls.get("BatchGetSecretValue", 0) == 1
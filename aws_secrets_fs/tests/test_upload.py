@@ -0,0 +1,80 @@
+import hashlib
+import os
+import threading
+from aws_secrets_fs import index, opt_upload
+from .helpers import PROFILE, record_writes, text_content, write_files
+
+
+# Tamaño de cada archivo, en bytes. Cada archivo se divide en varias partes.
+SIZE = 160 * 1024
+
+
+def test_index_written_after_all_parts(folder, fake):
+    """
+    El índice de cada archivo se registra una vez subidas todas sus partes.
+    """
+    files = {"a.txt": text_content(SIZE, 1), "b.txt": text_content(SIZE, 2)}
+    write_files(folder, files)
+    writes = record_writes(fake)
+    opt_upload.run(folder, PROFILE, "", 4)
+    for filename in files:
+        secretname = "/test/" + filename
+        names = [name for name in writes if name == index.index_name(secretname) or index.is_part(secretname, name)]
+        assert len(names) > 2
+        assert names[-1] == index.index_name(secretname)
+        assert names.count(index.index_name(secretname)) == 1
+
+
+def test_index_unchanged_when_a_part_fails(folder, fake, capsys):
+    """
+    Si falla la subida de una parte, el índice anterior del archivo no se modifica, y el resto de los archivos se
+    suben igualmente.
+    """
+    write_files(folder, {"a.txt": text_content(SIZE, 1), "b.txt": b"b1\n"})
+    opt_upload.run(folder, PROFILE, "", 4)
+    previous = dict(fake.secrets["/test/a.txt.index"])
+
+    write_files(folder, {"a.txt": text_content(SIZE, 2), "b.txt": b"b2\n"})
+    failed = list()
+    lock = threading.Lock()
+
+    def fail(name: str) -> bool:
+        # Rechazar solo la primera parte nueva de a.txt.
+        with lock:
+            if len(failed) == 0 and index.is_part("/test/a.txt", name):
+                failed.append(name)
+                return True
+            return False
+
+    writes = record_writes(fake, fail)
+    capsys.readouterr()
+    opt_upload.run(folder, PROFILE, "", 4)
+    assert len(failed) == 1
+    assert fake.secrets["/test/a.txt.index"] == previous
+    assert "/test/a.txt.index" not in writes
+    assert index.parse(fake.secrets["/test/b.txt.index"]["value"])["hash"] == hashlib.md5(b"b2\n").hexdigest()
+    assert "Resumen: 1 transferidos, 0 omitidos, 1 fallidos." in capsys.readouterr().out
+
+
+def test_unchanged_upload_skips_writes(folder, fake, capsys):
+    """
+    Sin manifiesto, los archivos cuyo hash coincide con el del índice remoto se omiten sin registrar secretos. Con
+    `force` se vuelven a subir el índice y todas las partes.
+    """
+    files = {"a.txt": text_content(SIZE, 1), "b.txt": b"b\n"}
+    write_files(folder, files)
+    opt_upload.run(folder, PROFILE, "", 4)
+    parts = sum(len(index.parse(fake.secrets["/test/" + filename + ".index"]["value"])["chunks"]) for filename in files)
+    os.remove(os.path.join(folder, "test.aws_secrets.lock"))
+    capsys.readouterr()
+
+    fake.calls.clear()
+    opt_upload.run(folder, PROFILE, "", 4)
+    assert fake.calls.get("CreateSecret", 0) + fake.calls.get("UpdateSecret", 0) == 0
+    assert "Resumen: 0 transferidos, 2 omitidos, 0 fallidos." in capsys.readouterr().out
+
+    fake.calls.clear()
+    opt_upload.run(folder, PROFILE, "", 4, force=True)
+    assert fake.calls.get("CreateSecret", 0) == 0
+    assert fake.calls["UpdateSecret"] == parts + len(files)
+    assert "Resumen: 2 transferidos, 0 omitidos, 0 fallidos." in capsys.readouterr().out
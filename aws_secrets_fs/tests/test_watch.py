@@ -0,0 +1,141 @@
+import hashlib
+import os
+import queue
+import signal
+import threading
+import time
+from aws_secrets_fs import codec, index, opt_upload, opt_watch, store
+from .helpers import PROFILE, write_files
+
+
+# Intervalo de comprobación de cambios y tiempo sin cambios a esperar antes de subir un archivo, en segundos.
+INTERVAL = 0.05
+DEBOUNCE = 0.3
+
+# Tiempo máximo de espera de cada prueba, en segundos.
+TIMEOUT = 10
+
+
+def record_syncs(monkeypatch, delay: float = 0.0) -> tuple[list[list[str]], threading.Event]:
+    """
+    Registra los archivos subidos, sin contar los omitidos por el manifiesto, en cada llamada a opt_upload.sync.
+    Retorna los lotes registrados y un evento que se activa tras cada lote.
+    """
+    batches = list()
+    synced = threading.Event()
+    sync = opt_upload.sync
+
+    def recorded(tasks, *args, **kwargs):
+        time.sleep(delay)
+        plans = sync(tasks, *args, **kwargs)
+        batches.append(sorted(os.path.basename(task.targetfile) for task in tasks if task.lock_skipped is False))
+        synced.set()
+        return plans
+
+    monkeypatch.setattr(opt_upload, "sync", recorded)
+    return batches, synced
+
+
+def watch(folder: str, monkeypatch, during) -> None:
+    """
+    Observa la carpeta indicada por comprobación periódica mientras se ejecuta `during` en otro hilo, y luego finaliza
+    como ante SIGTERM.
+    """
+    monkeypatch.setattr(opt_watch, "create_watcher", lambda paths, interval: opt_watch.PollingWatcher(paths, interval))
+    handlers = {signum: signal.getsignal(signum) for signum in (signal.SIGTERM, signal.SIGINT)}
+
+    def control():
+        try:
+            during()
+        finally:
+            os.kill(os.getpid(), signal.SIGTERM)
+
+    thread = threading.Thread(target=control)
+    thread.start()
+    try:
+        opt_watch.run(folder, PROFILE, "", 4, interval=INTERVAL, debounce=DEBOUNCE)
+    finally:
+        thread.join()
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+
+def remote_hash(fake, filename: str) -> str:
+    """
+    Retorna el hash registrado en el índice remoto de un archivo.
+    """
+    return index.parse(fake.secrets["/test/" + filename + ".index"]["value"])["hash"]
+
+
+def test_burst_of_writes_uploads_once(folder, fake, monkeypatch):
+    """
+    Al iniciar se suben los archivos sin sincronizar, y una ráfaga de escrituras sobre un archivo, más rápida que
+    `debounce`, resulta en una única subida con el contenido final.
+    """
+    write_files(folder, {"a.txt": b"a\n", "b.txt": b"b\n"})
+    batches, synced = record_syncs(monkeypatch)
+    content = b"a\n"
+
+    def burst():
+        nonlocal content
+        assert synced.wait(TIMEOUT)
+        for i in range(5):
+            content += "burst {0}\n".format(i).encode()
+            with open(os.path.join(folder, "a.txt"), "wb") as file:
+                file.write(content)
+            time.sleep(DEBOUNCE / 5)
+        deadline = time.monotonic() + TIMEOUT
+        while len(batches) < 2 and time.monotonic() < deadline:
+            time.sleep(INTERVAL)
+        time.sleep(2 * DEBOUNCE)
+
+    watch(folder, monkeypatch, burst)
+    assert batches == [["a.txt", "b.txt"], ["a.txt"]]
+    assert remote_hash(fake, "a.txt") == hashlib.md5(content).hexdigest()
+
+
+def test_bounded_queue_back_pressure(folder, fake, monkeypatch, capsys):
+    """
+    Con la cola llena, los archivos modificados esperan a que se libere lugar: cada lote incluye a lo sumo los archivos
+    que entran en la cola, y todos los archivos se suben.
+    """
+    files = {"file{0}.txt".format(i): "content {0}\n".format(i).encode() for i in range(5)}
+    write_files(folder, files)
+    monkeypatch.setattr(opt_watch, "QUEUE_SIZE", 1)
+    batches, _ = record_syncs(monkeypatch, delay=0.2)
+
+    def wait_uploads():
+        deadline = time.monotonic() + TIMEOUT
+        while sum(len(batch) for batch in batches) < len(files) and time.monotonic() < deadline:
+            time.sleep(INTERVAL)
+
+    watch(folder, monkeypatch, wait_uploads)
+    assert sorted(filename for batch in batches for filename in batch) == sorted(files)
+    assert len(batches) >= 3
+    assert all(len(batch) <= 2 for batch in batches)
+    assert "no se subieron" not in capsys.readouterr().out
+    for filename, content in files.items():
+        assert remote_hash(fake, filename) == hashlib.md5(content).hexdigest()
+
+
+def test_packed_file_uploads_whole_pack(folder, fake, monkeypatch):
+    """
+    Un archivo agrupado con @pack se sube junto a todos los archivos de su secreto agrupado.
+    """
+    files = {"a.txt": b"a\n", "b.txt": b"b\n", "c.txt": b"c\n"}
+    write_files(folder, files)
+    with open(os.path.join(folder, "test.aws_secrets"), "a", encoding="utf-8") as file:
+        file.write("@pack => /test/pack\n")
+    batches, _ = record_syncs(monkeypatch)
+    targets = dict()
+    for descriptor in store.descriptors(folder):
+        for entry in descriptor.entries:
+            targets.setdefault(os.path.normpath(descriptor.targetfile(entry)), list()).append((descriptor.lock, entry))
+
+    work = queue.Queue()
+    work.put(os.path.normpath(os.path.join(folder, "b.txt")))
+    work.put(None)
+    opt_watch.upload_worker(work, targets, PROFILE, [""], 4, codec.NONE, index.MODE_STRING)
+    assert batches == [sorted(files)]
+    assert "/test/pack.index" in fake.secrets
+    assert "/test/b.txt.index" not in fake.secrets